@@ -1,17 +1,21 @@
+import os
 import streamlit as st
 import pandas as pd
 import time
 import logging
 import datetime
-import jpholiday
-import re
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.common.keys import Keys
-from bs4 import BeautifulSoup
+from src.waits import WAITS
+from src.http_backend import fetch_availability_http
+from src.deep_scan import fetch_availability_deep_scan, iter_availability_deep_scan
+from src.store import AvailabilityStore, slot_start_key
+from src.filter_index import FilterIndex
+from src.swr_cache import SWRCache
+from src.jp_calendar import enrich_dates
+from src.slots import SlotTable
+from src.components import PAGE_SIZE, render_card_grid, render_paginated_results, render_timing_summary
+from src.spans import PHASES, SPANS
+from src.catalog import Catalog
+from src.coordinator import Coordinator
 
 # ログ設定
 logging.basicConfig(level=logging.INFO)
@@ -47,529 +51,154 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # --- 設定定数 ---
-# Direct Facility Search URL (Video Flow)
-TARGET_URL = "https://fujisawacity.service-now.com/facilities_reservation?id=facility_search&tab=1"
 MAX_RETRIES = 3
 
-# 対象施設リスト（検索フィルタ用 - 内部処理では使わないがUIに残す）
-FACILITIES = ["藤沢", "鵠沼", "村岡", "明治", "御所見", "遠藤", "長後", "辻堂", "善行", "湘南大庭", "六会", "湘南台", "片瀬"]
+# 取得方式 (サイドバーで選択)。HTTP はブラウザを起動せずポータルの JSON API を直接読む
+BACKENDS = {
+    "ブラウザ (Selenium)": "selenium",
+    "HTTP (ブラウザなし)": "http",
+    "分散 (複数ワーカー)": "sharded",
+}
+DEFAULT_BACKEND = os.getenv("SCRAPER_BACKEND", "selenium")
 
-# --- Scraper Logic (Deep Scan with Navigation) ---
-def setup_driver():
-    options = Options()
-    options.add_argument("--headless")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    options.add_argument("--disable-gpu")
-    options.add_argument("--window-size=1920,1080")
-    options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
+# get_data の結果キャッシュ (同じ期間の再取得は TTL 内ならキャッシュ、過ぎたら古い結果を返しつつ裏で更新)
+DATA_CACHE_TTL = int(os.getenv("DATA_CACHE_TTL", "600"))
+DATA_CACHE_MAX_MB = int(os.getenv("DATA_CACHE_MAX_MB", "64"))
 
-    try:
-        driver = webdriver.Chrome(options=options)
-        return driver
-    except Exception as e:
-        logger.error(f"Chrome Driver起動エラー: {e}")
-        raise e
+# 対象施設リスト（検索フィルタ用 - 内部処理では使わないがUIに残す）
+FACILITIES = ["藤沢", "鵠沼", "村岡", "明治", "御所見", "遠藤", "長後", "辻堂", "善行", "湘南大庭", "六会", "湘南台", "片瀬"]
 
-def switch_to_target_frame(driver, target_text="市民センター", _status_callback=None):
+# --- Scraper Logic (Deep Scan with Navigation: src.deep_scan) ---
+@st.cache_resource
+def get_coordinator():
+    """分散取得 (backend="sharded") のコーディネーター。作業単位のキュー (SQLite) を全セッションで共有する"""
+    return Coordinator()
+
+@st.cache_resource
+def get_store():
+    """全セッションで共有するスキャン結果の SQLite ストア"""
+    return AvailabilityStore()
+
+@st.cache_resource
+def get_data_cache():
+    """(keyword, start_date, end_date, backend) ごとの取得結果キャッシュ。全セッションで共有する"""
+    return SWRCache(ttl=DATA_CACHE_TTL, max_bytes=DATA_CACHE_MAX_MB * 1024 * 1024)
+
+@st.cache_resource(max_entries=2)
+def get_filter_index(scan_id):
+    """最新スキャン (scan_id) の全行を読み込んだ絞り込み用の索引。新しいスキャンが保存されると作り直す"""
+    return FilterIndex(get_store().query())
+
+def format_age(seconds):
+    if seconds < 60: return f"{int(seconds)}秒前"
+    if seconds < 3600: return f"{int(seconds // 60)}分前"
+    return f"{int(seconds // 3600)}時間{int(seconds % 3600 // 60)}分前"
+
+def iter_scrape_with_retry(start_date, end_date, _status_callback, _progress_bar, _debug_placeholder, backend="selenium", incremental=True):
     """
-    Switch to the iframe containing the target text.
-    Returns True if found (or already in correct frame), False otherwise.
+    Streaming counterpart of attempt_scrape_with_retry: yields SlotTable batches.
+    When an attempt fails midway, the next attempt starts over but only rows
+    that have not been yielded yet are passed on.
+    Raises after the last failed attempt (an empty result must not replace stored rows).
     """
+    seen = SlotTable()
+    scan = SPANS.begin_scan(backend)
+    ok = False
+    last_error = None
     try:
-        # 1. Check current content first
-        if target_text in driver.page_source:
-             return True
-        
-        # 2. Iterate iframes
-        driver.switch_to.default_content()
-        frames = driver.find_elements(By.TAG_NAME, "iframe")
-        
-        if not frames:
-             return False
-
-        for i in range(len(frames)):
+        for attempt in range(MAX_RETRIES):
+            tracer = SPANS.tracer(scan, attempt=attempt + 1)
             try:
-                driver.switch_to.default_content()
-                current_frames = driver.find_elements(By.TAG_NAME, "iframe")
-                if i >= len(current_frames): break
+                if _status_callback: 
+                    msg = f"データ取得 試行 {attempt + 1}回目..."
+                    _status_callback(msg)
                 
-                driver.switch_to.frame(current_frames[i])
-                time.sleep(0.5) 
+                if backend == "http":
+                    with tracer.span("http_fetch"):
+                        batches = [SlotTable.from_records(fetch_availability_http(start_date, end_date, _status_callback, _progress_bar).to_dict("records"))]
+                elif backend == "sharded":
+                    batches = get_coordinator().iter_scan(start_date, end_date, _status_callback, _progress_bar, incremental=incremental)
+                else:
+                    batches = iter_availability_deep_scan(start_date, end_date, _status_callback, _progress_bar, _debug_placeholder, attempt_idx=attempt, incremental=incremental, tracer=tracer)
+                
+                for batch in batches:
+                    yield seen.merge(batch)
+                ok = True
+                return
                 
-                if target_text in driver.page_source:
-                    return True
             except Exception as e:
-                continue
-        
-        driver.switch_to.default_content()
-        return False
-        
-    except Exception as e:
-        return False
-
-def attempt_scrape_with_retry(start_date, end_date, _status_callback, _progress_bar, _debug_placeholder):
-    for attempt in range(MAX_RETRIES):
-        try:
-            if _status_callback: 
-                msg = f"データ取得 試行 {attempt + 1}回目..."
-                _status_callback(msg)
-            
-            df = fetch_availability_deep_scan(start_date, end_date, _status_callback, _progress_bar, _debug_placeholder, attempt_idx=attempt)
-            if not df.empty:
-                return df
-            
-            return df 
-            
-        except Exception as e:
-            logger.error(f"Attempt {attempt+1} failed: {e}")
-            if attempt < MAX_RETRIES - 1:
-                time.sleep(3)
-    return pd.DataFrame()
+                logger.error(f"Attempt {attempt+1} failed: {e}")
+                last_error = e
+                if attempt < MAX_RETRIES - 1:
+                    WAITS.pause(3, "retry_backoff")
+        raise RuntimeError(f"{MAX_RETRIES}回試行しましたが取得できませんでした: {last_error}") from last_error
+    finally:
+        SPANS.end_scan(scan, ok)
 
-def scrape_current_schedule_table(driver, results, facility_name, room_name):
-    """
-    Scrape the current schedule table (usually at the bottom) for availability symbols.
-    """
-    soup = BeautifulSoup(driver.page_source, "html.parser")
-    tables = soup.find_all("table")
-    
-    for tbl in tables:
-        txt = tbl.get_text()
-        has_symbols = "○" in txt or "×" in txt or "△" in txt
-        has_imgs = tbl.find('img', alt=re.compile(r'[○×△]')) or tbl.find('img', src=re.compile(r'(circle|cross|triangle)'))
-        
-        if not (has_symbols or has_imgs):
-            continue
-            
-        rows = tbl.find_all("tr")
-        if not rows: continue
-        
-        headers = []
-        try:
-            for th in rows[0].find_all(["th", "td"]):
-                headers.append(th.get_text(strip=True))
-        except: continue
-        
-        for tr in rows[1:]:
-            cols = tr.find_all(["th", "td"])
-            if not cols: continue
-            
-            date_val = cols[0].get_text(strip=True)
-            
-            for i, td in enumerate(cols[1:]):
-                stat_text = td.get_text(strip=True)
-                img = td.find('img')
-                
-                status = "×" # Default closed
-                
-                if "○" in stat_text or "空" in stat_text: status = "○"
-                elif "△" in stat_text: status = "△"
-                elif "×" in stat_text or "満" in stat_text: status = "×"
-                
-                if img:
-                    alt = img.get('alt', '')
-                    src = img.get('src', '')
-                    if "○" in alt or "circle" in src: status = "○"
-                    elif "△" in alt: status = "△"
-                    elif "×" in alt or "cross" in src: status = "×"
+def attempt_scrape_with_retry(start_date, end_date, _status_callback, _progress_bar, _debug_placeholder, backend="selenium", incremental=True):
+    scan = SPANS.begin_scan(backend)
+    ok = False
+    last_error = None
+    try:
+        for attempt in range(MAX_RETRIES):
+            tracer = SPANS.tracer(scan, attempt=attempt + 1)
+            try:
+                if _status_callback: 
+                    msg = f"データ取得 試行 {attempt + 1}回目..."
+                    _status_callback(msg)
                 
-                t_slot = headers[i+1] if (i+1) < len(headers) else ""
+                if backend == "http":
+                    with tracer.span("http_fetch"):
+                        df = fetch_availability_http(start_date, end_date, _status_callback, _progress_bar)
+                elif backend == "sharded":
+                    df = get_coordinator().fetch(start_date, end_date, _status_callback, _progress_bar, incremental=incremental)
+                else:
+                    df = fetch_availability_deep_scan(start_date, end_date, _status_callback, _progress_bar, _debug_placeholder, attempt_idx=attempt, incremental=incremental, tracer=tracer)
+                ok = True
+                return df 
                 
-                if status in ["○", "△"]:
-                    results.append({
-                        "日付": date_val,
-                        "施設名": facility_name,
-                        "室場名": room_name,
-                        "時間": t_slot,
-                        "状況": status
-                    })
-        return True
-    return False
-
-def process_month_calendar_clicks(driver, results, facility_name):
-    """
-    Find the MONTHLY calendar (small numbers), click SUNDAY cells (First Column),
-    and scrape the resulting schedule table.
-    """
-    wait = WebDriverWait(driver, 5)
-    
-    try:
-        tables = driver.find_elements(By.TAG_NAME, "table")
-        calendar_table = None
-        
-        for tbl in tables:
-            txt = tbl.text
-            if "日" in txt and "土" in txt:
-                if "9:" in txt or "09:" in txt or "11:" in txt:
-                    continue
-                calendar_table = tbl
-                break
-        
-        if not calendar_table:
-            return
-        
-        if calendar_table:
-            # Get Sunday Cells (First Column)
-            rows = calendar_table.find_elements(By.TAG_NAME, "tr")
-            
-            headers = calendar_table.find_elements(By.TAG_NAME, "th")
-            sunday_idx = 0
-            for i, h in enumerate(headers):
-                if "日" in h.text: 
-                    sunday_idx = i
-                    break
-            
-            row_count = len(rows)
-            
-            for r_idx in range(1, row_count): # Skip header
-                try:
-                    tables = driver.find_elements(By.TAG_NAME, "table")
-                    cal_tbl = None
-                    for tbl in tables:
-                        txt = tbl.text
-                        if "日" in txt and "土" in txt and not ("9:" in txt or "09:" in txt):
-                            cal_tbl = tbl
-                            break
-                    if not cal_tbl: break
-                    
-                    row = cal_tbl.find_elements(By.TAG_NAME, "tr")[r_idx]
-                    cols = row.find_elements(By.TAG_NAME, "td")
-                    
-                    if len(cols) > sunday_idx:
-                        cell = cols[sunday_idx]
-                        
-                        if not re.search(r'\d+', cell.text): continue
-                        
-                        driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", cell)
-                        time.sleep(0.2)
-                        
-                        try:
-                            link = cell.find_element(By.TAG_NAME, "a")
-                            driver.execute_script("arguments[0].click();", link)
-                        except:
-                            driver.execute_script("arguments[0].click();", cell)
-                            
-                        time.sleep(1.5) 
-                        scrape_current_schedule_table(driver, results, facility_name, "体育室")
-                        
-                except Exception as e:
-                    continue
-
-    except Exception as e:
-        logger.error(f"Calendar interaction error: {e}")
-
-def fetch_availability_deep_scan(start_date=None, end_date=None, _status_callback=None, _progress_bar=None, _debug_placeholder=None, attempt_idx=0):
-    driver = setup_driver()
-    wait = WebDriverWait(driver, 30) 
-    results = []
-
-    try:
-        # 1. Access New URL & Initial Setup
-        if _status_callback: _status_callback("📡 予約システムにアクセス中...")
-        driver.get(TARGET_URL)
-        time.sleep(5) 
-
-        # Initial Search Logic
-        def perform_initial_search():
-             found = switch_to_target_frame(driver, "市民センター", _status_callback)
-             try:
-                 driver.execute_script("document.querySelectorAll('header, .alert, .announcement, #sc_header_top, .navbar, .cookie-banner').forEach(e => e.remove());")
-             except: pass
-
-             js_checkbox_script = """
-                 var labels = document.querySelectorAll('label, span');
-                 var targetLabel = null;
-                 for (var i = 0; i < labels.length; i++) {
-                     if (labels[i].innerText.includes('市民センター')) {
-                         targetLabel = labels[i];
-                         break;
-                     }
-                 }
-                 if (targetLabel) {
-                     var inp = targetLabel.querySelector('input[type="checkbox"]');
-                     if (!inp) {
-                         var prev = targetLabel.previousElementSibling;
-                         if (prev && prev.type === 'checkbox') inp = prev;
-                     }
-                     if (inp) {
-                         if (!inp.checked) {
-                             inp.click(); 
-                             if (!inp.checked) { inp.checked = true; inp.dispatchEvent(new Event('change', {bubbles: true})); }
-                         }
-                         return true;
-                     }
-                 }
-                 return false;
-             """
-             driver.execute_script(js_checkbox_script)
-             time.sleep(0.5)
-
-             if start_date:
-                 fd = start_date.strftime("%Y-%m-%d")
-                 driver.execute_script(f"""
-                     var dateInp = document.querySelector("input[type='date']");
-                     if (dateInp) {{
-                         dateInp.value = '{fd}';
-                         dateInp.dispatchEvent(new Event('change', {{bubbles: true}}));
-                     }}
-                 """)
-                 time.sleep(0.5)
-
-             driver.execute_script("""
-                 var btns = document.querySelectorAll('button, input[type="button"], a.btn');
-                 for (var i = 0; i < btns.length; i++) {
-                     if (btns[i].innerText.includes('検索') || btns[i].value === '検索') {
-                         btns[i].click();
-                         return true;
-                     }
-                 }
-             """)
-             time.sleep(3)
-
-        perform_initial_search()
-
-        try:
-            if _status_callback: _status_callback("⏳ 検索結果リスト待機中...")
-            wait.until(EC.presence_of_element_located((By.XPATH, "//*[contains(text(), '室場') or contains(text(), '一覧') or contains(text(), '市民センター')]")))
-        except:
-            if _status_callback: _status_callback("⚠️ コンテキストロストの可能性。結果フレームを再探索します...")
-            switch_to_target_frame(driver, "室場一覧", _status_callback)
-
-        time.sleep(2) 
-        if _debug_placeholder:
-            _debug_placeholder.image(driver.get_screenshot_as_png(), caption="検索結果表示", use_column_width=True)
-
-        # ------------------------------------------------------------------
-        # MAIN LOOP: DYNAMIC INDEX-BASED ITERATION (FILTER GYM)
-        # ------------------------------------------------------------------
-        
-        # Count total potential facilities by looking for "Room List" toggles or headers
-        # Strategy: Find all "Room List" toggles. Each corresponds to a facility.
-        toggles = driver.find_elements(By.XPATH, "//*[contains(text(), '室場一覧') or contains(text(), 'Room List')]")
-        total_count = len(toggles)
-        
-        if total_count == 0:
-            logger.warning("No facilities found.")
-            return pd.DataFrame()
-
-        if _status_callback: _status_callback(f"📍 {total_count} 件の施設候補が見つかりました。順次解析します。")
-
-        for i in range(total_count):
-             if _progress_bar: _progress_bar.progress(i / max(total_count, 1))
-             
-             # 0. Ensure Context
-             found_context = switch_to_target_frame(driver, "市民センター", None)
-             
-             # Re-find ALL toggles to get the i-th one safely
-             try:
-                 # Wait for list to be stable
-                 wait.until(EC.presence_of_element_located((By.XPATH, "//*[contains(text(), '室場一覧') or contains(text(), 'Room List')]")))
-                 current_toggles = driver.find_elements(By.XPATH, "//*[contains(text(), '室場一覧') or contains(text(), 'Room List')]")
-                 
-                 if i >= len(current_toggles):
-                     break
-                 
-                 toggle = current_toggles[i]
-                 
-                 # Get Facility Name relative to this toggle (usually in previous sibling header or ancestor)
-                 # Try to find header above
-                 try:
-                     # Attempt to find closest h4 or header-like element
-                     header = toggle.find_element(By.XPATH, "./preceding::*[self::h3 or self::h4 or contains(@class, 'header')][1]")
-                     text_content = header.text.strip().replace('\n', ' ')
-                     # Just take the name part if possible
-                     fac_name = text_content.split(' ')[0] # Approx
-                     if len(fac_name) < 2: fac_name = text_content[:5]
-                 except:
-                     fac_name = f"施設_{i+1}"
-
-                 if _status_callback: _status_callback(f"📍 チェック中 ({i+1}/{total_count}): {fac_name}")
-                 
-                 # 1. EXPAND ACCORDION
-                 driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", toggle)
-                 time.sleep(0.5)
-                 driver.execute_script("arguments[0].click();", toggle)
-                 time.sleep(1.5)
-
-                 # 2. CHECK FOR GYM (FILTER)
-                 # Look for "Gymnasium" row relative to this toggle
-                 # We need to limit the search scope. The gym row should be following the toggle
-                 # but NOT following the NEXT toggle.
-                 # XPath: ./following::*[contains(text(), '体育室')][1] ... but verify it's close.
-                 
-                 # Better: The toggle usually expands a div immediately following it.
-                 # Let's search inside the expanded container if possible.
-                 # Or just search following sibling until next header.
-                 
-                 try:
-                     gym_row = toggle.find_element(By.XPATH, "./following::*[contains(text(), '体育室')][1]")
-                     
-                     # Check visibility. If not visible, expansion failed.
-                     if not gym_row.is_displayed():
-                         # Retry expansion
-                         driver.execute_script("arguments[0].click();", toggle)
-                         time.sleep(1.5)
-                     
-                     if not gym_row.is_displayed():
-                         # Maybe this facility has no gym or layout is weird.
-                         logger.warning(f"  -> {fac_name}: 体育室が見つからないか表示されません。")
-                         continue
-                         
-                     # Found Gym!
-                     if _status_callback: _status_callback(f"  ✅ 体育室あり。詳細を確認します...")
-                     
-                     btn = gym_row.find_element(By.XPATH, "./following::*[contains(text(), '確認') or contains(text(), '予約')][1]")
-                     
-                     # 3. CLICK & SCRAPE
-                     if btn:
-                         href = btn.get_attribute('href')
-                         if href and "javascript" not in href:
-                             driver.get(href)
-                         else:
-                             driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", btn)
-                             time.sleep(0.5)
-                             driver.execute_script("arguments[0].click();", btn)
-                         
-                         time.sleep(3)
-                         
-                         # Check Detail Page
-                         switch_to_target_frame(driver, "予約状況", None)
-                         
-                         # Date-Click Loop
-                         if start_date:
-                            try:
-                                fd = start_date.strftime("%Y-%m-%d")
-                                driver.execute_script(f"var i=document.querySelector('input[type=date]'); if(i){{i.value='{fd}'; i.dispatchEvent(new Event('change'));}}")
-                                time.sleep(1)
-                            except: pass
-
-                         # Scrape
-                         scrape_current_schedule_table(driver, results, fac_name, "体育室")
-                         process_month_calendar_clicks(driver, results, fac_name)
-                         
-                         # 4. GO BACK
-                         if _status_callback: _status_callback(f"  🔙 リストに戻ります...")
-                         driver.back()
-                         time.sleep(5) 
-                     
-                 except Exception as e:
-                     # Gym row not found or error finding button
-                     # logger.info(f"  -> {fac_name}: 体育室なし (or error: {e})")
-                     continue
-
-             except Exception as e:
-                 logger.error(f"Error processing index {i}: {e}")
-                 try: driver.back() 
-                 except: pass
-                 time.sleep(2)
-                 continue
-
-    except Exception as e:
-        logger.error(f"Scrape Error: {e}")
-        if _debug_placeholder:
-             try: _debug_placeholder.image(driver.get_screenshot_as_png(), caption=f"Error: {str(e)}", use_column_width=True)
-             except: pass
-        raise e
+            except Exception as e:
+                logger.error(f"Attempt {attempt+1} failed: {e}")
+                last_error = e
+                if attempt < MAX_RETRIES - 1:
+                    WAITS.pause(3, "retry_backoff")
+        raise RuntimeError(f"{MAX_RETRIES}回試行しましたが取得できませんでした: {last_error}") from last_error
     finally:
-        driver.quit()
-
-    if not results:
-        return pd.DataFrame(columns=['日付', '施設名', '室場名', '時間', '状況', '曜日', 'dt'])
-    
-    return pd.DataFrame(results)
+        SPANS.end_scan(scan, ok)
 
 
 # --- Data Logic ---
 TODAY = datetime.date.today()
-CURRENT_YEAR = TODAY.year
 
 def enrich_data(df):
-    if df.empty: return df
+    # 日付の解析と曜日・祝日の判定は src.jp_calendar の参照表との結合で一括して行う
+    return enrich_dates(df, TODAY)
 
-    def parse_date(d_str):
-        if not isinstance(d_str, str): return None
-        try:
-            clean = d_str.split('(')[0].strip()
-            clean = clean.replace('年', '/').replace('月', '/').replace('日', '').replace('-', '/').replace('.', '/')
-            parts = [p for p in clean.split('/') if p.strip()]
-            y, m, d = None, None, None
-            
-            if len(parts) == 3:
-                if len(parts[0]) == 4:
-                    y, m, d = int(parts[0]), int(parts[1]), int(parts[2])
-                elif len(parts[2]) == 4:
-                    y, m, d = int(parts[2]), int(parts[0]), int(parts[1])
-            elif len(parts) == 2:
-                m, d = int(parts[0]), int(parts[1])
-                y = CURRENT_YEAR
-                temp_dt = datetime.date(y, m, d)
-                if temp_dt < TODAY - datetime.timedelta(days=90):
-                    y += 1
-            if y and m and d:
-                try: return datetime.date(y, m, d)
-                except: return None
-        except: return None
-        return None
-
-    df['dt'] = df['日付'].apply(parse_date)
-
-    def get_day(row):
-        dt = row['dt']
-        d_str = str(row.get('日付', ''))
-        if dt:
-            if jpholiday.is_holiday(dt): return "祝"
-            return ["月","火","水","木","金","土","日"][dt.weekday()]
-        for w in ["月","火","水","木","金","土","日"]:
-            if f"({w})" in d_str or f"（{w}）" in d_str:
-                return w
-        return "不明"
-
-    df['曜日'] = df.apply(get_day, axis=1)
-    return df
-
-def get_data(keyword, start_date, end_date, _status, _progress, _debug_placeholder):
+def iter_data(keyword, start_date, end_date, _status, _progress, _debug_placeholder, backend="selenium", incremental=True):
+    """get_data の逐次版。施設ごとに enrich_data 済みの DataFrame を返す"""
+    for batch in iter_scrape_with_retry(start_date, end_date, _status, _progress, _debug_placeholder, backend=backend, incremental=incremental):
+        yield enrich_data(batch.to_frame())
+
+def get_data(keyword, start_date, end_date, _status, _progress, _debug_placeholder, backend="selenium", incremental=True):
     # Note: selected_facilities arg removed from fetch call
-    df = attempt_scrape_with_retry(start_date, end_date, _status, _progress, _debug_placeholder)
+    df = attempt_scrape_with_retry(start_date, end_date, _status, _progress, _debug_placeholder, backend=backend, incremental=incremental)
     return enrich_data(df)
 
-def render_schedule_card(row):
-    status = row['状況']
-    facility = row.get('施設名', '不明')
-    room = row.get('室場名', '')
-    date_str = row.get('日付', '')
-    time_slot = row.get('時間', '')
-    day_label = row.get('曜日', '不明')
-    
-    badge_color = "gray"
-    if day_label == "土": badge_color = "blue"
-    elif day_label == "日": badge_color = "red"
-    elif day_label == "祝": badge_color = "red"
-
-    if status == "○":
-        delta_color = "normal"
-        status_label = "空"
-    elif status == "△":
-        delta_color = "off"
-        status_label = "少"
-    else:
-        delta_color = "inverse"
-        status_label = "満"
-
-    with st.container(border=True):
-        col1, col2 = st.columns([1, 3])
-        with col1:
-            st.metric(label="状況", value=status, delta=status_label, delta_color=delta_color)
-        with col2:
-            st.markdown(f"**{date_str}** :{badge_color}[{day_label}]")
-            st.text(f"{facility} {room}")
-            st.caption(f"{time_slot}")
+def filter_slots(df, days=None, times=None):
+    """AvailabilityStore.query と同じ条件 (曜日・開始時刻) で、取得途中の DataFrame を絞り込む"""
+    if df.empty:
+        return df
+    mask = pd.Series(True, index=df.index)
+    if days:
+        mask &= df['曜日'].isin(days)
+    if times:
+        mask &= df['時間'].map(slot_start_key).isin(times)
+    return df[mask]
 
 def main():
     st.title("🏐 湘南Bright 施設予約状況")
     
-    if "data" not in st.session_state:
-        st.session_state.data = pd.DataFrame()
+    store = get_store()
     
     st.sidebar.header("🔍 検索条件")
     d_input = st.sidebar.date_input(
@@ -579,6 +208,12 @@ def main():
         max_value=TODAY + datetime.timedelta(days=180)
     )
     st.sidebar.info("対象: 検索結果内の全体育室")
+
+    backend_labels = list(BACKENDS)
+    default_idx = list(BACKENDS.values()).index(DEFAULT_BACKEND) if DEFAULT_BACKEND in BACKENDS.values() else 0
+    backend = BACKENDS[st.sidebar.radio("取得方式", backend_labels, index=default_idx)]
+    incremental = st.sidebar.checkbox("差分スキャン (前回から変化のない施設は再取得しない)", value=True)
+    force_refresh = st.sidebar.checkbox("キャッシュを使わずに取得する", value=False)
     
     # Facility Selection Removed from Logic (UI kept but muted or removed?)
     # User said "Delete hardcoded list".
@@ -614,58 +249,88 @@ def main():
         debug_area = st.expander("📸 処理状況 (Live View)", expanded=True)
         debug_placeholder = debug_area.empty()
         
+        def load():
+            # 施設ごとに届いた分から、最初の1ページ分のカードを差し替えながら表示する
+            live_table = st.empty()
+            live_cards = st.empty()
+            batches = []
+            matched_batches = []
+            found = 0
+            for batch in iter_data("バレーボール", start_d, end_d, status_box.write, p_bar, debug_placeholder, backend=backend, incremental=incremental):
+                if batch.empty:
+                    continue
+                batches.append(batch)
+                matched = filter_slots(batch, selected_days, selected_times)
+                if matched.empty:
+                    continue
+                found += len(matched)
+                if found - len(matched) < PAGE_SIZE:
+                    matched_batches.append(matched)
+                    render_card_grid(pd.concat(matched_batches).head(PAGE_SIZE), live_cards)
+                live_table.caption(f"取得中... これまでに {found}件の空き")
+            live_table.empty()
+            live_cards.empty()
+
+            # 全試行が失敗した場合は iter_data が例外を送出するので、ここには成功したときだけ来る
+            # (保存済みの行を空の結果で上書きせず、キャッシュにも入れない)
+            df = pd.concat(batches, ignore_index=True) if batches else enrich_data(pd.DataFrame())
+            store.write_scan(df, start_d, end_d)
+            return df
+
+        def load_in_background():
+            # 裏スレッドからは画面に書き込めないので進捗表示なしで取得する
+            df = get_data("バレーボール", start_d, end_d, None, None, None, backend=backend, incremental=incremental)
+            store.write_scan(df, start_d, end_d)
+            return df
+
+        if force_refresh:
+            # 施設カタログも捨てて、施設一覧から探し直す
+            Catalog().invalidate()
+
         try:
-            df = get_data("バレーボール", start_d, end_d, status_box.write, p_bar, debug_placeholder)
-            st.session_state.data = df
-            status_box.update(label="完了", state="complete", expanded=False)
+            result = get_data_cache().get(("バレーボール", start_d, end_d, backend), load, load_in_background, force=force_refresh)
+            if result.stale:
+                status_box.update(label=f"{format_age(result.age)}の結果を表示中 (裏で更新中)", state="complete", expanded=False)
+            elif result.age > 1:
+                status_box.update(label=f"{format_age(result.age)}に取得した結果を表示中", state="complete", expanded=False)
+            else:
+                status_box.update(label="完了", state="complete", expanded=False)
             
         except Exception as e:
             st.error(f"エラー: {e}")
 
-    # Display Logic
-    if not st.session_state.data.empty:
-        df = st.session_state.data.copy()
-        
+    # Display Logic (filters are bitmap ANDs on an index built once per stored scan)
+    last_scan = store.last_scan()
+    if last_scan:
+        scanned_at = datetime.datetime.fromtimestamp(last_scan["finished_at"])
+        st.caption(f"最終取得: {scanned_at:%m/%d %H:%M} ({format_age(time.time() - last_scan['finished_at'])}) "
+                   f"({last_scan['start_date']} 〜 {last_scan['end_date']})")
+        if isinstance(d_input, tuple) and len(d_input) == 2:
+            cached = get_data_cache().peek(("バレーボール",) + tuple(d_input) + (backend,))
+            if cached and cached.refreshing:
+                st.caption("🔄 この期間のデータを裏で更新中です。しばらくして再読み込みしてください。")
+
+    if last_scan and store.count() > 0:
         start_d, end_d = d_input if (isinstance(d_input, tuple) and len(d_input) == 2) else (TODAY, TODAY + datetime.timedelta(days=14))
         
-        mask = pd.Series(True, index=df.index)
-        
-        if 'dt' in df.columns:
-                date_mask = (df['dt'] >= start_d) & (df['dt'] <= end_d)
-                date_mask = date_mask.fillna(False)
-                mask &= date_mask
-
-        if selected_days:
-            day_mask = df['曜日'].isin(selected_days)
-            mask &= day_mask
-
-        if selected_times:
-            time_mask = pd.Series(False, index=df.index)
-            for t in selected_times:
-                hour_part = t.split(":")[0] 
-                time_mask |= df['時間'].astype(str).str.contains(hour_part)
-            mask &= time_mask
-        
-        final_df = df[mask]
+        index = get_filter_index(last_scan["id"])
+        final_df = index.query(start_d, end_d, days=selected_days, times=selected_times)
         
         if not final_df.empty:
             st.success(f"{len(final_df)}件の空きが見つかりました！")
-            try:
-                final_df = final_df.sort_values(by=['dt', '時間', '施設名'])
-            except: pass
 
-            with st.expander("全体の表を見る"):
-                st.table(final_df[['日付', '曜日', '施設名', '室場名', '時間', '状況']])
-            
             st.subheader("空き状況カード")
-            cols_layout = st.columns(2)
-            for idx, (_, row) in enumerate(final_df.iterrows()):
-                render_schedule_card(row)
-                
+            render_paginated_results(final_df, table_columns=['日付', '曜日', '施設名', '室場名', '時間', '状況'])
+
         else:
             st.warning("条件に合う空きは見つかりませんでした。")
             with st.expander("詳細デバッグ (フィルタ前データ)"):
-                    st.dataframe(df)
+                    st.dataframe(index.frame)
+
+    last_trace = SPANS.last_scan()
+    if last_trace:
+        with st.expander("⏱ 処理時間の内訳 (前回の取得)"):
+            render_timing_summary(last_trace, PHASES)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,114 @@
+"""
+日付の解析と曜日・祝日判定 (app.enrich_data) のベンチマーク。
+
+    python -m benchmarks.bench_enrich [--months 3] [--copies 1 10 50] [--repeat 3]
+
+src.mock_data.get_mock_schedule のデータを copies 倍に複製した DataFrame に対して、
+- legacy:     従来の行ごとの parse_date と jpholiday.is_holiday (apply)
+- vectorized: src.jp_calendar.enrich_dates (一括解析 + 参照表との結合)
+の1回あたりの時間を計測する。日付の表記はポータルに合わせて "10/18(土)" 形式と全角の "１０月１８日(土)" 形式も混ぜ、
+両者の結果が一致することも確かめる (全角数字は従来の int() では読めていたので、回帰の確認を兼ねる)。
+"""
+import time
+import argparse
+import datetime
+
+import jpholiday
+import pandas as pd
+
+from src.jp_calendar import enrich_dates, get_calendar
+from src.mock_data import get_mock_schedule
+
+TODAY = datetime.date.today()
+
+
+def legacy_enrich(df):
+    """変更前の app.enrich_data と同じ処理"""
+    def parse_date(d_str):
+        if not isinstance(d_str, str): return None
+        try:
+            clean = d_str.split('(')[0].strip()
+            clean = clean.replace('年', '/').replace('月', '/').replace('日', '').replace('-', '/').replace('.', '/')
+            parts = [p for p in clean.split('/') if p.strip()]
+            y, m, d = None, None, None
+            if len(parts) == 3:
+                if len(parts[0]) == 4:
+                    y, m, d = int(parts[0]), int(parts[1]), int(parts[2])
+                elif len(parts[2]) == 4:
+                    y, m, d = int(parts[2]), int(parts[0]), int(parts[1])
+            elif len(parts) == 2:
+                m, d = int(parts[0]), int(parts[1])
+                y = TODAY.year
+                if datetime.date(y, m, d) < TODAY - datetime.timedelta(days=90):
+                    y += 1
+            if y and m and d:
+                try: return datetime.date(y, m, d)
+                except: return None
+        except: return None
+        return None
+
+    df['dt'] = df['日付'].apply(parse_date)
+
+    def get_day(row):
+        dt = row['dt']
+        d_str = str(row.get('日付', ''))
+        if dt:
+            if jpholiday.is_holiday(dt): return "祝"
+            return ["月","火","水","木","金","土","日"][dt.weekday()]
+        for w in ["月","火","水","木","金","土","日"]:
+            if f"({w})" in d_str or f"（{w}）" in d_str:
+                return w
+        return "不明"
+
+    df['曜日'] = df.apply(get_day, axis=1)
+    return df
+
+
+def make_frame(months, copies):
+    base = get_mock_schedule(months).drop(columns=["weekday"])
+    # 半分はポータルの "10/18(土)" 形式にする
+    portal = base.copy()
+    dates = pd.to_datetime(portal["日付"])
+    portal["日付"] = (dates.dt.month.astype(str) + "/" + dates.dt.day.astype(str)
+                     + "(" + dates.dt.weekday.map(lambda w: "月火水木金土日"[w]) + ")")
+    # 全角の "１０月１８日(土)" 形式
+    wide = base.copy()
+    wide["日付"] = (dates.dt.month.astype(str) + "月" + dates.dt.day.astype(str) + "日"
+                   + "(" + dates.dt.weekday.map(lambda w: "月火水木金土日"[w]) + ")"
+                   ).str.translate(str.maketrans("0123456789", "０１２３４５６７８９"))
+    return pd.concat([base, portal, wide] * copies, ignore_index=True)
+
+
+def bench(func, df, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        frame = df.copy()
+        started = time.perf_counter()
+        func(frame)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--months", type=int, default=3)
+    parser.add_argument("--copies", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    get_calendar(TODAY)  # 参照表の作成は1日1回なので計測対象外
+    print(f"{'rows':>9} {'engine':<12} {'ms':>10} {'speedup':>8}")
+    for copies in args.copies:
+        df = make_frame(args.months, copies)
+        expected = legacy_enrich(df.copy())
+        actual = enrich_dates(df.copy(), TODAY)
+        assert list(expected["曜日"]) == list(actual["曜日"]) and list(expected["dt"]) == list(actual["dt"])
+
+        base = bench(legacy_enrich, df, args.repeat)
+        print(f"{len(df):>9} {'legacy':<12} {base:>10.1f} {1:>7.1f}x")
+        ms = bench(lambda frame: enrich_dates(frame, TODAY), df, args.repeat)
+        print(f"{len(df):>9} {'vectorized':<12} {ms:>10.1f} {base / ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+ブラウザでの巡回のベンチマーク (ローカルのフィクスチャサイトを使うのでネットワーク不要)。
+
+    python -m benchmarks.bench_scrapers [--facilities 13] [--latency-ms 0] [--profiles lean full] [--json result.json]
+
+benchmarks.fixture_site のサイトをローカルで配信し、PORTAL_BASE_URL をそこに向けて
+- deep_scan: src.deep_scan.fetch_availability_deep_scan (施設検索 → 室場一覧 → 体育室 → カレンダー)
+- scraper:   src.scraper.fetch_availability (キーワード検索 → 室場リンク → 週送り)
+を実行し、ページ/秒 (HTML + XHR の配信数)、1施設あたりの時間、メモリのピークと
+処理段階ごとの時間 (src.spans) の内訳を出力する。
+--profiles に並べたブラウザプロファイル (src.browser_profiles) ごとに同じ計測を行い、
+フォント・画像を読み込まない lean と全リソースを読み込む full などを比べられる。
+Chrome の起動は DriverPool のウォームアップとして事前に済ませ、計測対象外にする。
+キャッシュ (SCAN_CACHE_DIR) は一時ディレクトリに置き、1回目は施設の検索から、2回目以降は
+施設カタログから直接詳細ページを開く (--passes)。
+--json で結果を保存すると CI で推移を追える。
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import functools
+import datetime
+import tempfile
+import threading
+import tracemalloc
+
+from benchmarks.fixture_site import FACILITY_NAMES, FixtureData, FixtureSite
+
+MEMORY_SAMPLE_INTERVAL = 0.2  # Chrome の RSS を測る間隔 [秒]
+
+
+class MemorySampler:
+    """pool.memory_mb() (Chrome プロセス群の RSS 合計) を定期的に測ってピークを記録する"""
+
+    def __init__(self, pool, interval=MEMORY_SAMPLE_INTERVAL):
+        self.pool = pool
+        self.interval = interval
+        self.peak_mb = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            mb = self.pool.memory_mb()
+            if mb is not None:
+                self.peak_mb = max(self.peak_mb or 0, mb)
+            if self._stop.wait(self.interval):
+                return
+
+
+def phase_totals(scan):
+    return {row["phase"]: round(row["total"], 3) for row in scan.summary()} if scan else {}
+
+
+def measure(site, pool, run, facilities):
+    """run() を実行し、配信数・時間・メモリを集計する"""
+    before = site.snapshot()
+    tracemalloc.start()
+    started = time.perf_counter()
+    with MemorySampler(pool) as sampler:
+        rows, per_facility = run()
+    elapsed = time.perf_counter() - started
+    _, python_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    after = site.snapshot()
+
+    served = {kind: after[kind] - before[kind] for kind in after}
+    pages = served["documents"] + served["xhr"]
+    return {
+        "rows": rows,
+        "seconds": round(elapsed, 3),
+        "documents": served["documents"],
+        "xhr": served["xhr"],
+        "assets": served["scripts"] + served["assets"],
+        "pages_per_sec": round(pages / elapsed, 2) if elapsed else None,
+        "sec_per_facility": round(elapsed / facilities, 3) if facilities else None,
+        "sec_per_facility_max": round(max(per_facility), 3) if per_facility else None,
+        "python_peak_mb": round(python_peak / (1024 * 1024), 1),
+        "browser_peak_mb": round(sampler.peak_mb, 1) if sampler.peak_mb is not None else None,
+    }
+
+
+def bench_deep_scan(site, data, profile):
+    from src import browser_profiles, deep_scan
+    from src.spans import SPANS
+
+    # get_driver_pool はプロセス内で共有なので、プロファイルを切り替えたら作り直す
+    if browser_profiles.BROWSER_PROFILE != profile:
+        deep_scan.close_driver_pool()
+        browser_profiles.BROWSER_PROFILE = profile
+    pool = deep_scan.get_driver_pool()
+    pool.release(pool.acquire())  # Chrome の起動とウォームアップ
+    scan = SPANS.begin_scan("deep_scan")
+
+    def run():
+        rows, per_facility = 0, []
+        last = time.perf_counter()
+        end = data.start + datetime.timedelta(days=90)
+        tracer = SPANS.tracer(scan, attempt=1)
+        for batch in deep_scan.iter_availability_deep_scan(data.start, end, incremental=False, tracer=tracer):
+            now = time.perf_counter()
+            per_facility.append(now - last)
+            last = now
+            rows += len(batch)
+        return rows, per_facility
+
+    try:
+        result = measure(site, pool, run, len(data.gym_facilities))
+    finally:
+        SPANS.end_scan(scan)
+    result["phases"] = phase_totals(scan)
+    return result
+
+
+def bench_scraper(site, data, workers, profile):
+    from src import scraper
+    from src.driver_pool import DriverPool
+    from src.spans import SPANS
+
+    pool = DriverPool(functools.partial(scraper.setup_driver, profile), size=workers, warm_url=scraper.TARGET_URL)
+    drivers = [pool.acquire() for _ in range(workers)]
+    for driver in drivers:
+        pool.release(driver)
+
+    def run():
+        df = scraper.fetch_availability(workers=workers, pool=pool, incremental=False)
+        return len(df), []
+
+    try:
+        result = measure(site, pool, run, len(data.gym_facilities))
+    finally:
+        pool.close()
+    result["phases"] = phase_totals(SPANS.last_scan())
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--facilities", type=int, default=len(FACILITY_NAMES))
+    parser.add_argument("--latency-ms", type=int, default=0, help="フィクスチャサイトの応答を遅らせる時間")
+    parser.add_argument("--workers", type=int, default=1, help="scraper の並列数")
+    parser.add_argument("--only", choices=["deep_scan", "scraper"], nargs="+", default=["deep_scan", "scraper"])
+    parser.add_argument("--profiles", nargs="+", default=["lean", "full"],
+                        help="比べるブラウザプロファイル (lean / full / screenshot)")
+    parser.add_argument("--passes", type=int, default=2, help="同じキャッシュで繰り返す回数 (2回目以降は施設カタログを使う)")
+    parser.add_argument("--json", help="結果を保存するファイル")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    data = FixtureData(args.facilities)
+    with FixtureSite(data, latency_ms=args.latency_ms) as site, tempfile.TemporaryDirectory() as cache_dir:
+        # src.* は import 時に環境変数を読むので、先に設定しておく (本番のキャッシュ・計測記録には混ぜない)
+        os.environ["PORTAL_BASE_URL"] = site.base_url
+        os.environ["SCAN_CACHE_DIR"] = cache_dir
+        results = {}
+        for profile in args.profiles:
+            for n in range(1, args.passes + 1):
+                if "deep_scan" in args.only:
+                    results[f"deep_scan[{profile}]#{n}"] = bench_deep_scan(site, data, profile)
+                if "scraper" in args.only:
+                    results[f"scraper[{profile}]#{n}"] = bench_scraper(site, data, args.workers, profile)
+
+    columns = ["rows", "seconds", "documents", "xhr", "assets", "pages_per_sec", "sec_per_facility",
+               "sec_per_facility_max", "python_peak_mb", "browser_peak_mb"]
+    print(f"facilities: {len(data.facilities)} (体育室あり {len(data.gym_facilities)})")
+    print(f"{'':<24}" + "".join(f"{c:>22}" for c in columns))
+    for name, result in results.items():
+        print(f"{name:<24}" + "".join(f"{'-' if result[c] is None else result[c]:>22}" for c in columns))
+    for name, result in results.items():
+        print(f"{name} の内訳 [秒]: " + ", ".join(f"{phase}={sec}" for phase, sec in result["phases"].items()))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"facilities": len(data.facilities), "latency_ms": args.latency_ms,
+                       "profiles": args.profiles, "results": results}, f, indent=2)
+    return 0 if all(r["rows"] for r in results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""
+テーブル解析エンジンの比較ベンチマーク。
+
+    python -m benchmarks.bench_table_parser [--repeat 200]
+
+保存済みのフィクスチャページ (benchmarks/fixtures/*.html) に対して、
+- legacy:   従来の BeautifulSoup(page_source, "html.parser") でページ全体を解析
+- <engine>: ブラウザ側で選んだ候補テーブルの outerHTML だけを各エンジンで解析
+の1回あたりの時間を計測する。候補テーブルの選択はブラウザ内で行われる処理なので計測対象外。
+"""
+import re
+import glob
+import os
+import time
+import argparse
+
+from bs4 import BeautifulSoup
+
+from src.table_parser import ENGINES, parse_tables
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+_CANDIDATE_RE = re.compile(r"[○×△空満]|alt=\"[○×△]\"|(circle|cross|triangle)")
+
+
+def candidate_fragments(html):
+    """CANDIDATE_TABLES_SCRIPT と同じ条件で候補テーブルの outerHTML を取り出す"""
+    soup = BeautifulSoup(html, "html.parser")
+    return [str(t) for t in soup.find_all("table") if _CANDIDATE_RE.search(str(t))]
+
+
+def legacy_parse(html):
+    soup = BeautifulSoup(html, "html.parser")
+    for tbl in soup.find_all("table"):
+        for tr in tbl.find_all("tr"):
+            for td in tr.find_all(["th", "td"]):
+                td.get_text(strip=True)
+                td.find("img")
+
+
+def bench(func, arg, repeat):
+    func(arg)  # warm-up
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func(arg)
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    pages = sorted(glob.glob(os.path.join(FIXTURE_DIR, "*.html")))
+    print(f"{'page':<20} {'engine':<12} {'input KB':>9} {'ms/page':>9} {'speedup':>8}")
+    for path in pages:
+        with open(path, encoding="utf-8") as f:
+            html = f.read()
+        fragments = candidate_fragments(html)
+        name = os.path.basename(path)
+
+        base = bench(legacy_parse, html, args.repeat)
+        print(f"{name:<20} {'legacy':<12} {len(html.encode()) / 1024:>9.1f} {base:>9.3f} {1:>7.1f}x")
+
+        fragment_kb = sum(len(f.encode()) for f in fragments) / 1024
+        for engine in ENGINES:
+            ms = bench(lambda frs: parse_tables(frs, engine), fragments, args.repeat)
+            print(f"{name:<20} {engine:<12} {fragment_kb:>9.1f} {ms:>9.3f} {base / ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
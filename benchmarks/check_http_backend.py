@@ -0,0 +1,87 @@
+"""
+HTTP バックエンド (src.http_backend) のオフライン確認。
+
+    python -m benchmarks.check_http_backend [--cassette benchmarks/fixtures/portal_cassette.json]
+
+記録済みカセットを ReplayServer で再生し、fetch_availability_http が
+- ページ構成からウィジェットの sys_id を見つけ (HTTP_WIDGETS の id)
+- 記録と同じ入力 (action / category / room / date) で POST し
+- g_ck トークンを X-UserToken ヘッダで付け
+- 空きでない状況 (unavailable / 空きなし など) を空きと取り違えない
+ことを確かめる。カセットに無いリクエストは ReplayServer が 404 を返すので、入力がずれると失敗する。
+同梱のカセットは手で組んだもの。本番の形式が変わったら --record で取り直して EXPECTED_ROWS を合わせる。
+"""
+import os
+import sys
+import json
+import argparse
+import datetime
+
+from src.http_backend import PortalClient, fetch_availability_http
+from src.replay_server import ReplayServer
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+CASSETTE_PATH = os.path.join(FIXTURE_DIR, "portal_cassette.json")
+START_DATE = datetime.date(2026, 10, 19)
+END_DATE = datetime.date(2026, 10, 25)
+
+# カセットから取れるはずの行 (日付, 施設名, 室場名, 時間, 状況)
+EXPECTED_ROWS = {
+    ("2026-10-19", "藤沢市民センター", "体育室", "9:00-11:00", "○"),
+    ("2026-10-24", "藤沢市民センター", "体育室", "11:00-13:00", "△"),
+    ("2026-10-24", "藤沢市民センター", "体育室", "13:00-15:00", "○"),
+    ("2026-10-25", "辻堂市民センター", "体育室", "9:00-11:00", "○"),
+    ("2026-10-25", "辻堂市民センター", "体育室", "15:00-17:00", "△"),
+}
+# 呼ばれるはずのウィジェット (カセットのページ構成にある sys_id)
+EXPECTED_WIDGETS = {"/api/now/sp/widget/a1b2c3search", "/api/now/sp/widget/d4e5f6sched"}
+
+
+def run_check(cassette=CASSETTE_PATH):
+    """問題の一覧を返す (空なら成功)"""
+    with open(cassette, encoding="utf-8") as f:
+        exchanges = json.load(f)
+    bootstrap = next(ex["response"] for ex in exchanges if ex["method"] == "GET" and isinstance(ex["response"], str))
+    token = bootstrap.split("g_ck = '")[1].split("'")[0]
+
+    problems = []
+    with ReplayServer(exchanges) as server:
+        client = PortalClient(base_url=server.url, pool_size=2)
+        try:
+            df = fetch_availability_http(START_DATE, END_DATE, client=client, workers=2)
+        except Exception as e:
+            return [f"取得に失敗しました (未記録のリクエスト?): {e}"]
+        finally:
+            client.close()
+        requests = list(server.requests)
+
+    rows = {tuple(r) for r in df[["日付", "施設名", "室場名", "時間", "状況"]].itertuples(index=False, name=None)}
+    for row in sorted(EXPECTED_ROWS - rows):
+        problems.append(f"取れていない行: {row}")
+    for row in sorted(rows - EXPECTED_ROWS):
+        problems.append(f"余分な行 (空きでない状況を空きと判定?): {row}")
+
+    posted = {path for method, path, _ in requests if method == "POST"}
+    if posted != EXPECTED_WIDGETS:
+        problems.append(f"呼ばれたウィジェット: {sorted(posted)} (期待: {sorted(EXPECTED_WIDGETS)})")
+    missing_token = [path for method, path, sent in requests if method == "POST" and sent != token]
+    if missing_token:
+        problems.append(f"X-UserToken が付いていない POST: {missing_token}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP バックエンドを記録済みカセットで確認する")
+    parser.add_argument("--cassette", default=CASSETTE_PATH)
+    args = parser.parse_args()
+
+    problems = run_check(args.cassette)
+    for problem in problems:
+        print(f"NG: {problem}")
+    if problems:
+        sys.exit(1)
+    print(f"OK: {len(EXPECTED_ROWS)} rows, widgets {', '.join(sorted(EXPECTED_WIDGETS))}")
+
+
+if __name__ == "__main__":
+    main()
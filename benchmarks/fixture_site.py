@@ -0,0 +1,381 @@
+"""
+ポータルを模したローカルのフィクスチャサイト (静的ファイル + ローカル HTTP サーバー)。
+
+    python -m benchmarks.fixture_site [--port 8770] [--facilities 13] [--latency-ms 0]
+    PORTAL_BASE_URL=http://127.0.0.1:8770 streamlit run app.py     # 向き先をフィクスチャに変更
+
+本番サイトと同じ順序で辿れるページを生成する:
+- /facilities_reservation?id=facility_search  iframe 内に検索フォームと施設一覧 (「室場一覧」のアコーディオン、体育室の行、「確認」リンク)
+- /fixture/detail/<施設>.html                  iframe 内に「予約状況」、月間カレンダー、週間の ○/△/× 表 (日付クリックで XHR 読み込み)
+- /facilities_reservation                      キーワード検索フォーム (src.scraper 用)
+- /facilities_reservation/results             展開ボタン付きの室場リンク一覧
+- /fixture/room/<施設>_gym.html                週間表と「次の週」ボタン (XHR 読み込み)
+週間表のデータは /api/now/sp/widget/... の JSON として置くので、CAPTURE_NETWORK=1 の経路でも読める。
+各ページはスタイルシート・Web フォント・画像も読み込む (静的ファイルはキャッシュ可、ページと XHR は no-store)。
+空き状況は施設・日付・時間帯から決まる疑似乱数なので、同じ引数なら毎回同じサイトになる。
+"""
+import os
+import json
+import time
+import random
+import logging
+import datetime
+import tempfile
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+
+logger = logging.getLogger(__name__)
+
+FACILITY_NAMES = ["藤沢", "鵠沼", "村岡", "明治", "御所見", "遠藤", "長後", "辻堂", "善行", "湘南大庭", "六会", "湘南台", "片瀬"]
+TIME_SLOTS = ["9:00-11:00", "11:00-13:00", "13:00-15:00", "15:00-17:00", "17:00-19:00", "19:00-21:00"]
+OTHER_ROOMS = ["会議室1", "和室", "調理室"]
+WEEKDAYS = ["月", "火", "水", "木", "金", "土", "日"]
+WEEKS = 12  # src.scraper.WEEKS_TO_FETCH と同じ
+SCHEDULE_API = "/api/now/sp/widget/fixture_schedule"
+
+_STATUSES = ["○", "△", "×", "-"]
+_STATUS_WEIGHTS = [0.15, 0.1, 0.65, 0.1]
+
+# --- ページのテンプレート (スクリプトは外部ファイルにして、本文のテキスト検索に引っかからないようにする) ---
+_HEAD = ("<!DOCTYPE html><html lang='ja'><head><meta charset='utf-8'><title>{title}</title>"
+         "<link rel='stylesheet' href='/fixture/portal.css'>{scripts}</head>")
+# 本番のポータルと同じく、各ページがスタイルシート・Web フォント・画像を読み込む (lean プロファイルでは読み込まれない)
+_PORTAL_CSS = """
+@font-face { font-family: 'PortalSans'; src: url('/fixture/portal.woff2') format('woff2'); }
+body { font-family: 'PortalSans', sans-serif; background: url('/fixture/background.jpg'); }
+header { background: url('/fixture/logo.png') no-repeat; padding-left: 48px; }
+"""
+# 静的ファイルの大きさ [byte] (画像・フォントは中身のない疑似データ)
+_ASSET_SIZES = {"/fixture/portal.woff2": 120 * 1024, "/fixture/background.jpg": 400 * 1024, "/fixture/logo.png": 60 * 1024}
+
+_FIXTURE_JS = r"""
+function fixtureRenderSchedule(container, data) {
+  var html = '<table class="schedule"><tr><th>日付</th>';
+  data.headers.forEach(function (h) { html += '<th>' + h + '</th>'; });
+  html += '</tr>';
+  data.rows.forEach(function (row) {
+    html += '<tr><td>' + row.date + '</td>';
+    row.slots.forEach(function (s) { html += '<td>' + s + '</td>'; });
+    html += '</tr>';
+  });
+  container.innerHTML = html + '</table>';
+}
+function fixtureLoadWeek(container, slug, week) {
+  var xhr = new XMLHttpRequest();
+  xhr.open('GET', '__API__/' + slug + '/' + week + '.json');
+  xhr.onload = function () { fixtureRenderSchedule(container, JSON.parse(xhr.responseText)); };
+  xhr.send();
+}
+""".replace("__API__", SCHEDULE_API)
+
+_SEARCH_JS = r"""
+document.addEventListener('DOMContentLoaded', function () {
+  var results = document.getElementById('results');
+  function render() {
+    var html = '';
+    window.FIXTURE_FACILITIES.forEach(function (f, i) {
+      html += '<div class="facility"><h4 class="header">' + f.name + '</h4>'
+        + '<a href="javascript:void(0)" class="toggle" data-index="' + i + '">室場一覧</a>'
+        + '<div class="rooms" id="rooms-' + i + '" style="display:none"><table>';
+      f.rooms.forEach(function (r) {
+        html += '<tr><td>' + r.name + '</td><td><a class="btn" href="' + r.href + '">確認</a></td></tr>';
+      });
+      html += '</table></div></div>';
+    });
+    results.innerHTML = html;
+  }
+  document.getElementById('search_btn').addEventListener('click', function () {
+    sessionStorage.setItem('fixture_searched', '1');
+    render();
+  });
+  results.addEventListener('click', function (e) {
+    var t = e.target.closest('.toggle');
+    if (!t) return;
+    var rooms = document.getElementById('rooms-' + t.dataset.index);
+    rooms.style.display = rooms.style.display === 'none' ? 'block' : 'none';
+  });
+  // 戻るボタンで戻ったときは検索結果を復元する (本番の SPA と同じ)
+  if (sessionStorage.getItem('fixture_searched')) render();
+});
+"""
+
+_DETAIL_JS = r"""
+document.addEventListener('DOMContentLoaded', function () {
+  var container = document.getElementById('schedule');
+  document.querySelector('table.calendar').addEventListener('click', function (e) {
+    var cell = e.target.closest('td[data-week]');
+    if (!cell) return;
+    e.preventDefault();
+    fixtureLoadWeek(container, document.body.dataset.slug, cell.dataset.week);
+  });
+});
+"""
+
+_ROOM_JS = r"""
+document.addEventListener('DOMContentLoaded', function () {
+  var container = document.getElementById('schedule');
+  var weeks = document.body.dataset.weeks.split(',');
+  var current = 0;
+  document.querySelector('button.next').addEventListener('click', function () {
+    if (current + 1 >= weeks.length) return;
+    current += 1;
+    fixtureLoadWeek(container, document.body.dataset.slug, weeks[current]);
+  });
+});
+"""
+
+_ROOMS_JS = r"""
+document.addEventListener('click', function (e) {
+  var btn = e.target.closest('button.expand-icon');
+  if (!btn) return;
+  var rooms = btn.nextElementSibling;
+  rooms.style.display = rooms.style.display === 'none' ? 'block' : 'none';
+});
+"""
+
+
+def _date_label(d):
+    return f"{d.month}/{d.day}({WEEKDAYS[d.weekday()]})"
+
+
+def _week_start(d):
+    """日曜始まりの週の初日"""
+    return d - datetime.timedelta(days=(d.weekday() + 1) % 7)
+
+
+class FixtureData:
+    """フィクスチャサイトの施設・空き状況 (引数が同じなら毎回同じ内容)"""
+
+    def __init__(self, facilities=len(FACILITY_NAMES), start=None, weeks=WEEKS, seed=0):
+        self.start = start or datetime.date.today()
+        self.seed = seed
+        self.weeks = [_week_start(self.start) + datetime.timedelta(weeks=w) for w in range(weeks)]
+        self.facilities = []
+        for i in range(facilities):
+            base = FACILITY_NAMES[i % len(FACILITY_NAMES)]
+            name = f"{base}市民センター" if i < len(FACILITY_NAMES) else f"{base}第{i // len(FACILITY_NAMES) + 1}市民センター"
+            has_gym = i % 3 != 2  # 3館に1館は体育室なし
+            rooms = [r for r in OTHER_ROOMS[: 1 + i % len(OTHER_ROOMS)]]
+            if has_gym:
+                rooms.insert(len(rooms) // 2, "体育室")
+            self.facilities.append({"slug": f"fac{i + 1:02d}", "name": name, "rooms": rooms, "has_gym": has_gym})
+
+    @property
+    def gym_facilities(self):
+        return [f for f in self.facilities if f["has_gym"]]
+
+    def status(self, slug, day, slot):
+        rng = random.Random(f"{self.seed}|{slug}|{day.isoformat()}|{slot}")
+        return rng.choices(_STATUSES, weights=_STATUS_WEIGHTS, k=1)[0]
+
+    def week(self, slug, week_start):
+        """decode_schedule の表形式と同じ構造の週データ"""
+        days = [week_start + datetime.timedelta(days=d) for d in range(7)]
+        return {
+            "headers": TIME_SLOTS,
+            "rows": [{"date": _date_label(d), "slots": [self.status(slug, d, s) for s in TIME_SLOTS]} for d in days],
+        }
+
+    def month_weeks(self):
+        """月間カレンダーに表示する月 (start の月) の週。各週は日曜始まりの7日"""
+        first = self.start.replace(day=1)
+        next_month = (first + datetime.timedelta(days=32)).replace(day=1)
+        weeks, day = [], _week_start(first)
+        while day < next_month:
+            weeks.append([day + datetime.timedelta(days=d) for d in range(7)])
+            day += datetime.timedelta(weeks=1)
+        return first, next_month, weeks
+
+
+def build_site(root, data):
+    """data の内容でフィクスチャサイトの静的ファイルを root に書き出す"""
+    def write(path, content):
+        full = os.path.join(root, path.lstrip("/"))
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        mode, encoding = ("wb", None) if isinstance(content, bytes) else ("w", "utf-8")
+        with open(full, mode, encoding=encoding) as f:
+            f.write(content)
+
+    def head(title, *scripts):
+        tags = "".join(f"<script src='/fixture/{s}'></script>" for s in scripts)
+        return _HEAD.format(title=title, scripts=tags)
+
+    rng = random.Random(data.seed)
+    write("/fixture/portal.css", _PORTAL_CSS)
+    for path, size in _ASSET_SIZES.items():
+        write(path, rng.randbytes(size))
+    write("/fixture/fixture.js", _FIXTURE_JS)
+    write("/fixture/search.js", _SEARCH_JS)
+    write("/fixture/detail.js", _DETAIL_JS)
+    write("/fixture/room.js", _ROOM_JS)
+    write("/fixture/rooms.js", _ROOMS_JS)
+
+    # 施設検索 (src.deep_scan.fetch_availability_deep_scan)
+    facilities = [{
+        "name": f["name"],
+        "rooms": [{"name": r, "href": f"/fixture/detail/{f['slug']}.html" if r == "体育室" else "javascript:void(0)"}
+                  for r in f["rooms"]],
+    } for f in data.facilities]
+    write("/fixture/facilities.js", "window.FIXTURE_FACILITIES = " + json.dumps(facilities, ensure_ascii=False) + ";")
+    write("/portal.html", head("施設予約システム") +
+          "<body><header id='sc_header_top'>施設予約システム</header><img src='/fixture/logo.png' alt=''>"
+          "<iframe id='gsft_main' src='/fixture/search_frame.html' style='width:100%;height:1200px'></iframe></body></html>")
+    write("/fixture/search_frame.html", head("施設検索", "facilities.js", "search.js") +
+          "<body><h2>施設検索</h2>"
+          "<label><input type='checkbox' name='category' value='civic'> 市民センター</label>"
+          "<input type='date' name='use_date'>"
+          "<button type='button' id='search_btn'>検索</button>"
+          "<div id='results'></div></body></html>")
+
+    for week in data.weeks:
+        for f in data.gym_facilities:
+            write(f"{SCHEDULE_API}/{f['slug']}/{week.isoformat()}.json",
+                  json.dumps(data.week(f["slug"], week), ensure_ascii=False))
+
+    first, next_month, month = data.month_weeks()
+    for f in data.gym_facilities:
+        calendar = "<table class='calendar'><caption>{}年{}月</caption><tr>{}</tr>".format(
+            first.year, first.month, "".join(f"<th>{w}</th>" for w in ["日", "月", "火", "水", "木", "金", "土"]))
+        for days in month:
+            calendar += "<tr>"
+            for d in days:
+                if first <= d < next_month and _week_start(d) in data.weeks:
+                    calendar += f"<td data-week='{_week_start(d).isoformat()}'><a href='#'>{d.day}</a></td>"
+                else:
+                    calendar += "<td></td>"
+            calendar += "</tr>"
+        calendar += "</table>"
+
+        write(f"/fixture/detail/{f['slug']}.html", head("施設予約システム") +
+              "<body><header>施設予約システム</header>"
+              f"<iframe src='/fixture/detail/{f['slug']}_frame.html' style='width:100%;height:1200px'></iframe></body></html>")
+        write(f"/fixture/detail/{f['slug']}_frame.html", head("施設詳細", "fixture.js", "detail.js") +
+              f"<body data-slug='{f['slug']}'><h2>{f['name']} 体育室 予約状況</h2>"
+              "<input type='date' name='use_date'>" + calendar +
+              f"<div id='schedule'>{_schedule_html(data.week(f['slug'], data.weeks[0]))}</div></body></html>")
+
+    # キーワード検索 (src.scraper.fetch_availability)
+    write("/keyword_search.html", head("施設予約システム") +
+          "<body><form action='/facilities_reservation/results' method='get'>"
+          "<input type='search' name='q' placeholder='施設名・キーワードで検索'><button>検索</button></form></body></html>")
+    rooms = ""
+    for f in data.gym_facilities:
+        rooms += (f"<div class='facility'><h4>{f['name']}</h4><button class='expand-icon'>▶</button>"
+                  f"<div style='display:none'><table><tr><td class='room-name'>"
+                  f"<a class='room-link' href='/fixture/room/{f['slug']}_gym.html'>体育室</a></td></tr></table></div></div>")
+        write(f"/fixture/room/{f['slug']}_gym.html", head("室場詳細", "fixture.js", "room.js") +
+              f"<body data-slug='{f['slug']}' data-weeks='{','.join(w.isoformat() for w in data.weeks)}'>"
+              f"<h1>{f['name']}</h1><h2>体育室</h2>"
+              f"<div id='schedule'>{_schedule_html(data.week(f['slug'], data.weeks[0]))}</div>"
+              "<button class='next'>次の週 ▶</button></body></html>")
+    write("/rooms.html", head("検索結果", "rooms.js") + f"<body><h2>検索結果</h2>{rooms}</body></html>")
+
+
+def _schedule_html(week):
+    html = "<table class='schedule'><tr><th>日付</th>" + "".join(f"<th>{h}</th>" for h in week["headers"]) + "</tr>"
+    for row in week["rows"]:
+        html += f"<tr><td>{row['date']}</td>" + "".join(f"<td>{s}</td>" for s in row["slots"]) + "</tr>"
+    return html + "</table>"
+
+
+class FixtureSite:
+    """
+    フィクスチャサイトを配信するローカル HTTP サーバー。
+    ページ (HTML)・XHR (JSON)・スクリプト・その他の静的ファイル (CSS・フォント・画像) の配信数を数え、latency_ms を指定すると各応答をその分だけ遅らせる。
+    """
+
+    def __init__(self, data=None, root=None, host="127.0.0.1", port=0, latency_ms=0):
+        self.data = data or FixtureData()
+        self._tmp = None
+        if root is None:
+            self._tmp = tempfile.TemporaryDirectory(prefix="fixture_site_")
+            root = self._tmp.name
+        self.root = root
+        build_site(root, self.data)
+        self.latency = latency_ms / 1000
+        self.counts = {"documents": 0, "xhr": 0, "scripts": 0, "assets": 0}
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._tmp:
+            self._tmp.cleanup()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counts)
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(SimpleHTTPRequestHandler):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, directory=server.root, **kwargs)
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                if parts.path.rstrip("/") == "/facilities_reservation":
+                    query = dict(parse_qsl(parts.query))
+                    self.path = "/portal.html" if query.get("id") == "facility_search" else "/keyword_search.html"
+                elif parts.path.rstrip("/") == "/facilities_reservation/results":
+                    self.path = "/rooms.html"
+                path = urlsplit(self.path).path
+                kind = ("documents" if path.endswith(".html") else "xhr" if path.endswith(".json")
+                        else "scripts" if path.endswith(".js") else "assets")
+                with server._lock:
+                    server.counts[kind] += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                super().do_GET()
+
+            def end_headers(self):
+                # ページと XHR は毎回取り直させ、静的ファイルはブラウザの HTTP キャッシュに残してよい (本番と同じ)
+                static = urlsplit(self.path).path.startswith("/fixture/") and not self.path.endswith(".html")
+                self.send_header("Cache-Control", "max-age=3600" if static else "no-store")
+                super().end_headers()
+
+            def log_message(self, fmt, *args):
+                logger.debug(fmt % args)
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="ポータルを模したフィクスチャサイト")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8770)
+    parser.add_argument("--facilities", type=int, default=len(FACILITY_NAMES))
+    parser.add_argument("--latency-ms", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    site = FixtureSite(FixtureData(args.facilities), host=args.host, port=args.port, latency_ms=args.latency_ms)
+    print(f"Serving fixture portal on {site.base_url}/facilities_reservation?id=facility_search&tab=1")
+    try:
+        site._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        site.stop()
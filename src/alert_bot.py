@@ -1,9 +1,11 @@
 import os
-import requests
 import datetime
-import jpholiday
 import logging
-from src.scraper import FacilityScraper
+import functools
+from src.scraper import fetch_availability
+from src.jp_calendar import is_weekend_or_holiday
+from src.seen_slots import SeenSlotStore
+from src.notifier import LINE_NOTIFY_API, LineNotifySink, NotificationDispatcher
 from dotenv import load_dotenv
 
 # 環境変数の読み込み
@@ -18,7 +20,6 @@ logger = logging.getLogger(__name__)
 
 # --- 設定 ---
 LINE_NOTIFY_TOKEN = os.getenv("LINE_NOTIFY_TOKEN")
-LINE_NOTIFY_API = "https://notify-api.line.me/api/notify"
 
 # ターゲット条件
 TARGET_TIME_RANGES = [
@@ -40,10 +41,8 @@ def is_target_date(date_str):
             
         dt = datetime.datetime.strptime(date_str, "%Y-%m-%d").date()
         
-        # 土曜(5) or 日曜(6) or 祝日
-        if dt.weekday() >= 5 or jpholiday.is_holiday(dt):
-            return True
-        return False
+        # 土曜(5) or 日曜(6) or 祝日 (祝日判定は事前に作った参照表を引く)
+        return is_weekend_or_holiday(dt)
     except ValueError:
         logger.warning(f"日付パースエラー: {date_str}")
         return False
@@ -51,31 +50,26 @@ def is_target_date(date_str):
 def is_target_time(time_str):
     return time_str in TARGET_TIME_RANGES
 
-def send_line_notify(message):
+@functools.lru_cache(maxsize=1)
+def get_dispatcher():
+    """LINE Notify への送信を行う NotificationDispatcher (プロセス内で1つ。接続を使い回す)"""
+    return NotificationDispatcher(LineNotifySink(LINE_NOTIFY_TOKEN, LINE_NOTIFY_API))
+
+def send_line_notify(header, lines):
+    """header と lines を文字数上限ごとに分けて送り、届いた行数 (lines の先頭から) を返す"""
     if not LINE_NOTIFY_TOKEN:
         logger.error("LINE_NOTIFY_TOKENが設定されていません。")
-        return
+        return 0
 
-    headers = {"Authorization": f"Bearer {LINE_NOTIFY_TOKEN}"}
-    payload = {"message": message}
-    
-    try:
-        response = requests.post(LINE_NOTIFY_API, headers=headers, data=payload)
-        response.raise_for_status()
+    delivered = get_dispatcher().dispatch(header, lines)
+    if delivered == len(lines):
         logger.info("LINE通知を送信しました。")
-    except Exception as e:
-        logger.error(f"LINE通知送信エラー: {e}")
-
-def main():
-    logger.info("監視ボットを開始します...")
-    
-    scraper = FacilityScraper()
-    try:
-        results = scraper.get_availability()
-    except Exception as e:
-        logger.error(f"スクレイピング失敗: {e}")
-        return
+    else:
+        logger.error(f"LINE通知送信エラー ({delivered}/{len(lines)}行 送信済み)")
+    return delivered
 
+def find_target_slots(results):
+    """スクレイピング結果から通知対象の空きを取り出す"""
     found_slots = []
     
     for item in results:
@@ -95,24 +89,50 @@ def main():
         # ログに出しつつ、通知候補に入れる。
         
         found_slots.append(item)
+    return found_slots
 
-    if found_slots:
-        message = "\n【空き状況発見！】\n"
-        count = 0
-        for slot in found_slots:
-             # 通知量が多いとLINEでブロックされる可能性があるため、件数を絞るかまとめ方を変える
-            if count >= 10:
-                message += "\n...他多数"
-                break
-                
-            msg_line = f"{slot['日付']} {slot['時間']} {slot['施設名']} {slot['室場名']}"
-            message += msg_line + "\n"
-            count += 1
-            
-        logger.info(f"{len(found_slots)}件の空きが見つかりました。通知を送信します。")
-        send_line_notify(message)
-    else:
-        logger.info("条件に合致する空きは見つかりませんでした。")
+def _slot_lines(slots):
+    return [f"{slot['日付']} {slot['時間']} {slot['施設名']} {slot['室場名']}" for slot in slots]
+
+def notify_changes(opened, closed):
+    """
+    前回からの差分 (新しく空いた枠・埋まった枠) だけを通知する (長い場合は複数通に分ける)。
+    差分が無ければ何も送らない。通知できた枠 (opened・closed のうち届いた分) のリストを返す
+    """
+    if not opened and not closed:
+        logger.info("前回から変化はありません。")
+        return []
+    lines, line_slots = [], []  # line_slots[i] は lines[i] の枠 (見出しは None)
+    for title, slots in (("■ 新しい空き", opened), ("■ 埋まった枠", closed)):
+        if slots:
+            lines += [title] + _slot_lines(slots)
+            line_slots += [None] + list(slots)
+    logger.info(f"新しい空き {len(opened)}件 / 埋まった枠 {len(closed)}件を通知します。")
+    delivered = send_line_notify("【空き状況の変化】", lines)
+    return [slot for slot in line_slots[:delivered] if slot is not None]
+
+def scan():
+    """
+    空き状況を取得してレコードのリストで返す。前回から内容の変わっていない週のページは再解析しない (差分スキャン)。
+    取得に失敗した場合や一部の室場が取れなかった場合 (IncompleteScanError) は例外になる。
+    """
+    return fetch_availability(incremental=True).to_dict("records")
+
+def main():
+    logger.info("監視ボットを開始します...")
+    
+    try:
+        results = scan()
+    except Exception as e:
+        # 空や一部だけの結果と差分を取ると、取れなかった枠がすべて「埋まった」ことになり状態も上書きしてしまうので、
+        # 通知も保存もせずに次回の完全な結果を待つ
+        logger.error(f"スクレイピング失敗 (通知・状態の保存は行いません): {e}")
+        return
+
+    # 前回の実行から変わった枠だけを通知し、届いた枠だけを状態に反映する (届かなかった枠は次回また送る)
+    seen = SeenSlotStore()
+    opened, closed = seen.diff(find_target_slots(results))
+    seen.commit(notify_changes(opened, closed))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,192 @@
+import os
+import json
+import signal
+import logging
+import datetime
+import threading
+from zoneinfo import ZoneInfo
+
+from src import alert_bot
+from src.seen_slots import SeenSlotStore
+
+logger = logging.getLogger(__name__)
+
+# --- 設定定数 ---
+HEARTBEAT_PATH = os.path.join(os.getenv("SCAN_CACHE_DIR", ".cache"), "alert_daemon.heartbeat.json")
+# 抽選結果の公開日 (毎月この日の朝はキャンセル・未当選枠が出やすいので高頻度で確認する)
+LOTTERY_RELEASE_DAYS = tuple(int(d) for d in os.getenv("LOTTERY_RELEASE_DAYS", "1").split(",") if d.strip())
+
+# (開始時, 終了時, 間隔[秒]) — 上から順に最初に当てはまるものを使う
+POLL_WINDOWS = [
+    (0, 6, 60 * 60),    # 深夜: 1時間おき
+    (6, 7, 20 * 60),    # 早朝
+    (7, 10, 5 * 60),    # 朝: キャンセルが出やすい
+    (10, 22, 10 * 60),  # 日中
+    (22, 24, 30 * 60),  # 夜
+]
+LOTTERY_WINDOW = (8, 12, 2 * 60)  # 抽選結果公開日の 8〜12時は2分おき
+MAX_ERROR_BACKOFF = 60 * 60       # 失敗が続いたときの最大待ち時間
+# 時間帯の判定はポータルの運用に合わせて日本時間で行う (GitHub Actions などホストの TZ が UTC の場合でも)
+JST = ZoneInfo("Asia/Tokyo")
+
+
+class SystemClock:
+    """実時間の時計 (日本時間)。sleep は stop_event がセットされると即座に戻る"""
+
+    def now(self):
+        return datetime.datetime.now(JST)
+
+    def sleep(self, seconds, stop_event):
+        stop_event.wait(seconds)
+
+
+class FakeClock:
+    """スケジュール確認用の時計。sleep は待たずに時刻だけ進める"""
+
+    def __init__(self, start):
+        self.current = start
+        self.sleeps = []
+
+    def now(self):
+        return self.current
+
+    def sleep(self, seconds, stop_event):
+        self.sleeps.append(seconds)
+        self.current += datetime.timedelta(seconds=seconds)
+
+
+class AdaptiveSchedule:
+    """
+    時刻に応じてポーリング間隔を決める。
+    抽選結果の公開日の朝や平日朝は短く、深夜は長くし、失敗が続いた場合は指数的に延ばす。
+    """
+
+    def __init__(self, windows=POLL_WINDOWS, lottery_days=LOTTERY_RELEASE_DAYS, lottery_window=LOTTERY_WINDOW,
+                 max_backoff=MAX_ERROR_BACKOFF):
+        self.windows = windows
+        self.lottery_days = lottery_days
+        self.lottery_window = lottery_window
+        self.max_backoff = max_backoff
+
+    def interval(self, now, consecutive_errors=0):
+        base = self._base_interval(now)
+        if consecutive_errors:
+            base = min(self.max_backoff, base * (2 ** consecutive_errors))
+        return base
+
+    def _base_interval(self, now):
+        start, end, seconds = self.lottery_window
+        if now.day in self.lottery_days and start <= now.hour < end:
+            return seconds
+        for start, end, seconds in self.windows:
+            if start <= now.hour < end:
+                return seconds
+        return self.windows[-1][2]
+
+
+class AlertDaemon:
+    """
+    監視ボットの常駐版。1つのブラウザ (src.scraper の DriverPool) を使い続け、
+    AdaptiveSchedule の間隔で空きを確認し、SeenSlotStore との差分 (新しく空いた枠・埋まった枠) だけを通知する。
+    SIGINT/SIGTERM で現在のポーリングを終えてから停止し、毎回ハートビートファイルを更新する。
+    """
+
+    def __init__(self, scan=alert_bot.scan, notify=alert_bot.notify_changes, clock=None, schedule=None,
+                 heartbeat_path=HEARTBEAT_PATH, seen=None):
+        self.scan = scan
+        self.notify = notify
+        self.clock = clock or SystemClock()
+        self.schedule = schedule or AdaptiveSchedule()
+        self.heartbeat_path = heartbeat_path
+        self.stop_event = threading.Event()
+        self.polls = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.seen = seen if seen is not None else SeenSlotStore()
+
+    def install_signal_handlers(self):
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, self._on_signal)
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self, max_polls=None):
+        logger.info("監視デーモンを開始します...")
+        while not self.stop_event.is_set():
+            self.poll_once()
+            if max_polls is not None and self.polls >= max_polls:
+                break
+            if self.stop_event.is_set():
+                break
+            wait = self.schedule.interval(self.clock.now(), self.consecutive_errors)
+            next_poll = self.clock.now() + datetime.timedelta(seconds=wait)
+            self.write_heartbeat("sleeping", next_poll)
+            logger.info(f"次回の確認: {next_poll:%H:%M:%S} ({wait // 60}分後)")
+            self.clock.sleep(wait, self.stop_event)
+        self.write_heartbeat("stopped")
+        logger.info("監視デーモンを停止しました。")
+
+    def poll_once(self):
+        self.polls += 1
+        self.write_heartbeat("polling")
+        try:
+            results = self.scan()
+        except Exception as e:
+            # 失敗・一部だけのスキャン (IncompleteScanError) では差分を取らない (埋まった枠の誤検出と状態の上書きを防ぐ)
+            self.errors += 1
+            self.consecutive_errors += 1
+            logger.error(f"スクレイピング失敗 ({self.consecutive_errors}回連続): {e}")
+            return
+        self.consecutive_errors = 0
+
+        # 同じ空きを毎回通知しないよう、前回との差分だけを通知する (状態はファイルに残るので再起動しても引き継ぐ)
+        found = alert_bot.find_target_slots(results)
+        opened, closed = self.seen.diff(found, now=self.clock.now().timestamp())
+        # 通知できた枠だけを確定し、残りは次回の確認で送り直す
+        self.seen.commit(self.notify(opened, closed))
+
+    def write_heartbeat(self, status, next_poll=None):
+        if not self.heartbeat_path:
+            return
+        data = {
+            "pid": os.getpid(),
+            "status": status,
+            "updated_at": self.clock.now().isoformat(timespec="seconds"),
+            "next_poll": next_poll.isoformat(timespec="seconds") if next_poll else None,
+            "polls": self.polls,
+            "errors": self.errors,
+        }
+        try:
+            os.makedirs(os.path.dirname(self.heartbeat_path) or ".", exist_ok=True)
+            tmp = f"{self.heartbeat_path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp, self.heartbeat_path)
+        except OSError as e:
+            logger.warning(f"ハートビートの書き込みに失敗しました: {e}")
+
+    def _on_signal(self, signum, frame):
+        logger.info(f"シグナル {signum} を受信しました。現在の処理を終えて停止します...")
+        self.stop()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="空き状況の常駐監視")
+    parser.add_argument("--heartbeat", default=HEARTBEAT_PATH, help="ハートビートファイルのパス")
+    parser.add_argument("--max-polls", type=int, default=None, help="指定回数確認したら終了する")
+    args = parser.parse_args()
+
+    daemon = AlertDaemon(heartbeat_path=args.heartbeat)
+    daemon.install_signal_handlers()
+    try:
+        daemon.run(max_polls=args.max_polls)
+    finally:
+        from src.scraper import get_default_pool
+        get_default_pool().close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Chrome の起動設定 (ブラウザプロファイル)。
+
+    options = Options()
+    profile = get_profile()                       # BROWSER_PROFILE (既定 lean)
+    slot = configure_options(options, profile)
+    driver = webdriver.Chrome(options=options)
+    start_profile(driver, profile, slot)
+
+- lean:       本番用。画像・フォント・メディアを読み込まず (CDP の URL ブロックと prefs)、
+              pageLoadStrategy=eager で DOMContentLoaded の時点で driver.get から戻る。
+              user-data-dir を .cache 以下に残すので、JS などの HTTP キャッシュが次回の起動でも効く
+- full:       デバッグ用。これまでどおり全リソースを読み込む 1920x1080 の Chrome (毎回新しいプロファイル)
+- screenshot: 画面の記録用。全リソースを読み込み、スクロールバーなし・倍率 1 で撮影サイズを揃える
+"""
+import os
+import logging
+import weakref
+
+try:
+    import fcntl
+except ImportError:  # Windows では user-data-dir の排他をプロセス ID で代用する
+    fcntl = None
+
+from src.fingerprints import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+# --- 設定定数 ---
+BROWSER_PROFILE = os.getenv("BROWSER_PROFILE", "lean")
+HEADLESS = os.getenv("BROWSER_HEADLESS", "1") == "1"  # 0 にするとブラウザを表示する (デバッグ用)
+# lean の永続 user-data-dir の置き場所 (Chrome 1台ごとに profile-<番号> を使う)
+BROWSER_DATA_DIR = os.getenv("BROWSER_DATA_DIR", os.path.join(CACHE_DIR, "chrome"))
+DISK_CACHE_MB = int(os.getenv("BROWSER_DISK_CACHE_MB", "256"))
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+# lean で読み込まないリソース (Network.setBlockedURLs のワイルドカード)。JS と XHR は対象外。
+# CSS も読み込む (表示・非表示が変わり、getClientRects での可視判定やアコーディオンの操作が狂うため)
+BLOCKED_URL_PATTERNS = (
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico", "*.bmp",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*.mp4", "*.webm", "*.mp3",
+)
+# CDP が使えない場合にも効くよう、画像などは Chrome の設定でも止めておく
+BLOCKING_PREFS = {
+    "profile.managed_default_content_settings.images": 2,
+    "profile.default_content_setting_values.notifications": 2,
+    "profile.default_content_setting_values.media_stream": 2,
+}
+
+
+class BrowserProfile:
+    """Chrome 1台分の起動設定"""
+
+    def __init__(self, name, window_size=(1920, 1080), page_load_strategy="normal",
+                 block_resources=False, persistent=False, extra_args=()):
+        self.name = name
+        self.window_size = window_size
+        self.page_load_strategy = page_load_strategy
+        self.block_resources = block_resources
+        self.persistent = persistent
+        self.extra_args = tuple(extra_args)
+
+    def __repr__(self):
+        return f"BrowserProfile({self.name!r})"
+
+
+PROFILES = {
+    "lean": BrowserProfile("lean", window_size=(1280, 900), page_load_strategy="eager",
+                           block_resources=True, persistent=True,
+                           extra_args=("--disable-extensions", "--mute-audio", "--blink-settings=imagesEnabled=false")),
+    "full": BrowserProfile("full"),
+    "screenshot": BrowserProfile("screenshot", extra_args=("--hide-scrollbars", "--force-device-scale-factor=1")),
+}
+
+
+def get_profile(name=None):
+    """名前 (省略時は BROWSER_PROFILE) のプロファイル。未知の名前は ValueError"""
+    name = name or BROWSER_PROFILE
+    if isinstance(name, BrowserProfile):
+        return name
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(f"不明なブラウザプロファイルです: {name} (選択肢: {', '.join(PROFILES)})") from None
+
+
+class _DataDirSlot:
+    """使用中の user-data-dir。ロックは Driver の quit() (または release()) で外れる"""
+
+    def __init__(self, path, lock_file=None):
+        self.path = path
+        self._lock_file = lock_file
+
+    def release(self):
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+
+def claim_data_dir(profile, root=None):
+    """
+    profile 用の永続 user-data-dir を1つ確保する。同じディレクトリを2台の Chrome で
+    同時に使えないので、空いている profile-<番号> をロックファイルで排他して選ぶ
+    (番号は起動のたびに同じものが選ばれやすく、HTTP キャッシュがそのまま使われる)。
+    """
+    root = os.path.join(root or BROWSER_DATA_DIR, profile.name)
+    os.makedirs(root, exist_ok=True)
+    if fcntl is None:
+        return _DataDirSlot(os.path.join(root, f"profile-{os.getpid()}"))
+
+    index = 0
+    while True:
+        lock_file = open(os.path.join(root, f"profile-{index}.lock"), "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            index += 1
+            continue
+        return _DataDirSlot(os.path.join(root, f"profile-{index}"), lock_file)
+
+
+def configure_options(options, profile=None):
+    """
+    Chrome のオプションに profile の設定を追加する。
+    永続 user-data-dir を使う場合はその確保分 (start_profile に渡す) を、それ以外は None を返す。
+    """
+    profile = get_profile(profile)
+    width, height = profile.window_size
+    if HEADLESS:
+        options.add_argument("--headless")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--disable-gpu")
+    options.add_argument(f"--window-size={width},{height}")
+    options.add_argument(f"user-agent={USER_AGENT}")
+    for arg in profile.extra_args:
+        options.add_argument(arg)
+    options.page_load_strategy = profile.page_load_strategy
+    if profile.block_resources:
+        options.add_experimental_option("prefs", dict(BLOCKING_PREFS))
+
+    slot = None
+    if profile.persistent:
+        slot = claim_data_dir(profile)
+        options.add_argument(f"--user-data-dir={slot.path}")
+        options.add_argument(f"--disk-cache-size={DISK_CACHE_MB * 1024 * 1024}")
+    return slot
+
+
+def start_profile(driver, profile=None, slot=None):
+    """
+    起動直後の Driver に CDP の URL ブロックを設定し、user-data-dir のロックを Driver の quit() で外すようにする
+    (quit されないまま破棄された場合も、ガベージコレクションの時点で外す)。
+    """
+    profile = get_profile(profile)
+    if slot is not None:
+        quit = driver.quit
+
+        def quit_and_release():
+            try:
+                quit()
+            finally:
+                slot.release()
+
+        driver.quit = quit_and_release
+        weakref.finalize(driver, slot.release)
+    if profile.block_resources:
+        try:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": list(BLOCKED_URL_PATTERNS)})
+        except Exception as e:
+            logger.warning(f"CDP の URL ブロックに失敗しました (prefs の設定のみ有効): {e}")
+    return driver
@@ -0,0 +1,77 @@
+import os
+import json
+import time
+import logging
+import threading
+
+from src.fingerprints import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+# --- 設定定数 ---
+CATALOG_PATH = os.path.join(CACHE_DIR, "catalog.json")
+# 施設・室場の一覧はめったに変わらないので、この期間は検索・展開をせずに保存済みの行き先を使う
+CATALOG_TTL = int(os.getenv("CATALOG_TTL", str(7 * 24 * 3600)))
+
+
+class Catalog:
+    """
+    施設 → 室場 → 詳細ページへの行き方の保存。検索・「室場一覧」の展開・体育室の行と「確認」ボタンの
+    探索 (discovery) の結果を source (取得方式と検索条件) ごとに保存し、TTL 以内なら次回はそのまま詳細ページへ移動する。
+
+    各エントリは {"facility", "room", "url", "recipe"}。url が取れない (JavaScript のボタンなど) 場合は
+    recipe に一覧からの操作手順 (何番目の「室場一覧」か) を残す。
+    行き先で目的のページが開けなかったときは invalidate() して、次回の取得で discovery からやり直す。
+    """
+
+    def __init__(self, path=CATALOG_PATH, ttl=CATALOG_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._sources = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def get(self, source):
+        """source の保存済みエントリ。無いか TTL を過ぎていれば None"""
+        with self._lock:
+            saved = self._sources.get(source)
+            if not saved or time.time() - saved["discovered_at"] >= self.ttl:
+                return None
+            return [dict(entry) for entry in saved["entries"]]
+
+    def put(self, source, entries):
+        with self._lock:
+            self._sources[source] = {
+                "discovered_at": time.time(),
+                "entries": [dict(entry) for entry in entries],
+            }
+        self._save()
+
+    def invalidate(self, source=None):
+        """source の指定が無ければ全件を破棄する (次回の取得で一覧を探し直す)"""
+        with self._lock:
+            if source is None:
+                self._sources.clear()
+            else:
+                self._sources.pop(source, None)
+        self._save()
+
+    def _save(self):
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                tmp = f"{self.path}.{os.getpid()}.tmp"  # 別プロセス (分散ワーカー) と一時ファイルを共有しない
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(self._sources, f, ensure_ascii=False)
+                os.replace(tmp, self.path)
+            except OSError as e:
+                logger.warning(f"施設カタログの保存に失敗しました: {e}")
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self._sources = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"施設カタログの読み込みに失敗しました。施設を探し直します: {e}")
@@ -1,38 +1,125 @@
+import html
+import math
+
+import pandas as pd
 import streamlit as st
 
-def render_schedule_card(row):
+# 1ページに並べるカードの枚数
+PAGE_SIZE = 24
+
+_BADGE_COLORS = {"土": "#1c63d5", "日": "#d52c1c", "祝": "#d52c1c"}
+_STATUS_STYLES = {
+    "○": ("空", "#15803d", "rgba(0, 128, 0, 0.08)"),
+    "△": ("少", "#b45309", "rgba(255, 165, 0, 0.10)"),
+}
+_FULL_STYLE = ("満", "#6b7280", "rgba(128, 128, 128, 0.08)")
+
+_GRID_CSS = (
+    "<style>"
+    ".slot-grid{display:grid;grid-template-columns:repeat(auto-fill,minmax(240px,1fr));gap:.6rem;margin:.5rem 0;}"
+    ".slot-card{display:flex;gap:.8rem;align-items:center;border:1px solid rgba(128,128,128,.35);"
+    "border-radius:.5rem;padding:.6rem .8rem;}"
+    ".slot-card .st{font-size:1.8em;line-height:1;text-align:center;min-width:2.2rem;}"
+    ".slot-card .st small{display:block;font-size:.45em;margin-top:.2rem;}"
+    ".slot-card .dt{font-weight:600;}"
+    ".slot-card .wd{color:#fff;border-radius:.25rem;padding:0 .3rem;margin-left:.3rem;font-size:.8em;}"
+    ".slot-card .fac{font-size:.9em;}"
+    ".slot-card .tm{font-size:.8em;opacity:.7;}"
+    "</style>"
+)
+
+
+def schedule_card_html(row):
+    """
+    1件の予約データをカード1枚分の HTML にする (row は '状況' '日付' '曜日' '施設名' '室場名' '時間' を持つ)
     """
-    1件の予約データをスマホで見やすいカード形式で描画する
+    status = str(row.get('状況', ''))
+    status_label, color, bg_color = _STATUS_STYLES.get(status, _FULL_STYLE)
+    day_label = str(row.get('曜日') or '不明')
+    badge_color = _BADGE_COLORS.get(day_label, "#6b7280")
+    facility = f"{row.get('施設名', '不明')} {row.get('室場名', '')}".strip()
+    return (
+        f"<div class='slot-card' style='border-left:4px solid {color};background:{bg_color}'>"
+        f"<div class='st' style='color:{color}'>{html.escape(status)}<small>{status_label}</small></div>"
+        f"<div><div class='dt'>{html.escape(str(row.get('日付', '')))}"
+        f"<span class='wd' style='background:{badge_color}'>{html.escape(day_label)}</span></div>"
+        f"<div class='fac'>{html.escape(facility)}</div>"
+        f"<div class='tm'>{html.escape(str(row.get('時間', '')))}</div></div>"
+        f"</div>"
+    )
+
+
+def card_grid_html(df):
+    """DataFrame の全行をカードのグリッド1つ分の HTML にする"""
+    cards = "".join(schedule_card_html(row) for row in df.to_dict("records"))
+    return f"{_GRID_CSS}<div class='slot-grid'>{cards}</div>"
+
+
+def render_card_grid(df, container=None):
+    """カードのグリッドを1つの要素として描画する (行ごとに要素を作らない)"""
+    (container or st).markdown(card_grid_html(df), unsafe_allow_html=True)
+
+
+def render_paginated_results(df, key="results", page_size=PAGE_SIZE, table_columns=None):
     """
-    status = row['状況']
-    
-    # ステータスに応じた色設定
-    if status == "○":
-        border_color = "green"
-        bg_color = "rgba(0, 128, 0, 0.1)"
-        icon = "🟢"
-    elif status == "△":
-        border_color = "orange"
-        bg_color = "rgba(255, 165, 0, 0.1)"
-        icon = "BW" # Warning icon placeholder
-        icon = "🟡"
-    else:
-        border_color = "gray"
-        bg_color = "rgba(128, 128, 128, 0.1)"
-        icon = "🔴"
-
-    # コンテナでカード風表示
-    # Streamlit 1.31+ の st.container(border=True) を使用
-    with st.container(border=True):
-        col1, col2 = st.columns([1, 4])
-        
-        with col1:
-            st.markdown(f"<div style='text-align: center; font-size: 2em; line-height: 1.5;'>{status}</div>", unsafe_allow_html=True)
-        
-        with col2:
-            st.caption(f"{row['日付']} ({get_weekday_ja(row['weekday'])})")
-            st.markdown(f"**{row['時間']}**")
-            st.text(row['施設名'])
+    検索結果をページ単位で描画する。描画するのは現在のページの page_size 件だけなので、
+    該当件数が増えても再実行のたびの描画コストは変わらない。
+    一覧表は st.dataframe (スクロールする範囲だけを描画する) で全件を表示する。
+    """
+    total = len(df)
+    pages = max(1, math.ceil(total / page_size))
+    page_key = f"{key}_page"
+    # 件数が変わったら (再取得・絞り込みの変更) 1ページ目に戻す
+    if st.session_state.get(f"{key}_total") != total:
+        st.session_state[f"{key}_total"] = total
+        st.session_state[page_key] = 1
+    page = min(max(1, st.session_state.get(page_key, 1)), pages)
+    st.session_state[page_key] = page
+
+    with st.expander("全体の表を見る"):
+        st.dataframe(df[table_columns] if table_columns else df, hide_index=True)
+
+    start = (page - 1) * page_size
+    end = min(start + page_size, total)
+    render_card_grid(df.iloc[start:end])
+
+    if pages > 1:
+        prev_col, info_col, next_col = st.columns([1, 2, 1])
+        prev_col.button("◀ 前へ", key=f"{key}_prev", disabled=page <= 1, use_container_width=True,
+                        on_click=_set_page, args=(page_key, page - 1))
+        info_col.markdown(f"<div style='text-align:center'>{page} / {pages} ページ ({start + 1}〜{end}件 / 全{total}件)</div>",
+                          unsafe_allow_html=True)
+        next_col.button("次へ ▶", key=f"{key}_next", disabled=page >= pages, use_container_width=True,
+                        on_click=_set_page, args=(page_key, page + 1))
+
+
+def _set_page(page_key, page):
+    st.session_state[page_key] = page
+
+
+def render_timing_summary(scan, phase_names=None):
+    """
+    取得1回分の処理時間の内訳 (src.spans.ScanTrace) をフェーズごと・施設ごとの表で描画する
+    """
+    phase_names = phase_names or {}
+    rows = scan.summary()
+    st.caption(f"{scan.backend} / 合計 {scan.seconds:.1f}秒 / {sum(r['count'] for r in rows)}スパン"
+               + ("" if scan.ok else " (失敗)"))
+    if not rows:
+        return
+    st.dataframe(pd.DataFrame([{
+        "フェーズ": phase_names.get(r["phase"], r["phase"]),
+        "回数": r["count"],
+        "失敗": r["failed"],
+        "合計[秒]": round(r["total"], 2),
+        "平均[秒]": round(r["mean"], 3),
+        "最大[秒]": round(r["max"], 2),
+        "割合": f"{r['share']:.0%}",
+    } for r in rows]), hide_index=True)
+    facilities = scan.by_facility()
+    if facilities:
+        st.dataframe(pd.DataFrame(facilities, columns=["施設名", "合計[秒]"]).round(2), hide_index=True)
+
 
 def get_weekday_ja(weekday_num):
     weekdays = ["月", "火", "水", "木", "金", "土", "日"]
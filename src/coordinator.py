@@ -0,0 +1,362 @@
+"""
+詳細巡回 (src.deep_scan.iter_availability_deep_scan) を (施設, 期間) の作業単位に分けて、複数のワーカープロセスで取得する。
+
+    python -m src.coordinator scan --start 2026-10-18 --end 2027-01-18 --workers 3 --csv result.csv
+    python -m src.coordinator worker                                      # 同じマシンで別に起動するワーカー
+
+コーディネーターは作業単位を WorkQueue (SQLite) に置き、ワーカーはそれぞれ自分の Chrome で
+作業単位を借りて取得した行を書き戻す。コーディネーターは完了した作業単位の行を順に
+SlotTable にまとめ、最後に従来と同じ列の DataFrame にする。
+- 施設カタログ (src.catalog) が新しければ最初から (施設, 期間) の作業単位を置き、
+  無ければ探索 (discover) の作業単位を1つ置いて、それを借りたワーカーが施設ごとの作業単位を追加する
+  (期間の分け方は探索の作業単位の target に window_days として持たせる)
+- キューは SQLite の WAL モードなので、ワーカーはコーディネーターと同じマシンで動かす (ネットワーク越しの共有ファイルでは使えない)
+- ワーカーは借りている間リースを延長し続ける。落ちたワーカーの作業単位はリースが切れると他のワーカーに渡る
+- 失敗した作業単位が1つでもあれば、スキャンは ShardScanError になる (一部だけの結果を完全な結果として扱わない)
+"""
+import os
+import sys
+import time
+import uuid
+import signal
+import socket
+import logging
+import datetime
+import threading
+import subprocess
+
+import pandas as pd
+
+from src import deep_scan
+from src.catalog import Catalog
+from src.driver_pool import DriverPool
+from src.slots import SlotTable, RESULT_COLUMNS
+from src.spans import SPANS
+from src.work_queue import WORK_QUEUE_PATH, WorkQueue
+
+logger = logging.getLogger(__name__)
+
+# --- 設定定数 ---
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", "2"))         # コーディネーターが起動するローカルのワーカー数
+SHARD_WINDOW_DAYS = int(os.getenv("SHARD_WINDOW_DAYS", "14"))  # 1つの作業単位で取得する期間 [日]
+DEFAULT_HORIZON_DAYS = 90   # end_date の指定が無いときに取得する期間 [日]
+POLL_INTERVAL = 1.0         # コーディネーターがキューを確認する間隔 [秒]
+IDLE_EXIT_SECONDS = 30      # --scan を指定しないワーカーは、これだけ作業単位が無ければ終了する (0 で終了しない)
+WORKER_STOP_TIMEOUT = 30    # SIGTERM を送ってから、現在の作業単位を終えて Chrome を閉じるまで待つ時間 [秒]
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def date_windows(start_date, end_date, days=SHARD_WINDOW_DAYS):
+    """start_date〜end_date を days 日ずつの (開始日, 終了日) に分ける"""
+    start_date = start_date or datetime.date.today()
+    end_date = end_date or start_date + datetime.timedelta(days=DEFAULT_HORIZON_DAYS)
+    windows = []
+    cursor = start_date
+    while cursor <= end_date:
+        last = min(cursor + datetime.timedelta(days=days - 1), end_date)
+        windows.append((cursor, last))
+        cursor = last + datetime.timedelta(days=1)
+    return windows
+
+
+def plan_units(targets, start_date, end_date, days=SHARD_WINDOW_DAYS):
+    """施設 (Catalog のエントリ) ごと・期間ごとの取得単位"""
+    return [{"kind": "visit", "facility": target["facility"], "target": target, "start_date": s, "end_date": e}
+            for target in targets for s, e in date_windows(start_date, end_date, days)]
+
+
+class ShardScanError(RuntimeError):
+    """失敗した作業単位があるスキャン。failures に WorkQueue.failures() の内容を持つ"""
+
+    def __init__(self, message, failures):
+        super().__init__(message)
+        self.failures = failures
+
+
+class Coordinator:
+    """スキャンを作業単位に分けてキューに置き、完了した作業単位の行をまとめる"""
+
+    def __init__(self, queue=None, window_days=SHARD_WINDOW_DAYS, poll_interval=POLL_INTERVAL, catalog_source=None):
+        self.queue = queue or WorkQueue()
+        self.window_days = window_days
+        self.poll_interval = poll_interval
+        self.catalog_source = catalog_source or deep_scan.CATALOG_SOURCE
+
+    def submit(self, start_date=None, end_date=None, incremental=True):
+        """スキャンを登録して scan_id を返す"""
+        scan_id = self.queue.create_scan(start_date, end_date, incremental)
+        targets = Catalog().get(self.catalog_source)
+        if targets:
+            units = plan_units(targets, start_date, end_date, self.window_days)
+        else:
+            units = [{"kind": "discover", "target": {"window_days": self.window_days},
+                      "start_date": start_date, "end_date": end_date}]
+        self.queue.add_units(scan_id, units)
+        logger.info(f"スキャン {scan_id}: 作業単位 {len(units)} 件を登録しました。")
+        return scan_id
+
+    def iter_results(self, scan_id, _status_callback=None, _progress_bar=None, timeout=None, workers=None):
+        """
+        完了した作業単位ごとに、まだ返していない行の SlotTable を返す。
+        全作業単位が done / failed になったら終わり、failed の作業単位があれば ShardScanError を送出する。
+        workers (LocalWorkers) を渡すと、途中で落ちたローカルのワーカーを起動し直す。
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        merged = SlotTable()
+        seen = set()
+        while True:
+            # 先に進捗を見てから完了分を読むので、終わったと判断した時点の完了分は必ず読み終えている
+            counts = self.queue.progress(scan_id)
+            for unit_id, facility, rows in self.queue.done_units(scan_id, seen):
+                seen.add(unit_id)
+                if _status_callback: _status_callback(f"📦 取得済み: {facility} ({len(rows)} 件)")
+                yield merged.merge(rows)
+
+            total = sum(counts.values())
+            if _progress_bar and total: _progress_bar.progress((counts["done"] + counts["failed"]) / total)
+            if counts["pending"] == 0 and counts["leased"] == 0:
+                break
+            if deadline is not None and time.time() > deadline:
+                raise TimeoutError(f"スキャン {scan_id} が時間内に終わりませんでした: {counts}")
+            if workers is not None:
+                workers.revive()
+            time.sleep(self.poll_interval)
+
+        failures = self.queue.failures(scan_id)
+        for failure in failures:
+            logger.warning(f"取得できなかった作業単位: {failure}")
+        if failures:
+            raise ShardScanError(f"スキャン {scan_id} の作業単位 {len(failures)}/{len(failures) + len(seen)} 件が失敗しました: "
+                                 f"{failures[0]['error']}", failures)
+
+    def iter_scan(self, start_date=None, end_date=None, _status_callback=None, _progress_bar=None,
+                  incremental=True, workers=SHARD_WORKERS, timeout=None):
+        """submit してローカルのワーカーを workers 個起動し、iter_results の SlotTable を返す"""
+        scan_id = self.submit(start_date, end_date, incremental)
+        if _status_callback: _status_callback(f"🧩 作業単位を {workers} 個のワーカーで分担して取得します...")
+        local = LocalWorkers(self.queue.path, scan_id, workers)
+        try:
+            yield from self.iter_results(scan_id, _status_callback, _progress_bar, timeout, local)
+        finally:
+            local.stop()
+
+    def fetch(self, start_date=None, end_date=None, _status_callback=None, _progress_bar=None,
+              incremental=True, workers=SHARD_WORKERS, timeout=None):
+        """iter_scan の結果をまとめた DataFrame (fetch_availability_deep_scan と同じ列)"""
+        results = SlotTable()
+        for batch in self.iter_scan(start_date, end_date, _status_callback, _progress_bar, incremental, workers, timeout):
+            results.extend(batch)
+        if not results:
+            return pd.DataFrame(columns=RESULT_COLUMNS)
+        return results.to_frame()
+
+
+class LocalWorkers:
+    """このマシンで起動するワーカープロセス (python -m src.coordinator worker --scan ...)"""
+
+    def __init__(self, queue_path, scan_id, count):
+        self.queue_path = os.path.abspath(queue_path)
+        self.scan_id = scan_id
+        self.count = count
+        self.restarts_left = count * 3
+        self._procs = [self._spawn(i) for i in range(count)]
+
+    def revive(self):
+        """異常終了したワーカーを起動し直す (作業単位はリース切れで他のワーカーに渡る)"""
+        for i, proc in enumerate(self._procs):
+            code = proc.poll()
+            if code not in (None, 0) and self.restarts_left > 0:
+                logger.warning(f"ワーカー {i} が終了コード {code} で終了しました。起動し直します。")
+                self.restarts_left -= 1
+                self._procs[i] = self._spawn(i)
+
+    def stop(self, timeout=WORKER_STOP_TIMEOUT):
+        """SIGTERM で現在の作業単位を終えてから止まるよう伝え、timeout 秒待っても終わらなければ強制終了する"""
+        for proc in self._procs:
+            if proc.poll() is None:
+                proc.terminate()
+        for proc in self._procs:
+            try:
+                proc.wait(timeout)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    def _spawn(self, index):
+        cmd = [sys.executable, "-m", "src.coordinator", "worker", "--queue", self.queue_path, "--scan", self.scan_id,
+               "--id", f"{socket.gethostname()}-{os.getpid()}-{index}-{uuid.uuid4().hex[:4]}"]
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(p for p in (_PROJECT_ROOT, env.get("PYTHONPATH")) if p)
+        return subprocess.Popen(cmd, env=env)
+
+
+class Worker:
+    """
+    キューから作業単位を借りて取得し、結果を書き戻す (1プロセスに1つ、Chrome 1台)。
+    Chrome は pool (省略時は最初の作業単位で起動する専用の DriverPool) から借り、
+    自分で起動したものは run() の終わりに閉じる。SIGINT/SIGTERM では現在の作業単位を終えてから止まる。
+    """
+
+    def __init__(self, queue=None, worker_id=None, scan_id=None, idle_exit=IDLE_EXIT_SECONDS, pool=None):
+        self.queue = queue or WorkQueue()
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.scan_id = scan_id
+        self.idle_exit = idle_exit
+        self._pool = pool
+        self._owns_pool = pool is None
+        self._stop = threading.Event()
+
+    def install_signal_handlers(self):
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, self._on_signal)
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = DriverPool(deep_scan.setup_driver, size=1, warm_url=deep_scan.TARGET_URL)
+        return self._pool
+
+    def close(self):
+        """自分で起動した Chrome を閉じる"""
+        if self._owns_pool and self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+    def run(self, max_units=None):
+        """
+        作業単位が無くなるまで (scan_id 指定時はそのスキャンが終わるまで、
+        指定が無ければ idle_exit 秒作業単位が無いまで) 取得を続ける。処理した数を返す。
+        """
+        processed = 0
+        idle_since = time.time()
+        try:
+            while not self._stop.is_set() and (max_units is None or processed < max_units):
+                unit = self.queue.claim(self.worker_id, self.scan_id)
+                if unit is None:
+                    if self.scan_id and self.queue.finished(self.scan_id):
+                        break
+                    if not self.scan_id and self.idle_exit and time.time() - idle_since > self.idle_exit:
+                        break
+                    self._stop.wait(POLL_INTERVAL)
+                    continue
+                self.process(unit)
+                processed += 1
+                idle_since = time.time()
+        finally:
+            self.close()
+        return processed
+
+    def process(self, unit):
+        """1つの作業単位を取得して complete / fail する。借りている間はリースを延長し続ける"""
+        label = unit["facility"] or "施設の探索"
+        logger.info(f"[{self.worker_id}] {label} {unit['start_date']}〜{unit['end_date']} (試行 {unit['attempts']})")
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(unit["id"], done), daemon=True)
+        heartbeat.start()
+        scan = SPANS.begin_scan("shard")
+        tracer = SPANS.tracer(scan, worker=self.worker_id, attempt=unit["attempts"])
+        ok = False
+        try:
+            if unit["kind"] == "discover":
+                rows, new_units = [], self._discover(unit, tracer)
+            else:
+                rows, new_units = self._visit(unit, tracer), []
+            ok = True
+        except Exception as e:
+            logger.error(f"[{self.worker_id}] {label} の取得に失敗しました: {e}")
+            self.queue.fail(unit["id"], self.worker_id, e)
+        finally:
+            done.set()
+            heartbeat.join()
+            SPANS.end_scan(scan, ok)
+        if ok and not self.queue.complete(unit["id"], self.worker_id, rows, new_units):
+            logger.warning(f"[{self.worker_id}] {label}: リースが切れて他のワーカーに渡ったため、結果を破棄しました。")
+
+    def _heartbeat(self, unit_id, done):
+        interval = max(1.0, self.queue.lease_seconds / 3)
+        while not done.wait(interval):
+            if not self.queue.renew(unit_id, self.worker_id):
+                logger.warning(f"[{self.worker_id}] 作業単位 {unit_id} のリースを延長できませんでした。")
+                return
+
+    def _discover(self, unit, tracer):
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        start_date = _date(unit["start_date"])
+        pool = self.pool
+        with tracer.span("driver_startup"):
+            driver = pool.acquire()
+        failed = True
+        try:
+            targets = deep_scan.discover_gym_targets(driver, WebDriverWait(driver, 30), start_date, tracer=tracer)
+            failed = False
+        finally:
+            pool.release(driver, discard=failed)
+        if not targets:
+            raise RuntimeError("体育室のある施設が見つかりませんでした")
+        Catalog().put(deep_scan.CATALOG_SOURCE, targets)
+        window_days = (unit["target"] or {}).get("window_days", SHARD_WINDOW_DAYS)
+        return plan_units(targets, start_date, _date(unit["end_date"]), window_days)
+
+    def _visit(self, unit, tracer):
+        rows = SlotTable()
+        for batch in deep_scan.iter_availability_deep_scan(_date(unit["start_date"]), _date(unit["end_date"]),
+                                                           incremental=unit["incremental"], tracer=tracer,
+                                                           tabs=1, targets=[unit["target"]], pool=self.pool):
+            rows.extend(batch)
+        return list(rows)
+
+    def _on_signal(self, signum, frame):
+        logger.info(f"[{self.worker_id}] シグナル {signum} を受信しました。現在の作業単位を終えて停止します...")
+        self.stop()
+
+
+def _date(value):
+    return datetime.date.fromisoformat(value) if value else None
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="詳細巡回を複数のワーカーで分担する")
+    sub = parser.add_subparsers(dest="command", required=True)
+    scan_parser = sub.add_parser("scan", help="作業単位を登録し、ローカルのワーカーを起動して結果をまとめる")
+    scan_parser.add_argument("--start", type=datetime.date.fromisoformat, default=datetime.date.today())
+    scan_parser.add_argument("--end", type=datetime.date.fromisoformat, default=None)
+    scan_parser.add_argument("--workers", type=int, default=SHARD_WORKERS, help="0 なら別に起動したワーカーに任せる")
+    scan_parser.add_argument("--window-days", type=int, default=SHARD_WINDOW_DAYS)
+    scan_parser.add_argument("--timeout", type=float, default=None)
+    scan_parser.add_argument("--csv", help="結果を保存するファイル")
+    worker_parser = sub.add_parser("worker", help="キューの作業単位を取得し続ける")
+    worker_parser.add_argument("--scan", help="このスキャンが終わったら終了する")
+    worker_parser.add_argument("--id", help="ワーカー名 (既定: ホスト名-PID)")
+    worker_parser.add_argument("--idle-exit", type=float, default=IDLE_EXIT_SECONDS,
+                               help="--scan が無いとき、これだけ作業単位が無ければ終了する [秒] (0 で終了しない)")
+    for p in (scan_parser, worker_parser):
+        p.add_argument("--queue", default=WORK_QUEUE_PATH, help="キューの SQLite ファイル")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    queue = WorkQueue(args.queue)
+    if args.command == "worker":
+        worker = Worker(queue, args.id, args.scan, args.idle_exit)
+        worker.install_signal_handlers()
+        print(f"{worker.worker_id}: {worker.run()} 件の作業単位を処理しました")
+        return 0
+
+    coordinator = Coordinator(queue, args.window_days)
+    try:
+        df = coordinator.fetch(args.start, args.end, workers=args.workers, timeout=args.timeout)
+    except ShardScanError as e:
+        logger.error(str(e))
+        return 1
+    print(f"{len(df)} 件 ({df['施設名'].nunique() if not df.empty else 0} 施設)")
+    if args.csv:
+        df.to_csv(args.csv, index=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,841 @@
+"""
+ブラウザ (Selenium) による詳細巡回。
+
+    for batch in iter_availability_deep_scan(start_date, end_date):   # 施設ごとの SlotTable
+        ...
+
+施設検索 → 「室場一覧」の展開 → 体育室の詳細ページ → カレンダーの深掘り、の順に空き状況を集める。
+ダッシュボード (app.py) と分散取得のワーカー (src.coordinator) の両方から使うので、
+Streamlit には依存しない (Driver のプールもプロセス内で1つを共有する)。
+"""
+import os
+import re
+import atexit
+import logging
+import datetime
+import threading
+
+import pandas as pd
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+
+from src import netcapture, browser_profiles
+from src.driver_pool import DriverPool
+from src.waits import WAITS
+from src.table_parser import fetch_candidate_tables, fetch_all_table_fragments
+from src.fingerprints import FingerprintStore, fingerprint, make_key
+from src.jp_calendar import is_weekend_or_holiday
+from src.slots import SlotTable
+from src.spans import SPANS
+from src.catalog import Catalog
+
+logger = logging.getLogger(__name__)
+
+# --- 設定定数 ---
+# Direct Facility Search URL (Video Flow)。PORTAL_BASE_URL でフィクスチャサイトなどに向け先を変えられる
+PORTAL_BASE_URL = os.getenv("PORTAL_BASE_URL", "https://fujisawacity.service-now.com").rstrip("/")
+TARGET_URL = f"{PORTAL_BASE_URL}/facilities_reservation?id=facility_search&tab=1"
+CATALOG_SOURCE = make_key("deep_scan", TARGET_URL)  # 施設カタログ (src.catalog) での詳細巡回のキー
+
+# 詳細ページを同時に読み込むタブ数 (1 なら1ページずつ順に開く)
+DEEP_SCAN_TABS = int(os.getenv("DEEP_SCAN_TABS", "1"))
+# 月間カレンダーで end_date まで「翌月」へ進む月数の上限 (表示中の月を含む)
+CALENDAR_MAX_MONTHS = int(os.getenv("CALENDAR_MAX_MONTHS", "6"))
+
+
+def setup_driver(profile=None):
+    """Chrome Driver の起動。profile はブラウザプロファイル名 (省略時は BROWSER_PROFILE、src.browser_profiles 参照)"""
+    options = Options()
+    slot = browser_profiles.configure_options(options, profile)
+    if netcapture.CAPTURE_NETWORK:
+        netcapture.enable_capture(options)
+
+    try:
+        driver = webdriver.Chrome(options=options)
+        browser_profiles.start_profile(driver, profile, slot)
+        if netcapture.CAPTURE_NETWORK:
+            netcapture.start_capture(driver)
+        return driver
+    except Exception as e:
+        if slot is not None:
+            slot.release()
+        logger.error(f"Chrome Driver起動エラー: {e}")
+        raise e
+
+
+_driver_pool = None
+_driver_pool_lock = threading.Lock()
+
+
+def get_driver_pool():
+    """
+    プロセス内で共有する DriverPool (初回呼び出し時に作成)。
+    ダッシュボードの再実行・セッション・リトライをまたいで、起動済みで TARGET_URL を開いた状態の Chrome を使い回す。
+    """
+    global _driver_pool
+    with _driver_pool_lock:
+        if _driver_pool is None:
+            _driver_pool = DriverPool(setup_driver, size=1, warm_url=TARGET_URL)
+            atexit.register(_driver_pool.close)
+        return _driver_pool
+
+
+def close_driver_pool():
+    """共有の DriverPool を閉じる (次の get_driver_pool() で作り直す。プロファイルの切り替え・ワーカーの終了時用)"""
+    global _driver_pool
+    with _driver_pool_lock:
+        pool, _driver_pool = _driver_pool, None
+    if pool is not None:
+        pool.close()
+
+# target_text ごとに前回見つかったフレームの経路 (トップから辿る iframe の番号の列)。次回はまずこの経路を試す
+_FRAME_PATHS = {}
+
+# 現在の document にテキストがあるかだけを返す (page_source で DOM 全体を転送しない)
+_HAS_TEXT_SCRIPT = "return (document.documentElement.textContent || '').indexOf(arguments[0]) !== -1;"
+
+# トップから同一オリジンの iframe を辿り、テキストを含む document の経路を1回の往復で探す
+_FIND_FRAME_SCRIPT = """
+var text = arguments[0];
+function search(doc, path) {
+    if ((doc.documentElement.textContent || '').indexOf(text) !== -1) return path;
+    var frames = doc.querySelectorAll('iframe');
+    for (var i = 0; i < frames.length; i++) {
+        var sub = null;
+        try { sub = frames[i].contentDocument; } catch (e) {}
+        if (!sub || !sub.documentElement) continue;
+        var found = search(sub, path.concat([i]));
+        if (found) return found;
+    }
+    return null;
+}
+return search(document, []);
+"""
+
+def _frame_has_text(driver, target_text):
+    try:
+        return bool(driver.execute_script(_HAS_TEXT_SCRIPT, target_text))
+    except Exception:
+        return False
+
+def _enter_frame_path(driver, path):
+    """トップに戻ってから path の順に iframe に入る。途中で見つからなければ False"""
+    driver.switch_to.default_content()
+    for idx in path:
+        frames = driver.find_elements(By.TAG_NAME, "iframe")
+        if idx >= len(frames):
+            return False
+        driver.switch_to.frame(frames[idx])
+    return True
+
+def switch_to_target_frame(driver, target_text="市民センター", _status_callback=None):
+    """
+    Switch to the iframe containing the target text.
+    Returns True if found (or already in correct frame), False otherwise.
+    The frame path that matched last time is tried first, and text is probed
+    with a small execute_script instead of reading page_source.
+    """
+    try:
+        # 1. Check current content first
+        if _frame_has_text(driver, target_text):
+             return True
+
+        # 2. Try the frame path that matched last time
+        path = _FRAME_PATHS.get(target_text)
+        if path is not None and _enter_frame_path(driver, path):
+            if _frame_has_text(driver, target_text):
+                return True
+            WAITS.dom_settled(driver, "frame_switch")
+            if _frame_has_text(driver, target_text):
+                return True
+            _FRAME_PATHS.pop(target_text, None)
+
+        # 3. Search same-origin frames from the top in one round trip
+        driver.switch_to.default_content()
+        try:
+            path = driver.execute_script(_FIND_FRAME_SCRIPT, target_text)
+        except Exception:
+            path = None
+        if path is not None and _enter_frame_path(driver, path):
+            _FRAME_PATHS[target_text] = tuple(path)
+            return True
+
+        # 4. Iterate iframes (cross-origin or still loading)
+        driver.switch_to.default_content()
+        frames = driver.find_elements(By.TAG_NAME, "iframe")
+        
+        if not frames:
+             return False
+
+        for i in range(len(frames)):
+            try:
+                driver.switch_to.default_content()
+                current_frames = driver.find_elements(By.TAG_NAME, "iframe")
+                if i >= len(current_frames): break
+                
+                driver.switch_to.frame(current_frames[i])
+                WAITS.dom_settled(driver, "frame_switch")
+                
+                if _frame_has_text(driver, target_text):
+                    _FRAME_PATHS[target_text] = (i,)
+                    return True
+            except Exception as e:
+                continue
+        
+        driver.switch_to.default_content()
+        return False
+        
+    except Exception as e:
+        return False
+
+def scrape_current_schedule_table(driver, results, facility_name, room_name):
+    """
+    Scrape the current schedule table (usually at the bottom) for availability symbols.
+    With CAPTURE_NETWORK, rows are decoded from the schedule widget responses captured
+    since the last click/navigation, and the HTML table is parsed only when none was seen.
+    """
+    if netcapture.CAPTURE_NETWORK:
+        rows = netcapture.capture_schedule_rows(driver, facility_name, room_name)
+        if rows is not None:
+            results.extend(rows)
+            return True
+
+    # Only the candidate tables' outerHTML is pulled from the browser (one execute_script)
+    tables = fetch_candidate_tables(driver)
+    
+    for tbl in tables:
+        txt = tbl.text
+        has_symbols = "○" in txt or "×" in txt or "△" in txt
+        has_imgs = tbl.has_status_img()
+        
+        if not (has_symbols or has_imgs):
+            continue
+            
+        rows = tbl.rows
+        if not rows: continue
+        
+        headers = [cell.text for cell in rows[0]]
+        
+        for cols in rows[1:]:
+            if not cols: continue
+            
+            date_val = cols[0].text
+            
+            for i, td in enumerate(cols[1:]):
+                stat_text = td.text
+                
+                status = "×" # Default closed
+                
+                if "○" in stat_text or "空" in stat_text: status = "○"
+                elif "△" in stat_text: status = "△"
+                elif "×" in stat_text or "満" in stat_text: status = "×"
+                
+                if td.has_img:
+                    alt = td.img_alt
+                    src = td.img_src
+                    if "○" in alt or "circle" in src: status = "○"
+                    elif "△" in alt: status = "△"
+                    elif "×" in alt or "cross" in src: status = "×"
+                
+                t_slot = headers[i+1] if (i+1) < len(headers) else ""
+                
+                if status in ["○", "△"]:
+                    results.append({
+                        "日付": date_val,
+                        "施設名": facility_name,
+                        "室場名": room_name,
+                        "時間": t_slot,
+                        "状況": status
+                    })
+        return True
+    return False
+
+# 月間カレンダーの表 (曜日の見出しがあり、時間帯を含まないもの) を探す関数。下の2つのスクリプトで共有する
+_FIND_CALENDAR_JS = """
+function findCalendar() {
+    var tables = document.querySelectorAll('table');
+    for (var i = 0; i < tables.length; i++) {
+        var t = tables[i].innerText || tables[i].textContent || '';
+        if (t.indexOf('日') !== -1 && t.indexOf('土') !== -1 && t.indexOf('9:') === -1 && t.indexOf('11:') === -1) {
+            return tables[i];
+        }
+    }
+    return null;
+}
+"""
+
+# 日付の入ったセルの [行, 列, 日] と、年月の手がかりになるテキスト (caption か周囲の見出し) を1回で返す
+_CALENDAR_CELLS_SCRIPT = _FIND_CALENDAR_JS + """
+var cal = findCalendar();
+if (!cal) return null;
+var cap = cal.querySelector('caption');
+var context = cap ? cap.innerText : '';
+if (!/\d{4}\s*年\s*\d{1,2}\s*月/.test(context) && cal.parentElement) {
+    context = (cal.parentElement.innerText || '').slice(0, 300);
+}
+var cells = [];
+var rows = cal.querySelectorAll('tr');
+for (var r = 0; r < rows.length; r++) {
+    var tds = rows[r].querySelectorAll('td');
+    for (var c = 0; c < tds.length; c++) {
+        var m = (tds[c].innerText || '').match(/\d+/);
+        if (m) cells.push([r, c, parseInt(m[0], 10)]);
+    }
+}
+return {context: context, cells: cells};
+"""
+
+# [行, 列] のセル (リンクがあればリンク) をクリックする。表示中の週間表に既にその日付があればクリックせず 'covered'
+_CALENDAR_CLICK_SCRIPT = _FIND_CALENDAR_JS + """
+var row = arguments[0], col = arguments[1], labels = arguments[2];
+var cal = findCalendar();
+if (!cal) return 'missing';
+var tables = document.querySelectorAll('table');
+for (var i = 0; i < tables.length; i++) {
+    if (tables[i] === cal) continue;
+    var text = tables[i].innerText || '';
+    for (var j = 0; j < labels.length; j++) {
+        if (new RegExp('(^|\\D)' + labels[j] + '(?!\\d)').test(text)) return 'covered';
+    }
+}
+var tr = cal.querySelectorAll('tr')[row];
+var td = tr ? tr.querySelectorAll('td')[col] : null;
+if (!td) return 'missing';
+var target = td.querySelector('a') || td;
+target.scrollIntoView({block: 'center'});
+target.click();
+return 'clicked';
+"""
+
+# カレンダーの周り (親要素) から「翌月」へ進むリンク・ボタンを探してクリックする。週送りのボタンとは取り違えない
+_CALENDAR_NEXT_MONTH_SCRIPT = _FIND_CALENDAR_JS + """
+var cal = findCalendar();
+if (!cal) return 'missing';
+var scope = cal.parentElement || document;
+var nodes = scope.querySelectorAll('a, button, input[type=button], [role=button]');
+for (var i = 0; i < nodes.length; i++) {
+    var text = (nodes[i].innerText || nodes[i].value || nodes[i].title || nodes[i].getAttribute('aria-label') || '').trim();
+    if (text.indexOf('週') !== -1) continue;
+    if (/翌月|次の月|次月|来月|^(»|›|>>|＞)$/.test(text)) {
+        nodes[i].scrollIntoView({block: 'center'});
+        nodes[i].click();
+        return 'clicked';
+    }
+}
+return 'missing';
+"""
+
+def calendar_cell_dates(cells, context, fallback):
+    """
+    カレンダーのセル [行, 列, 日] に日付を割り当てる。年月は context の「YYYY年M月」、無ければ fallback の月。
+    日付が途中で 1 に戻る場合、戻る前の先頭の大きい日付は前月、月末の後の日付は翌月として扱う。
+    """
+    m = re.search(r"(\d{4})\s*年\s*(\d{1,2})\s*月", context or "")
+    year, month = (int(m.group(1)), int(m.group(2))) if m else (fallback.year, fallback.month)
+    base = year * 12 + month - 1
+    days = [day for _, _, day in cells]
+    wraps = any(b < a for a, b in zip(days, days[1:]))
+    offset = -1 if (days and days[0] > 7 and wraps) else 0
+    prev = None
+    dated = []
+    for row, col, day in cells:
+        if prev is not None and day < prev:
+            offset += 1
+        prev = day
+        y, mo = divmod(base + offset, 12)
+        try:
+            dated.append((row, col, datetime.date(y, mo + 1, day)))
+        except ValueError:
+            continue
+    return dated
+
+def process_month_calendar_clicks(driver, results, facility_name, tracer=None, start_date=None, end_date=None, store=None):
+    """
+    Drill down the MONTHLY calendar: collect every day cell in one execute_script,
+    keep the Saturdays, Sundays and holidays within [start_date, end_date], then click
+    each one (skipping days the weekly table already shows) and scrape the result.
+    When end_date lies past the displayed month, the calendar is moved on with its
+    "next month" control and the same is done for each following month (at most
+    CALENDAR_MAX_MONTHS months). If that control cannot be found, the days left
+    uncovered are logged as a warning.
+    With store (FingerprintStore), each drilled week is fingerprinted on its own and
+    only an unchanged week reuses its stored rows instead of being parsed again.
+    Clicks and parses are timed as calendar_click / parse spans on tracer.
+    """
+    tracer = tracer or SPANS.tracer()
+    month = (start_date or datetime.date.today()).replace(day=1)
+    scraped = {WAITS.table_signature(driver)}
+    for shown in range(CALENDAR_MAX_MONTHS):
+        try:
+            found = driver.execute_script(_CALENDAR_CELLS_SCRIPT)
+        except Exception as e:
+            logger.error(f"Calendar interaction error: {e}")
+            return
+        if not found:
+            return
+
+        dated = calendar_cell_dates(found.get("cells") or [], found.get("context"), month)
+        _click_calendar_days(driver, results, facility_name, tracer, store, scraped, [
+            (row, col, day)
+            for row, col, day in dated
+            if is_weekend_or_holiday(day)
+            and (start_date is None or day >= start_date)
+            and (end_date is None or day <= end_date)
+        ])
+
+        covered = max((day for _, _, day in dated), default=None)
+        if end_date is None or covered is None or covered >= end_date:
+            return
+        if shown == CALENDAR_MAX_MONTHS - 1:
+            break
+        with tracer.span("calendar_click", facility=facility_name):
+            before = WAITS.table_signature(driver)
+            try:
+                outcome = driver.execute_script(_CALENDAR_NEXT_MONTH_SCRIPT)
+            except Exception as e:
+                outcome = f"error ({e})"
+            moved = outcome == "clicked" and (WAITS.table_changed(driver, before, "calendar_month")
+                                              or WAITS.table_signature(driver) != before)
+            if not moved:
+                logger.warning(f"{facility_name}: 月間カレンダーを翌月へ進められませんでした ({outcome})。"
+                               f"{covered + datetime.timedelta(days=1)}〜{end_date} は週間表で取れた分だけになります。")
+                return
+        month = (month + datetime.timedelta(days=32)).replace(day=1)  # 年月の見出しが無いときの手がかり
+    logger.warning(f"{facility_name}: 月間カレンダーは {CALENDAR_MAX_MONTHS} か月分までしか辿りません (〜{end_date})。")
+
+def _click_calendar_days(driver, results, facility_name, tracer, store, scraped, targets):
+    """カレンダーの日付セル targets [(行, 列, 日付)] を順にクリックし、開いた週を解析する (scraped は解析済みの表)"""
+    for row, col, day in targets:
+        try:
+            with tracer.span("calendar_click", facility=facility_name):
+                before = WAITS.table_signature(driver)
+                labels = [f"{day.month}/{day.day}", f"{day.month}月{day.day}日"]
+                if netcapture.CAPTURE_NETWORK:
+                    netcapture.discard_payloads(driver)
+                outcome = driver.execute_script(_CALENDAR_CLICK_SCRIPT, row, col, labels)
+                if outcome != "clicked":
+                    continue
+                WAITS.table_changed(driver, before, "calendar_click")
+                after = WAITS.table_signature(driver)
+            # 同じ週を別の日付から開いた場合は解析しない
+            if after in scraped:
+                continue
+            scraped.add(after)
+            with tracer.span("parse", facility=facility_name):
+                week_key = make_key(facility_name, "体育室", "week", day - datetime.timedelta(days=day.weekday()))
+                digest = fingerprint(fetch_all_table_fragments(driver)) if store else None
+                cached = store.lookup(week_key, digest) if digest else None
+                if cached is not None:
+                    results.extend(cached)
+                else:
+                    n_before = len(results)
+                    scrape_current_schedule_table(driver, results, facility_name, "体育室")
+                    if digest:
+                        store.update(week_key, digest, results[n_before:])
+        except Exception as e:
+            logger.warning(f"Calendar click failed ({day}): {e}")
+            continue
+
+_TOGGLE_XPATH = "//*[contains(text(), '室場一覧') or contains(text(), 'Room List')]"
+
+# 「室場一覧」のトグルをまとめてクリックする (施設ごとの往復をしない)
+_EXPAND_TOGGLES_SCRIPT = """
+arguments[0].forEach(function (t) { t.scrollIntoView({block: 'center'}); t.click(); });
+return arguments[0].length;
+"""
+
+# トグルごとに、見出し・その施設の体育室の行・「確認/予約」ボタンの URL を1回で集める。
+# 体育室の行とボタンは次のトグルより前にあるものだけを、その施設のものとみなす。
+_GYM_TARGETS_SCRIPT = """
+var toggles = arguments[0];
+function first(xpath, node) {
+    return document.evaluate(xpath, node, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+}
+function before(node, limit) {
+    return !limit || !!(node.compareDocumentPosition(limit) & Node.DOCUMENT_POSITION_FOLLOWING);
+}
+var out = [];
+for (var i = 0; i < toggles.length; i++) {
+    var next = toggles[i + 1] || null;
+    var header = first("./preceding::*[self::h3 or self::h4 or contains(@class, 'header')][1]", toggles[i]);
+    var item = {index: i, header: header ? header.innerText : '', gym: false, visible: false, button: false, url: null};
+    var gym = first("./following::*[contains(text(), '体育室')][1]", toggles[i]);
+    if (gym && before(gym, next)) {
+        item.gym = true;
+        item.visible = gym.getClientRects().length > 0;
+        var btn = first("./following::*[contains(text(), '確認') or contains(text(), '予約')][1]", gym);
+        if (btn && before(btn, next)) {
+            item.button = true;
+            var href = btn.href || btn.getAttribute('href') || '';
+            if (href && href.indexOf('javascript') === -1) item.url = href;
+        }
+    }
+    out.push(item);
+}
+return out;
+"""
+
+def facility_name_from_header(text, index):
+    """施設の見出しテキストから施設名を取り出す (見出しが無ければ 施設_<番号>)"""
+    text_content = (text or "").strip().replace('\n', ' ')
+    if not text_content:
+        return f"施設_{index+1}"
+    # Just take the name part if possible
+    fac_name = text_content.split(' ')[0] # Approx
+    if len(fac_name) < 2: fac_name = text_content[:5]
+    return fac_name
+
+def perform_initial_search(driver, start_date=None, _status_callback=None):
+     """Tick the 市民センター checkbox, set the date and press 検索 on the search form"""
+     found = switch_to_target_frame(driver, "市民センター", _status_callback)
+     try:
+         driver.execute_script("document.querySelectorAll('header, .alert, .announcement, #sc_header_top, .navbar, .cookie-banner').forEach(e => e.remove());")
+     except: pass
+
+     js_checkbox_script = """
+         var labels = document.querySelectorAll('label, span');
+         var targetLabel = null;
+         for (var i = 0; i < labels.length; i++) {
+             if (labels[i].innerText.includes('市民センター')) {
+                 targetLabel = labels[i];
+                 break;
+             }
+         }
+         if (targetLabel) {
+             var inp = targetLabel.querySelector('input[type="checkbox"]');
+             if (!inp) {
+                 var prev = targetLabel.previousElementSibling;
+                 if (prev && prev.type === 'checkbox') inp = prev;
+             }
+             if (inp) {
+                 if (!inp.checked) {
+                     inp.click(); 
+                     if (!inp.checked) { inp.checked = true; inp.dispatchEvent(new Event('change', {bubbles: true})); }
+                 }
+                 return true;
+             }
+         }
+         return false;
+     """
+     driver.execute_script(js_checkbox_script)
+     WAITS.dom_settled(driver, "search_form")
+
+     if start_date:
+         fd = start_date.strftime("%Y-%m-%d")
+         driver.execute_script(f"""
+             var dateInp = document.querySelector("input[type='date']");
+             if (dateInp) {{
+                 dateInp.value = '{fd}';
+                 dateInp.dispatchEvent(new Event('change', {{bubbles: true}}));
+             }}
+         """)
+         WAITS.dom_settled(driver, "search_form")
+
+     token = WAITS.document_token(driver)
+     driver.execute_script("""
+         var btns = document.querySelectorAll('button, input[type="button"], a.btn');
+         for (var i = 0; i < btns.length; i++) {
+             if (btns[i].innerText.includes('検索') || btns[i].value === '検索') {
+                 btns[i].click();
+                 return true;
+             }
+         }
+     """)
+     WAITS.action_settled(driver, token, "search_results")
+
+def open_search_results(driver, wait, start_date=None, _status_callback=None):
+    """Load TARGET_URL, run the search and leave the driver in the frame with the facility list"""
+    driver.get(TARGET_URL)
+    WAITS.page_ready(driver, "initial_load")
+    perform_initial_search(driver, start_date, _status_callback)
+
+    try:
+        if _status_callback: _status_callback("⏳ 検索結果リスト待機中...")
+        wait.until(EC.presence_of_element_located((By.XPATH, "//*[contains(text(), '室場') or contains(text(), '一覧') or contains(text(), '市民センター')]")))
+    except:
+        if _status_callback: _status_callback("⚠️ コンテキストロストの可能性。結果フレームを再探索します...")
+        switch_to_target_frame(driver, "室場一覧", _status_callback)
+
+    WAITS.dom_settled(driver, "search_results")
+
+def discover_gym_targets(driver, wait, start_date=None, _status_callback=None, _debug_placeholder=None, tracer=None):
+    """
+    Discovery phase: search once, expand every 室場一覧 accordion in one call and
+    collect every facility's 体育室 detail target in one call.
+    Returns catalog entries {"facility", "room", "url", "recipe"}; when the button has
+    no URL the recipe keeps the toggle index so the visit phase can click through the list.
+    """
+    tracer = tracer or SPANS.tracer()
+    if _status_callback: _status_callback("📡 予約システムにアクセス中...")
+    with tracer.span("initial_search"):
+        open_search_results(driver, wait, start_date, _status_callback)
+    if _debug_placeholder:
+        _debug_placeholder.image(driver.get_screenshot_as_png(), caption="検索結果表示", use_column_width=True)
+
+    with tracer.span("frame_switch"):
+        switch_to_target_frame(driver, "市民センター", None)
+    toggles = driver.find_elements(By.XPATH, _TOGGLE_XPATH)
+    if not toggles:
+        # 検索結果が空なのは画面の読み込み失敗とみなす (空の結果で保存済みの行を消さない)
+        raise RuntimeError("施設一覧が見つかりませんでした。")
+    if _status_callback: _status_callback(f"📍 {len(toggles)} 件の施設候補が見つかりました。室場一覧をまとめて展開します。")
+
+    with tracer.span("accordion", toggles=len(toggles)):
+        token = WAITS.document_token(driver)
+        driver.execute_script(_EXPAND_TOGGLES_SCRIPT, toggles)
+        WAITS.action_settled(driver, token, "accordion")
+        items = driver.execute_script(_GYM_TARGETS_SCRIPT, toggles) or []
+
+        # 展開されなかった (体育室の行が表示されていない) 施設だけもう一度クリックする
+        hidden = [toggles[item["index"]] for item in items if item["gym"] and not item["visible"]]
+        if hidden:
+            token = WAITS.document_token(driver)
+            driver.execute_script(_EXPAND_TOGGLES_SCRIPT, hidden)
+            WAITS.action_settled(driver, token, "accordion")
+            items = driver.execute_script(_GYM_TARGETS_SCRIPT, toggles) or []
+
+    targets = []
+    for item in items:
+        fac_name = facility_name_from_header(item.get("header"), item["index"])
+        if not (item["gym"] and item["visible"] and item["button"]):
+            if item["gym"]:
+                logger.warning(f"  -> {fac_name}: 体育室が見つからないか表示されません。")
+            continue
+        targets.append({"facility": fac_name, "room": "体育室", "url": item["url"],
+                        "recipe": None if item["url"] else {"toggle_index": item["index"]}})
+    if _status_callback: _status_callback(f"🏐 体育室のある施設: {len(targets)} 件")
+    return targets
+
+def open_target_from_list(driver, wait, target, start_date=None):
+    """Open a detail target that has no URL by searching again and clicking through the list"""
+    open_search_results(driver, wait, start_date)
+    switch_to_target_frame(driver, "市民センター", None)
+    index = target["recipe"]["toggle_index"]
+    toggles = driver.find_elements(By.XPATH, _TOGGLE_XPATH)
+    if index >= len(toggles):
+        return False
+    token = WAITS.document_token(driver)
+    driver.execute_script(_EXPAND_TOGGLES_SCRIPT, [toggles[index]])
+    WAITS.action_settled(driver, token, "accordion")
+    gym_row = toggles[index].find_element(By.XPATH, "./following::*[contains(text(), '体育室')][1]")
+    btn = gym_row.find_element(By.XPATH, "./following::*[contains(text(), '確認') or contains(text(), '予約')][1]")
+    token = WAITS.document_token(driver)
+    driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", btn)
+    driver.execute_script("arguments[0].click();", btn)
+    WAITS.action_settled(driver, token, "detail_page")
+    return True
+
+def iter_availability_deep_scan(start_date=None, end_date=None, _status_callback=None, _progress_bar=None, _debug_placeholder=None, attempt_idx=0, incremental=True, tracer=None, tabs=None, targets=None, pool=None):
+    """
+    Streaming version of the deep scan: yields the result rows for each facility
+    as soon as that facility is finished (an empty batch for facilities without
+    slots). Rows are accumulated in a compact SlotTable and each batch is a SlotTable.
+    The pooled driver is returned when the generator is exhausted or closed.
+
+    The crawl has two phases. Discovery (discover_gym_targets) expands every accordion
+    once and collects the gym detail targets; it is skipped while the Catalog is fresh.
+    The visit phase then opens each target directly, `tabs` pages at a time
+    (DEEP_SCAN_TABS), so there is no driver.back() / re-find between facilities.
+    Passing `targets` (catalog entries, e.g. one work unit of src.coordinator) skips
+    discovery and visits only those; a target that does not open raises RuntimeError.
+    The driver is borrowed from `pool` (default: the shared get_driver_pool()).
+    Each phase (driver startup, search, frame switch, accordion, navigation, parse,
+    calendar clicks) is timed as a span on tracer (see src.spans).
+    """
+    tracer = tracer or SPANS.tracer(attempt=attempt_idx + 1)
+    store = FingerprintStore() if incremental else None
+    catalog = Catalog()
+    catalog_source = CATALOG_SOURCE
+    tabs = max(1, int(tabs or DEEP_SCAN_TABS))
+    if netcapture.CAPTURE_NETWORK:
+        # ネットワークログはタブを区別しないので、同時に複数のページを読み込まない
+        tabs = 1
+    pool = pool or get_driver_pool()
+    with tracer.span("driver_startup"):
+        driver = pool.acquire()
+    failed = False
+    wait = WebDriverWait(driver, 30) 
+    results = SlotTable()
+
+    def scrape_detail(fac_name, fac_tracer):
+        """
+        The detail page is open: switch to the 予約状況 frame, set the date and scrape
+        (or reuse the stored rows when the page is unchanged). Returns the new rows,
+        or None when the page has no 予約状況.
+        """
+        with fac_tracer.span("frame_switch"):
+            on_detail = switch_to_target_frame(driver, "予約状況", None)
+        if not on_detail:
+            return None
+
+        # Date-Click Loop
+        if start_date:
+           try:
+               with fac_tracer.span("navigation"):
+                   fd = start_date.strftime("%Y-%m-%d")
+                   if netcapture.CAPTURE_NETWORK:
+                       # 日付を変えた後のスケジュール応答だけを解析する
+                       netcapture.discard_payloads(driver)
+                   driver.execute_script(f"var i=document.querySelector('input[type=date]'); if(i){{i.value='{fd}'; i.dispatchEvent(new Event('change'));}}")
+                   WAITS.dom_settled(driver, "detail_date")
+           except: pass
+
+        # Skip the parse when the landing tables are unchanged since the last run. The landing
+        # page does not show the drilled weeks, so the calendar drill-down always runs and
+        # fingerprints each week page separately.
+        key = make_key(fac_name, "体育室", "landing", start_date, end_date)
+        with fac_tracer.span("parse"):
+            try:
+                digest = fingerprint(fetch_all_table_fragments(driver))
+            except Exception:
+                digest = None
+        cached = store.lookup(key, digest) if (store and digest) else None
+        n_before = len(results)
+
+        if cached is not None:
+            if _status_callback: _status_callback(f"  ♻️ 前回から変更なし。保存済みの {len(cached)} 件を使用します。")
+            results.extend(cached)
+        else:
+            # Scrape
+            with fac_tracer.span("parse"):
+                scrape_current_schedule_table(driver, results, fac_name, "体育室")
+            if store and digest:
+                store.update(key, digest, results[n_before:])
+        process_month_calendar_clicks(driver, results, fac_name, fac_tracer, start_date, end_date, store)
+        return results[n_before:]
+
+    def visit(targets, broken):
+        """Visit phase: yields the rows of each target; targets that did not open are appended to broken"""
+        total = len(targets)
+        main_handle = driver.current_window_handle if tabs > 1 else None
+        # URL のある施設は tabs 件ずつ別タブで同時に読み込み、URL の無い施設は一覧からクリックして開く
+        queue = [(i, t) for i, t in enumerate(targets) if t.get("url")]
+        chunks = [queue[k:k + tabs] for k in range(0, len(queue), tabs)] if tabs > 1 else [[item] for item in queue]
+        chunks += [[(i, t)] for i, t in enumerate(targets) if not t.get("url")]
+
+        for chunk in chunks:
+            if len(chunk) > 1:
+                # 開いた直後に増えたハンドルをその施設のタブとする (window_handles の並び順は開いた順とは限らない)
+                opened = []
+                with tracer.span("navigation", tabs=len(chunk)):
+                    known = set(driver.window_handles)
+                    for i, target in chunk:
+                        try:
+                            driver.execute_script("window.open(arguments[0], '_blank');", target["url"])
+                            new = [h for h in driver.window_handles if h not in known]
+                        except Exception as e:
+                            logger.error(f"  -> {target['facility']}: タブを開けませんでした: {e}")
+                            new = []
+                        known.update(new)
+                        if len(new) == 1:
+                            opened.append(((i, target), new[0]))
+                        else:
+                            # タブが開かなかった (または区別できない) 施設は開けなかったものとして扱う
+                            for handle in new:
+                                try:
+                                    driver.switch_to.window(handle)
+                                    driver.close()
+                                except Exception:
+                                    pass
+                            if new:
+                                driver.switch_to.window(main_handle)
+                            logger.warning(f"  -> {target['facility']}: 詳細ページのタブが開けませんでした。")
+                            broken.append(target)
+            else:
+                opened = [(chunk[0], None)]
+
+            for (i, target), handle in opened:
+                fac_name = target["facility"]
+                fac_tracer = tracer.bind(facility=fac_name, index=i + 1)
+                if _progress_bar: _progress_bar.progress(i / max(total, 1))
+                if _status_callback: _status_callback(f"📍 チェック中 ({i+1}/{total}): {fac_name}")
+                try:
+                    with fac_tracer.span("navigation"):
+                        if netcapture.CAPTURE_NETWORK:
+                            # 前の施設・探索の応答をこの施設の結果に混ぜない
+                            netcapture.discard_payloads(driver)
+                        if handle:
+                            driver.switch_to.window(handle)
+                            WAITS.page_ready(driver, "detail_page")
+                        elif target.get("url"):
+                            driver.get(target["url"])
+                            WAITS.page_ready(driver, "detail_page")
+                        else:
+                            open_target_from_list(driver, wait, target, start_date)
+                    rows = scrape_detail(fac_name, fac_tracer)
+                except Exception as e:
+                    logger.error(f"  -> {fac_name}: {e}")
+                    rows = None
+                finally:
+                    if handle:
+                        try:
+                            driver.close()
+                        finally:
+                            driver.switch_to.window(main_handle)
+
+                if rows is None:
+                    logger.warning(f"  -> {fac_name}: 詳細ページが開けませんでした。")
+                    broken.append(target)
+                    continue
+                yield rows
+
+    try:
+        if targets is not None:
+            broken = []
+            yield from visit(targets, broken)
+            if broken:
+                raise RuntimeError(f"詳細ページが開けませんでした: {', '.join(t['facility'] for t in broken)}")
+            return
+
+        known = catalog.get(catalog_source)
+        if known:
+            if _status_callback: _status_callback(f"📒 保存済みの施設カタログ ({len(known)} 件) から詳細ページを直接開きます。")
+            targets = known
+        else:
+            targets = discover_gym_targets(driver, wait, start_date, _status_callback, _debug_placeholder, tracer)
+            if targets:
+                catalog.put(catalog_source, targets)
+
+        broken = []
+        yield from visit(targets, broken)
+
+        if known and broken:
+            # 行き先が変わった施設がある: カタログを作り直し、開けなかった施設と新しい施設だけを訪れる
+            if _status_callback: _status_callback("⚠️ 施設カタログが古くなっています。施設一覧から探し直します...")
+            catalog.invalidate(catalog_source)
+            opened = {t["facility"] for t in targets} - {t["facility"] for t in broken}
+            targets = discover_gym_targets(driver, wait, start_date, _status_callback, _debug_placeholder, tracer)
+            if targets:
+                catalog.put(catalog_source, targets)
+            broken = []
+            yield from visit([t for t in targets if t["facility"] not in opened], broken)
+
+        if broken:
+            # 一部の施設が欠けた結果を成功として返すと、保存済みの行が消えてしまう
+            raise RuntimeError(f"詳細ページが開けませんでした: {', '.join(t['facility'] for t in broken)}")
+
+    except Exception as e:
+        logger.error(f"Scrape Error: {e}")
+        failed = True
+        if _debug_placeholder:
+             try: _debug_placeholder.image(driver.get_screenshot_as_png(), caption=f"Error: {str(e)}", use_column_width=True)
+             except: pass
+        raise e
+    finally:
+        # 失敗した Driver は破棄し、次のリトライでは新しい Driver を使う
+        pool.release(driver, discard=failed)
+        if store:
+            store.save()
+
+def fetch_availability_deep_scan(start_date=None, end_date=None, _status_callback=None, _progress_bar=None, _debug_placeholder=None, attempt_idx=0, incremental=True, tracer=None):
+    results = SlotTable()
+    for batch in iter_availability_deep_scan(start_date, end_date, _status_callback, _progress_bar, _debug_placeholder, attempt_idx, incremental, tracer):
+        results.extend(batch)
+
+    if not results:
+        return pd.DataFrame(columns=['日付', '施設名', '室場名', '時間', '状況', '曜日', 'dt'])
+    
+    return results.to_frame()
@@ -0,0 +1,231 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+try:
+    import psutil
+except ImportError:  # メモリ監視は psutil がある場合のみ有効
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+# --- 設定定数 ---
+DEFAULT_MAX_PAGES = 300       # この回数ページ遷移したら Driver を作り直す
+DEFAULT_MAX_MEMORY_MB = 1500  # Chrome プロセス群の RSS 合計がこれを超えたら作り直す
+
+
+class _PooledDriver:
+    """プール内の Driver 1 台分の管理情報"""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+        self.jobs = 0
+        self.created_at = time.time()
+
+
+class DriverPool:
+    """
+    起動済み・ウォームアップ済みの WebDriver を使い回すためのプール。
+
+    - acquire() で起動済みの Driver を取り出し、release() で返却する
+    - 取り出し時にヘルスチェックを行い、応答しない Driver は作り直す
+    - 返却時にタブ/フレームの状態をリセットし、warm_url へ戻しておく
+    - max_pages 回の遷移、または max_memory_mb を超えたら Driver を作り直す
+    """
+
+    def __init__(self, factory, size=1, warm_url=None, max_pages=DEFAULT_MAX_PAGES,
+                 max_memory_mb=DEFAULT_MAX_MEMORY_MB):
+        self._factory = factory
+        self.size = max(1, int(size))
+        self.warm_url = warm_url
+        self.max_pages = max_pages
+        self.max_memory_mb = max_memory_mb
+
+        self._idle = []
+        self._leased = {}
+        self._pending = 0  # 取り出し処理中 (起動・ヘルスチェック中) の台数
+        self._cond = threading.Condition()
+        self._closed = False
+
+    # --- 公開API ---
+    def acquire(self, timeout=None):
+        """Driver を1台取り出す。全台使用中なら返却されるまで待つ"""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("DriverPool は既に閉じられています")
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if len(self._leased) + len(self._idle) + self._pending < self.size:
+                    entry = None
+                    break
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError("空いている Driver がありません")
+                self._cond.wait(remaining)
+            # 起動中に他スレッドが枠を取らないよう予約しておく
+            self._pending += 1
+
+        try:
+            if entry is not None and not self._is_healthy(entry):
+                logger.info("応答しない Driver を破棄して再起動します。")
+                self._quit(entry)
+                entry = None
+            if entry is None:
+                entry = self._start()
+        except Exception:
+            with self._cond:
+                self._pending -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._pending -= 1
+            self._leased[id(entry.driver)] = entry
+        entry.jobs += 1
+        return entry.driver
+
+    def release(self, driver, discard=False):
+        """
+        Driver を返却する。discard=True の場合 (エラー発生時など) は破棄する。
+        """
+        with self._cond:
+            entry = self._leased.pop(id(driver), None)
+        if entry is None:
+            return
+
+        if not discard and not self._closed:
+            if self._needs_recycle(entry):
+                discard = True
+            elif not self._reset(entry):
+                discard = True
+
+        with self._cond:
+            keep = not discard and not self._closed and len(self._leased) + len(self._idle) + self._pending < self.size
+            if keep:
+                self._idle.append(entry)
+            self._cond.notify()
+        if not keep:
+            self._quit(entry)
+
+    def resize(self, size):
+        """プールの最大台数を変更する (縮小時は返却されたものから順に終了)"""
+        with self._cond:
+            self.size = max(1, int(size))
+            excess = []
+            while self._idle and len(self._leased) + len(self._idle) + self._pending > self.size:
+                excess.append(self._idle.pop(0))
+            self._cond.notify_all()
+        for entry in excess:
+            self._quit(entry)
+
+    def memory_mb(self):
+        """プール内の全 Driver (貸出中を含む) の RSS 合計 [MB]。psutil がなければ None"""
+        with self._cond:
+            entries = self._idle + list(self._leased.values())
+        sizes = [self._memory_mb(entry) for entry in entries]
+        sizes = [size for size in sizes if size is not None]
+        return sum(sizes) if sizes else None
+
+    @contextmanager
+    def lease(self, timeout=None):
+        """with 文で Driver を借りる。例外が出た Driver は破棄される"""
+        driver = self.acquire(timeout)
+        failed = False
+        try:
+            yield driver
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            self.release(driver, discard=failed)
+
+    def close(self):
+        """待機中の Driver をすべて終了する (貸出中のものは返却時に終了)"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for entry in idle:
+            self._quit(entry)
+
+    # --- 内部処理 ---
+    def _start(self):
+        driver = self._factory()
+        entry = _PooledDriver(driver)
+
+        # driver.get を包んでページ遷移回数を数える
+        original_get = driver.get
+
+        def counting_get(url):
+            entry.pages += 1
+            return original_get(url)
+
+        driver.get = counting_get
+
+        if self.warm_url:
+            try:
+                driver.get(self.warm_url)
+            except Exception as e:
+                logger.warning(f"Driver のウォームアップに失敗しました: {e}")
+        return entry
+
+    def _is_healthy(self, entry):
+        try:
+            return entry.driver.execute_script("return 1;") == 1 and bool(entry.driver.window_handles)
+        except Exception:
+            return False
+
+    def _reset(self, entry):
+        """ジョブ間で残る状態 (余分なタブ・フレーム) を片付けて warm_url に戻す"""
+        driver = entry.driver
+        try:
+            handles = driver.window_handles
+            for handle in handles[1:]:
+                driver.switch_to.window(handle)
+                driver.close()
+            driver.switch_to.window(handles[0])
+            driver.switch_to.default_content()
+            if self.warm_url:
+                driver.get(self.warm_url)
+            return True
+        except Exception as e:
+            logger.warning(f"Driver のリセットに失敗しました: {e}")
+            return False
+
+    def _needs_recycle(self, entry):
+        if self.max_pages and entry.pages >= self.max_pages:
+            logger.info(f"Driver が {entry.pages} ページを処理したため再起動します。")
+            return True
+        memory_mb = self._memory_mb(entry)
+        if self.max_memory_mb and memory_mb is not None and memory_mb >= self.max_memory_mb:
+            logger.info(f"Driver のメモリ使用量が {memory_mb:.0f}MB に達したため再起動します。")
+            return True
+        return False
+
+    def _memory_mb(self, entry):
+        """chromedriver とその子プロセス (Chrome本体) の RSS 合計 [MB]"""
+        if psutil is None:
+            return None
+        try:
+            proc = psutil.Process(entry.driver.service.process.pid)
+            procs = [proc] + proc.children(recursive=True)
+            total = 0
+            for p in procs:
+                try:
+                    total += p.memory_info().rss
+                except psutil.Error:
+                    continue
+            return total / (1024 * 1024)
+        except Exception:
+            return None
+
+    def _quit(self, entry):
+        try:
+            entry.driver.quit()
+        except Exception:
+            pass
@@ -0,0 +1,70 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from src.store import DISPLAY_COLUMNS, slot_start_key
+
+
+class FilterIndex:
+    """
+    サイドバーの絞り込み (期間・曜日・開始時刻・状況) 用の索引。
+    AvailabilityStore.query() の結果を一度だけ読み込んでカテゴリ型の列にし、
+    曜日・開始時刻・日付・状況ごとに該当行のビットマップ (np.packbits した uint8 配列) を作っておく。
+    ウィジェットを操作するたびの絞り込みは、ビットマップの OR / AND だけで済む。
+    """
+
+    def __init__(self, df):
+        df = df.reset_index(drop=True)
+        self.size = len(df)
+        self.frame = df.astype({c: "category" for c in ("曜日", "施設名", "室場名", "時間", "状況")})
+
+        # 開始時刻の正規化は時間帯の表記の種類ごとに1回だけ行う
+        times = self.frame["時間"].cat
+        starts = np.array([slot_start_key(t) or "" for t in times.categories], dtype=object)
+        self.frame["slot_start"] = pd.Categorical(starts[np.asarray(times.codes)])
+
+        self.date_ordinals = np.array([d.toordinal() if isinstance(d, datetime.date) else 0
+                                       for d in self.frame["dt"]], dtype=np.int32)
+        self.by_weekday = self._bitmaps(self.frame["曜日"])
+        self.by_slot = self._bitmaps(self.frame["slot_start"])
+        self.by_status = self._bitmaps(self.frame["状況"])
+        self.by_date = self._bitmaps(pd.Categorical(self.date_ordinals))
+        self._all = self._pack(np.ones(self.size, dtype=bool))
+        self._none = self._pack(np.zeros(self.size, dtype=bool))
+
+    def mask(self, start_date=None, end_date=None, days=None, times=None, statuses=None):
+        """条件に合う行のビットマップ。AvailabilityStore.query と同じく、空の条件は絞り込まない"""
+        bits = self._all
+        if start_date or end_date:
+            lo = start_date.toordinal() if start_date else 1
+            hi = end_date.toordinal() if end_date else datetime.date.max.toordinal()
+            bits = bits & self._union(self.by_date, [d for d in self.by_date if d and lo <= d <= hi])
+        for bitmaps, values in ((self.by_weekday, days), (self.by_slot, times), (self.by_status, statuses)):
+            if values:
+                bits = bits & self._union(bitmaps, values)
+        return bits
+
+    def query(self, start_date=None, end_date=None, days=None, times=None, statuses=None):
+        """mask に該当する行を DISPLAY_COLUMNS の DataFrame で返す (行の順序は読み込み時のまま)"""
+        bits = self.mask(start_date, end_date, days, times, statuses)
+        rows = np.flatnonzero(np.unpackbits(bits, count=self.size))
+        return self.frame.iloc[rows][DISPLAY_COLUMNS].reset_index(drop=True)
+
+    def count(self, **filters):
+        return int(np.unpackbits(self.mask(**filters), count=self.size).sum())
+
+    def _union(self, bitmaps, values):
+        found = [bitmaps[v] for v in values if v in bitmaps]
+        if not found:
+            return self._none
+        return np.bitwise_or.reduce(found) if len(found) > 1 else found[0]
+
+    def _bitmaps(self, column):
+        column = pd.Categorical(column)
+        codes = np.asarray(column.codes)
+        return {value: self._pack(codes == code) for code, value in enumerate(column.categories)}
+
+    @staticmethod
+    def _pack(flags):
+        return np.packbits(flags)
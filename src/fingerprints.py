@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows ではファイルロックなしで保存する
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# --- 設定定数 ---
+CACHE_DIR = os.getenv("SCAN_CACHE_DIR", ".cache")
+FINGERPRINT_PATH = os.path.join(CACHE_DIR, "fingerprints.json")
+# 一致していてもこの時間を過ぎたら取り直す (カレンダーの深掘りでしか見えない変化を拾うため)
+FINGERPRINT_MAX_AGE = int(os.getenv("FINGERPRINT_MAX_AGE", str(6 * 3600)))
+# この期間使われなかったエントリは保存時に削除する
+FINGERPRINT_RETENTION = 14 * 24 * 3600
+
+
+def fingerprint(fragments):
+    """HTML 断片 (テーブルの outerHTML など) のリストから内容のハッシュを作る"""
+    h = hashlib.sha1()
+    for fragment in fragments:
+        h.update((fragment or "").encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def make_key(*parts):
+    return "|".join(str(p) for p in parts)
+
+
+class FingerprintStore:
+    """
+    (施設, 室場, 週) などのページ単位で、前回の内容ハッシュと抽出結果の行を保存する。
+    ハッシュが一致するページは解析・深掘りを省略し、保存済みの行を再利用する。
+    同じファイルを複数のプロセス (分散ワーカーなど) が使うため、save() はロックを取ってから
+    ファイルの内容を読み直し、このプロセスで変更したエントリだけを重ねて書き戻す。
+    """
+
+    def __init__(self, path=FINGERPRINT_PATH, max_age=FINGERPRINT_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._changed = set()     # このプロセスで更新・参照したキー
+        self._removed = set()     # このプロセスで破棄したキー
+        self._cleared = False     # invalidate() で全件を破棄した
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def lookup(self, key, digest):
+        """ハッシュが一致し、かつ max_age 以内に取得したものなら保存済みの行を返す"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry["hash"] == digest and now - entry["scanned_at"] < self.max_age:
+                entry["seen_at"] = now
+                self._changed.add(key)
+                self._dirty = True
+                self.hits += 1
+                return [dict(row) for row in entry["rows"]]
+            self.misses += 1
+            return None
+
+    def update(self, key, digest, rows):
+        now = time.time()
+        with self._lock:
+            self._entries[key] = {
+                "hash": digest,
+                "rows": [dict(row) for row in rows],
+                "scanned_at": now,
+                "seen_at": now,
+            }
+            self._changed.add(key)
+            self._removed.discard(key)
+            self._dirty = True
+
+    def invalidate(self, key=None):
+        """key の指定が無ければ全件を破棄する (強制的なフルスキャン用)"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                self._changed.clear()
+                self._removed.clear()
+                self._cleared = True
+            else:
+                self._entries.pop(key, None)
+                self._changed.discard(key)
+                self._removed.add(key)
+            self._dirty = True
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(f"{self.path}.lock", "w") as lock_file:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    try:
+                        on_disk = self._read()
+                    except ValueError:  # 壊れたファイルはこのプロセスの内容で置き換える
+                        on_disk = {}
+                    self._entries = self._merge(on_disk)
+                    cutoff = time.time() - FINGERPRINT_RETENTION
+                    self._entries = {k: v for k, v in self._entries.items() if v.get("seen_at", 0) >= cutoff}
+                    tmp = f"{self.path}.{os.getpid()}.tmp"  # 別プロセス (分散ワーカー) と一時ファイルを共有しない
+                    with open(tmp, "w", encoding="utf-8") as f:
+                        f.write(json.dumps(self._entries, ensure_ascii=False))
+                    os.replace(tmp, self.path)
+                self._dirty = False
+                self._changed.clear()
+                self._removed.clear()
+                self._cleared = False
+            except OSError as e:
+                logger.warning(f"フィンガープリントの保存に失敗しました: {e}")
+        if self.hits or self.misses:
+            logger.info(f"差分スキャン: 再利用 {self.hits}件 / 再取得 {self.misses}件")
+
+    def _merge(self, on_disk):
+        """ファイルの内容に、このプロセスでの変更 (更新・参照・破棄) を重ねる。同じキーは新しく取得した方を使う"""
+        merged = {} if self._cleared else dict(on_disk)
+        for key in self._removed:
+            merged.pop(key, None)
+        for key in self._changed:
+            ours = self._entries.get(key)
+            if ours is None:
+                continue
+            theirs = merged.get(key)
+            if theirs is None or ours["scanned_at"] >= theirs.get("scanned_at", 0):
+                merged[key] = ours
+            else:
+                theirs["seen_at"] = max(theirs.get("seen_at", 0), ours["seen_at"])
+        return merged
+
+    def _read(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _load(self):
+        try:
+            self._entries = self._read()
+        except (OSError, ValueError) as e:
+            logger.warning(f"フィンガープリントの読み込みに失敗しました。フルスキャンします: {e}")
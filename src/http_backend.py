@@ -0,0 +1,394 @@
+"""
+ブラウザを使わずに ServiceNow Service Portal の JSON エンドポイントから
+空き状況を取得するバックエンド。
+
+ポータルの各ウィジェットは次の REST API でデータを読み込んでいる:
+    GET  /api/now/sp/page?id=<page_id>&portal_id=<portal>   ページ構成 (ウィジェット一覧と初期データ)
+    POST /api/now/sp/widget/<widget_sys_id>?id=<page_id>     ウィジェットへの入力 (検索・日付変更など)
+POST には HTML 内の g_ck トークンを X-UserToken ヘッダで付ける必要がある。
+
+ウィジェットの識別子や入力パラメータはポータル側の実装に依存するため、
+HTTP_WIDGETS / 環境変数で差し替えられるようにしている。取得結果は
+fetch_availability_deep_scan と同じ 日付/施設名/室場名/時間/状況 の行になる。
+"""
+import os
+import re
+import json
+import logging
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qsl
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# --- 設定定数 ---
+PORTAL_BASE_URL = os.getenv("PORTAL_BASE_URL", "https://fujisawacity.service-now.com")
+PORTAL_SUFFIX = "facilities_reservation"
+SEARCH_PAGE_ID = "facility_search"
+DETAIL_PAGE_ID = "facility_detail"
+FACILITY_CATEGORY = "市民センター"
+ROOM_KEYWORD = "体育室"
+SCHEDULE_SPAN_DAYS = 7   # スケジュールウィジェット1回の取得で返る日数
+HTTP_WORKERS = 4         # 室場スケジュールの同時取得数
+REQUEST_TIMEOUT = 15
+
+# ウィジェットの識別 (widget.id / widget.name のどちらかに含まれる文字列) と入力
+HTTP_WIDGETS = {
+    "search": {
+        "match": os.getenv("PORTAL_SEARCH_WIDGET", "facility_search"),
+        "input": {"action": "search"},
+    },
+    "schedule": {
+        "match": os.getenv("PORTAL_SCHEDULE_WIDGET", "facility_schedule"),
+        "input": {"action": "get_schedule"},
+    },
+}
+
+RESULT_COLUMNS = ['日付', '施設名', '室場名', '時間', '状況']
+
+_G_CK_RE = re.compile(r"""g_ck\s*=\s*['"]([0-9a-f]+)['"]""")
+
+# ステータス表記の正規化 (記号・日本語・英語のいずれでも来る想定)。表記全体または語単位の完全一致で判定する
+_STATUS_MAP = {
+    "○": "○", "◯": "○", "空": "○", "空き": "○", "空きあり": "○", "available": "○", "open": "○", "vacant": "○",
+    "△": "△", "残りわずか": "△", "一部空き": "△", "few": "△", "partial": "△", "limited": "△",
+    "×": "×", "✕": "×", "満": "×", "満室": "×", "full": "×", "reserved": "×", "closed": "×",
+}
+# 否定・満席の言い回し。"unavailable" の中の "available" のような肯定語より先に調べる
+_NEGATIVE_PHRASES = ("unavailable", "not available", "not_available", "no vacancy", "fully booked",
+                     "空きなし", "空き無し", "空無", "予約不可", "受付不可", "満室", "満員")
+_STATUS_TOKEN_RE = re.compile(r"[\s/,、・:：()（）\[\]【】_\-]+")
+
+_DATE_KEYS = ("date", "day", "日付", "use_date")
+_TIME_KEYS = ("time", "slot", "time_slot", "時間", "period", "label")
+_STATUS_KEYS = ("status", "state", "availability", "状況", "mark", "symbol")
+_NAME_KEYS = ("name", "display_name", "title", "label")
+
+
+def normalize_status(value):
+    """各種ステータス表記を ○/△/× に揃える。判定できない場合は None"""
+    if value is None:
+        return None
+    text = str(value).strip()
+    if not text:
+        return None
+    lowered = text.lower()
+    if lowered in _STATUS_MAP:
+        return _STATUS_MAP[lowered]
+    if any(phrase in lowered for phrase in _NEGATIVE_PHRASES):
+        return "×"
+    # "○ 空き" のような複合表記は語ごとに完全一致で調べる (部分一致はしない)
+    found = {_STATUS_MAP[token] for token in _STATUS_TOKEN_RE.split(lowered) if token in _STATUS_MAP}
+    if len(found) == 1:
+        return found.pop()
+    return None
+
+
+def _first(record, keys):
+    for key in keys:
+        if key in record and record[key] not in (None, ""):
+            value = record[key]
+            # ServiceNow の {"value": ..., "display_value": ...} 形式
+            if isinstance(value, dict):
+                value = value.get("display_value") or value.get("value")
+            return value
+    return None
+
+
+def decode_schedule(payload, facility_name, room_name):
+    """
+    スケジュール系ウィジェットの JSON から空き (○/△) の行を取り出す。
+
+    次の2形式を再帰的に探す:
+    - レコード形式: [{"date": ..., "time": ..., "status": ...}, ...]
+    - 表形式: {"headers"/"times": [...], "rows"/"days": [{"date": ..., "slots"/"cells": [...]}, ...]}
+    """
+    results = []
+
+    def add(date_val, time_val, status_val):
+        status = normalize_status(status_val)
+        if status in ("○", "△") and date_val:
+            results.append({
+                "日付": str(date_val),
+                "施設名": facility_name,
+                "室場名": room_name,
+                "時間": str(time_val or ""),
+                "状況": status,
+            })
+
+    def walk(node):
+        if isinstance(node, dict):
+            headers = node.get("headers") or node.get("times") or node.get("time_slots")
+            rows = node.get("rows") or node.get("days")
+            if isinstance(headers, list) and isinstance(rows, list):
+                header_labels = [h if not isinstance(h, dict) else _first(h, _TIME_KEYS) for h in headers]
+                for row in rows:
+                    if not isinstance(row, dict):
+                        continue
+                    cells = row.get("slots") or row.get("cells") or row.get("statuses") or []
+                    date_val = _first(row, _DATE_KEYS)
+                    for i, cell in enumerate(cells):
+                        status_val = _first(cell, _STATUS_KEYS) if isinstance(cell, dict) else cell
+                        time_val = header_labels[i] if i < len(header_labels) else ""
+                        add(date_val, time_val, status_val)
+                return
+
+            date_val = _first(node, _DATE_KEYS)
+            time_val = _first(node, _TIME_KEYS)
+            status_val = _first(node, _STATUS_KEYS)
+            if date_val and time_val and status_val is not None:
+                add(date_val, time_val, status_val)
+                return
+
+            for value in node.values():
+                if isinstance(value, (dict, list)):
+                    walk(value)
+        elif isinstance(node, list):
+            for item in node:
+                walk(item)
+
+    walk(payload)
+    return results
+
+
+def find_widget_id(page_payload, role):
+    """ページ構成の JSON から役割 (HTTP_WIDGETS のキー) に対応するウィジェットの sys_id を探す (無ければ None)"""
+    match = HTTP_WIDGETS[role]["match"]
+    found = None
+
+    def walk(node):
+        nonlocal found
+        if found:
+            return
+        if isinstance(node, dict):
+            widget = node.get("widget")
+            if isinstance(widget, dict):
+                names = f"{widget.get('id', '')} {widget.get('name', '')}"
+                if match in names and (node.get("sys_id") or widget.get("sys_id")):
+                    found = node.get("sys_id") or widget.get("sys_id")
+                    return
+            for value in node.values():
+                if isinstance(value, (dict, list)):
+                    walk(value)
+        elif isinstance(node, list):
+            for item in node:
+                walk(item)
+
+    walk(page_payload)
+    return found
+
+
+def decode_facilities(payload):
+    """
+    検索ウィジェットの JSON から [(施設名, 室場名, 室場sys_id), ...] を取り出す。
+    施設レコードは name と rooms (室場レコードのリスト) を持つ想定。
+    """
+    found = []
+
+    def walk(node):
+        if isinstance(node, dict):
+            rooms = node.get("rooms") or node.get("room_list")
+            name = _first(node, _NAME_KEYS)
+            if isinstance(rooms, list) and name:
+                for room in rooms:
+                    if not isinstance(room, dict):
+                        continue
+                    room_name = _first(room, _NAME_KEYS)
+                    room_id = _first(room, ("sys_id", "id", "room_id"))
+                    if room_name and room_id:
+                        found.append((str(name), str(room_name), str(room_id)))
+                return
+            for value in node.values():
+                if isinstance(value, (dict, list)):
+                    walk(value)
+        elif isinstance(node, list):
+            for item in node:
+                walk(item)
+
+    walk(payload)
+    return found
+
+
+class PortalClient:
+    """
+    ポータルの REST API クライアント。接続はプールされた requests.Session で使い回す。
+    record_path を指定すると、やり取りしたリクエスト/レスポンスを
+    src.replay_server で再生できる形式 (カセット) で保存する。
+    """
+
+    def __init__(self, base_url=PORTAL_BASE_URL, pool_size=HTTP_WORKERS, record_path=None):
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+        retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=frozenset(["GET", "POST"]))
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "Accept": "application/json",
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+        })
+        self.record_path = record_path
+        self._recorded = []
+        self._record_lock = threading.Lock()
+        self._widgets = {}
+        self._widget_lock = threading.Lock()
+
+    # --- 低レベルAPI ---
+    def bootstrap(self):
+        """ポータルの HTML を開いてセッション Cookie と g_ck トークンを取得する"""
+        res = self._request("GET", f"/{PORTAL_SUFFIX}", params={"id": SEARCH_PAGE_ID}, expect_json=False)
+        match = _G_CK_RE.search(res)
+        if match:
+            self.session.headers["X-UserToken"] = match.group(1)
+        else:
+            logger.warning("g_ck トークンが見つかりませんでした。POST が拒否される可能性があります。")
+
+    def page(self, page_id, **params):
+        params = {"id": page_id, "portal_id": PORTAL_SUFFIX, **params}
+        return self._request("GET", "/api/now/sp/page", params=params)
+
+    def widget(self, widget_sys_id, page_id, data, **params):
+        params = {"id": page_id, **params}
+        return self._request("POST", f"/api/now/sp/widget/{widget_sys_id}", params=params, json_body=data)
+
+    def find_widget(self, page_id, role):
+        """ページ構成から役割 (HTTP_WIDGETS のキー) に対応するウィジェットの sys_id を探す"""
+        key = (page_id, role)
+        with self._widget_lock:
+            if key not in self._widgets:
+                self._widgets[key] = self._lookup_widget(page_id, role)
+            return self._widgets[key]
+
+    def _lookup_widget(self, page_id, role):
+        found = find_widget_id(self.page(page_id), role)
+        if not found:
+            raise RuntimeError(f"ウィジェットが見つかりません: {page_id} / {HTTP_WIDGETS[role]['match']}")
+        return found
+
+    def save_recording(self):
+        if not self.record_path:
+            return
+        with self._record_lock:
+            with open(self.record_path, "w", encoding="utf-8") as f:
+                json.dump(self._recorded, f, ensure_ascii=False, indent=1)
+        logger.info(f"{len(self._recorded)}件のレスポンスを {self.record_path} に保存しました。")
+
+    def close(self):
+        self.save_recording()
+        self.session.close()
+
+    # --- 高レベルAPI ---
+    def search_rooms(self, start_date=None, keyword=None):
+        """対象区分 (市民センター) の施設を検索し、体育室の (施設名, 室場名, sys_id) を返す"""
+        widget_id = self.find_widget(SEARCH_PAGE_ID, "search")
+        data = dict(HTTP_WIDGETS["search"]["input"], category=FACILITY_CATEGORY)
+        if keyword:
+            data["keyword"] = keyword
+        if start_date:
+            data["date"] = start_date.strftime("%Y-%m-%d")
+        payload = self.widget(widget_id, SEARCH_PAGE_ID, data)
+        return [r for r in decode_facilities(payload) if ROOM_KEYWORD in r[1]]
+
+    def room_schedule(self, facility_name, room_name, room_id, day):
+        widget_id = self.find_widget(DETAIL_PAGE_ID, "schedule")
+        data = dict(HTTP_WIDGETS["schedule"]["input"], room=room_id, date=day.strftime("%Y-%m-%d"))
+        payload = self.widget(widget_id, DETAIL_PAGE_ID, data, sys_id=room_id)
+        return decode_schedule(payload, facility_name, room_name)
+
+    # --- 内部処理 ---
+    def _request(self, method, path, params=None, json_body=None, expect_json=True):
+        url = f"{self.base_url}{path}"
+        res = self.session.request(method, url, params=params, json=json_body, timeout=REQUEST_TIMEOUT)
+        res.raise_for_status()
+        body = res.json() if expect_json else res.text
+        if self.record_path:
+            with self._record_lock:
+                self._recorded.append({
+                    "method": method,
+                    "path": path,
+                    "query": dict(parse_qsl(urlsplit(res.url).query)),
+                    "body": json_body,
+                    "status": res.status_code,
+                    "content_type": res.headers.get("Content-Type", ""),
+                    "response": body,
+                })
+        return body
+
+
+def fetch_availability_http(start_date=None, end_date=None, _status_callback=None, _progress_bar=None,
+                            keyword=None, client=None, workers=HTTP_WORKERS):
+    """
+    fetch_availability_deep_scan の HTTP 版。ブラウザを起動せずに同じ列の DataFrame を返す。
+    """
+    own_client = client is None
+    if own_client:
+        client = PortalClient(pool_size=workers)
+
+    def status(msg):
+        if _status_callback:
+            _status_callback(msg)
+        logger.info(msg)
+
+    if start_date is None:
+        start_date = datetime.date.today()
+    if end_date is None:
+        end_date = start_date + datetime.timedelta(days=14)
+
+    results = []
+    try:
+        status("📡 予約システム (HTTP) にアクセス中...")
+        client.bootstrap()
+        rooms = client.search_rooms(start_date, keyword)
+        if not rooms:
+            # 空の結果で保存済みの行を消さないよう、取得失敗として扱う
+            raise RuntimeError("体育室が見つかりませんでした。")
+        status(f"📍 {len(rooms)} 件の体育室が見つかりました。")
+
+        days = []
+        day = start_date
+        while day <= end_date:
+            days.append(day)
+            day += datetime.timedelta(days=SCHEDULE_SPAN_DAYS)
+        jobs = [(room, day) for room in rooms for day in days]
+
+        def run(job):
+            (facility_name, room_name, room_id), day = job
+            return client.room_schedule(facility_name, room_name, room_id, day)
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            for i, rows in enumerate(executor.map(run, jobs)):
+                results.extend(rows)
+                if _progress_bar:
+                    _progress_bar.progress((i + 1) / len(jobs))
+    finally:
+        if own_client:
+            client.close()
+
+    if not results:
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+    df = pd.DataFrame(results).drop_duplicates()
+    # 取得単位 (SCHEDULE_SPAN_DAYS) の都合で範囲外の日付が混ざるので落とす
+    dates = pd.to_datetime(df["日付"], errors="coerce").dt.date
+    in_range = dates.isna() | ((dates >= start_date) & (dates <= end_date))
+    return df[in_range].reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="HTTP バックエンドで空き状況を取得する")
+    parser.add_argument("--record", help="レスポンスをカセットとして保存するパス")
+    parser.add_argument("--days", type=int, default=14)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    today = datetime.date.today()
+    cli = PortalClient(record_path=args.record)
+    print(fetch_availability_http(today, today + datetime.timedelta(days=args.days), client=cli))
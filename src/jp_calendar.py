@@ -0,0 +1,149 @@
+import datetime
+import functools
+
+import jpholiday
+import numpy as np
+import pandas as pd
+
+# --- 設定定数 ---
+WEEKDAY_LABELS = ["月", "火", "水", "木", "金", "土", "日"]
+HOLIDAY_LABEL = "祝"
+UNKNOWN_LABEL = "不明"
+# 参照表を作る範囲 (今日を基準に)。年の省略された日付は 90 日より前なら翌年とみなすので、過去側は少し広めに取る
+HORIZON_PAST_DAYS = 120
+HORIZON_FUTURE_DAYS = 400
+
+# "2025/10/18(土)" "2025年10月18日" "10/18" "10-18-2025" など。区切りは年・月・日・-・. を / に寄せてから判定する
+# (全角の数字・記号は NFKC で半角にしてから判定するので、数字は ASCII の [0-9] だけを見る)
+_SEPARATORS = str.maketrans({"年": "/", "月": "/", "日": "", "-": "/", ".": "/"})
+_DATE_PARTS_RE = r"^[\s/]*([0-9]+)\s*/[\s/]*([0-9]+)(?:\s*/[\s/]*([0-9]+))?[\s/]*$"
+_WEEKDAY_IN_TEXT_RE = r"[(（]([月火水木金土日])[)）]"
+
+
+class DayCalendar:
+    """
+    start〜end の各日について (曜日, 祝日かどうか) をまとめて作っておく参照表。
+    jpholiday の判定は表を作るときに1回だけ行い、以降は辞書引きと DataFrame の結合で済ませる。
+    """
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        holidays = {d for d, _ in jpholiday.between(start, end)}
+        index = pd.date_range(start, end, freq="D")
+        weekdays = index.weekday.to_numpy()
+        is_holiday = np.array([d.date() in holidays for d in index], dtype=bool)
+        labels = np.where(is_holiday, HOLIDAY_LABEL, np.array(WEEKDAY_LABELS, dtype=object)[weekdays])
+        self.frame = pd.DataFrame({"weekday": weekdays, "holiday": is_holiday, "曜日": labels}, index=index)
+        self._days = {d.date(): (int(w), bool(h)) for d, w, h in zip(index, weekdays, is_holiday)}
+
+    def info(self, date):
+        """(weekday, is_holiday)。weekday は 0=月〜6=日。範囲外の日付はその場で判定する"""
+        if isinstance(date, datetime.datetime):
+            date = date.date()
+        found = self._days.get(date)
+        if found is None:
+            found = (date.weekday(), bool(jpholiday.is_holiday(date)))
+        return found
+
+    def label(self, date):
+        weekday, holiday = self.info(date)
+        return HOLIDAY_LABEL if holiday else WEEKDAY_LABELS[weekday]
+
+    def is_weekend_or_holiday(self, date):
+        weekday, holiday = self.info(date)
+        return weekday >= 5 or holiday
+
+    def labels(self, dates):
+        """datetime64 の Series を曜日ラベルの Series にする (日付が NaT の行は NaN)"""
+        labels = self.frame["曜日"].reindex(dates.to_numpy()).to_numpy()
+        missing = pd.isna(labels) & dates.notna().to_numpy()
+        if missing.any():
+            labels = labels.copy()
+            for i in np.flatnonzero(missing):
+                labels[i] = self.label(dates.iloc[i].date())
+        return pd.Series(labels, index=dates.index, dtype=object)
+
+
+@functools.lru_cache(maxsize=4)
+def _calendar_for(today):
+    return DayCalendar(today - datetime.timedelta(days=HORIZON_PAST_DAYS),
+                       today + datetime.timedelta(days=HORIZON_FUTURE_DAYS))
+
+
+def get_calendar(today=None):
+    """今日を基準にした参照表 (日付が変わると作り直す。常駐プロセスでも古くならない)"""
+    return _calendar_for(today or datetime.date.today())
+
+
+def is_weekend_or_holiday(date):
+    return get_calendar().is_weekend_or_holiday(date)
+
+
+def parse_dates(values, today=None):
+    """
+    日付文字列の Series をまとめて datetime64 に変換する (解析できないものは NaT)。
+    年の無い "10/18" は今年とみなし、90 日以上前になる場合は翌年とする。全角の "１０月１８日" も解析する。
+    """
+    today = today or datetime.date.today()
+    text = values.where(values.map(lambda v: isinstance(v, str)), "").astype(object).astype(str).str.normalize("NFKC")
+    clean = text.str.split("(", n=1).str[0].str.strip().str.translate(_SEPARATORS)
+    parts = clean.str.extract(_DATE_PARTS_RE)
+
+    first, second, third = parts[0], parts[1], parts[2]
+    has_third = third.notna()
+    ymd = has_third & (first.str.len() == 4)
+    mdy = has_third & ~ymd & (third.str.len() == 4)
+    md = first.notna() & ~has_third
+
+    year = pd.Series(np.nan, index=values.index)
+    month = pd.Series(np.nan, index=values.index)
+    day = pd.Series(np.nan, index=values.index)
+    for mask, (y, m, d) in ((ymd, (first, second, third)), (mdy, (third, first, second))):
+        year[mask] = pd.to_numeric(y[mask])
+        month[mask] = pd.to_numeric(m[mask])
+        day[mask] = pd.to_numeric(d[mask])
+    year[md] = today.year
+    month[md] = pd.to_numeric(first[md])
+    day[md] = pd.to_numeric(second[md])
+
+    dates = _to_datetime(year, month, day)
+    cutoff = pd.Timestamp(today - datetime.timedelta(days=90))
+    roll = md & dates.notna() & (dates < cutoff)
+    if roll.any():
+        dates[roll] = _to_datetime(year[roll] + 1, month[roll], day[roll])
+    return dates
+
+
+def _to_datetime(year, month, day):
+    valid = year.notna() & month.notna() & day.notna()
+    out = pd.Series(pd.NaT, index=year.index, dtype="datetime64[ns]")
+    if valid.any():
+        out[valid] = pd.to_datetime(
+            pd.DataFrame({"year": year[valid], "month": month[valid], "day": day[valid]}).astype("int64"),
+            errors="coerce",
+        )
+    return out
+
+
+def enrich_dates(df, today=None):
+    """
+    '日付' 列から 'dt' (datetime.date / None) と '曜日' (月〜日 / 祝 / 不明) を追加する。
+    日付を解析できない行は '日付' 内の "(土)" などの表記から曜日を取る。
+    同じ日付の行は多いので、解析と参照表の結合は重複を除いた値に対して行い、行には添字で配る。
+    """
+    if df.empty:
+        return df
+    codes, uniques = pd.factorize(df["日付"], use_na_sentinel=False)
+    uniques = pd.Series(uniques, dtype=object)
+    dates = parse_dates(uniques, today)
+    labels = get_calendar(today).labels(dates)
+
+    text = uniques.where(uniques.map(lambda v: isinstance(v, str)), "").astype(str)
+    from_text = text.str.extract(_WEEKDAY_IN_TEXT_RE)[0]
+    labels = labels.where(dates.notna(), from_text).fillna(UNKNOWN_LABEL)
+
+    dt = pd.Series(dates.dt.date.to_numpy(dtype=object)).where(dates.notna(), None).to_numpy()
+    df["dt"] = dt[codes]
+    df["曜日"] = labels.to_numpy()[codes]
+    return df
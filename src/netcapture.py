@@ -0,0 +1,130 @@
+import os
+import json
+import base64
+import logging
+import weakref
+from urllib.parse import urlsplit
+
+from src.http_backend import decode_schedule, find_widget_id
+
+logger = logging.getLogger(__name__)
+
+# --- 設定定数 ---
+# 1 のとき setup_driver で CDP のネットワークログを有効にし、XHR の応答から空き状況を読む
+CAPTURE_NETWORK = os.getenv("CAPTURE_NETWORK", "0") == "1"
+# スケジュールデータを運ぶ可能性のある XHR の URL (Service Portal のウィジェットAPI)
+CAPTURE_URL_PATTERNS = ("/api/now/sp/widget/", "/api/now/sp/page")
+
+# Driver ごとの「応答ヘッダは届いたが本文の受信完了がまだ」のリクエスト
+_pending = weakref.WeakKeyDictionary()
+# Driver ごとに、ページ構成 (/api/now/sp/page) の応答から分かったスケジュールウィジェットの sys_id
+_schedule_widgets = weakref.WeakKeyDictionary()
+
+
+def enable_capture(options):
+    """Chrome のオプションに performance ログ (CDP Network イベント) の取得を追加する"""
+    options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+    return options
+
+
+def start_capture(driver):
+    """起動直後の Driver で Network ドメインを有効にする"""
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+    except Exception as e:
+        logger.warning(f"CDP Network.enable に失敗しました: {e}")
+
+
+def drain_payloads(driver):
+    """
+    前回呼び出し以降に完了した対象 XHR の (URL, JSON 本文) のリストを返す。
+    performance ログはここで消費されるので、呼び出すたびに新しい応答だけが返る。
+    ページ構成の応答からはスケジュールウィジェットの sys_id を覚えておく (is_schedule_url で使う)。
+    """
+    try:
+        entries = driver.get_log("performance")
+    except Exception:
+        return []
+
+    try:
+        pending = _pending.setdefault(driver, {})
+        widgets = _schedule_widgets.setdefault(driver, set())
+    except TypeError:
+        pending, widgets = {}, set()
+    finished = []
+
+    for entry in entries:
+        try:
+            message = json.loads(entry["message"])["message"]
+        except (KeyError, ValueError):
+            continue
+        method = message.get("method")
+        params = message.get("params", {})
+
+        if method == "Network.responseReceived":
+            if params.get("type") not in ("XHR", "Fetch"):
+                continue
+            url = params.get("response", {}).get("url", "")
+            if any(p in url for p in CAPTURE_URL_PATTERNS):
+                pending[params.get("requestId")] = url
+        elif method == "Network.loadingFinished":
+            request_id = params.get("requestId")
+            if request_id in pending:
+                finished.append((request_id, pending.pop(request_id)))
+        elif method == "Network.loadingFailed":
+            pending.pop(params.get("requestId"), None)
+
+    payloads = []
+    for request_id, url in finished:
+        try:
+            res = driver.execute_cdp_cmd("Network.getResponseBody", {"requestId": request_id})
+            body = res.get("body", "")
+            if res.get("base64Encoded"):
+                body = base64.b64decode(body).decode("utf-8", errors="replace")
+            payload = json.loads(body)
+        except Exception as e:
+            # ページ遷移で本文が破棄された場合など
+            logger.debug(f"応答本文の取得に失敗しました ({url}): {e}")
+            continue
+        if "/api/now/sp/page" in url:
+            widget_id = find_widget_id(payload, "schedule")
+            if widget_id:
+                widgets.add(widget_id)
+        payloads.append((url, payload))
+    return payloads
+
+
+def discard_payloads(driver):
+    """
+    ここまでに届いた応答を読み捨てる。クリック・ページ遷移の直前に呼び、
+    初期表示・検索・探索などの応答を次の capture_schedule_rows で解析しないようにする。
+    """
+    drain_payloads(driver)
+
+
+def is_schedule_url(driver, url):
+    """url がスケジュールウィジェット (HTTP_WIDGETS["schedule"]) の呼び出しかどうか"""
+    path = urlsplit(url).path
+    prefix = "/api/now/sp/widget/"
+    if prefix not in path:
+        return False
+    widget_id = path.split(prefix, 1)[1].strip("/")
+    try:
+        return widget_id in _schedule_widgets.get(driver, ())
+    except TypeError:
+        return False
+
+
+def capture_schedule_rows(driver, facility_name, room_name):
+    """
+    直前の discard_payloads 以降にキャプチャしたスケジュールウィジェットの応答から空き行を取り出す。
+    スケジュールの応答があれば空きが無くても行のリスト (空リスト) を返し、
+    1件も無かった場合は None (呼び出し側で HTML 解析にフォールバック)。
+    """
+    rows = None
+    for url, payload in drain_payloads(driver):
+        if not is_schedule_url(driver, url):
+            continue
+        rows = rows or []
+        rows.extend(decode_schedule(payload, facility_name, room_name))
+    return rows
@@ -0,0 +1,209 @@
+"""
+通知の送信 (LINE Notify など)。
+
+    dispatcher = NotificationDispatcher(LineNotifySink(token))
+    delivered = dispatcher.dispatch("【新しい空き】", lines)   # 届いた行数 (先頭から)
+
+- 送信先は NotificationSink を実装したクラスで差し替えられる (テストでは src.notify_stub のスタブサーバーに向ける)
+- 長い一覧は1通あたりの文字数上限 (LINE Notify は 1000 文字) に収まるように分割して送る
+- 応答の X-RateLimit-* / Retry-After ヘッダに従って待ち、5xx・通信エラーは指数バックオフで再送する
+"""
+import os
+import time
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# --- 設定定数 ---
+LINE_NOTIFY_API = os.getenv("LINE_NOTIFY_API", "https://notify-api.line.me/api/notify")
+LINE_MESSAGE_MAX_CHARS = 1000
+REQUEST_TIMEOUT = 15
+MAX_RETRIES = 4
+BACKOFF_BASE = 1.0        # 再送までの待ち時間 [秒] (1, 2, 4, ... と倍にする)
+MAX_BACKOFF = 60
+MAX_RATE_LIMIT_WAIT = 15 * 60  # これ以上待つ必要がある場合は今回は諦める (次回の実行で送り直す)
+
+
+class SinkResponse:
+    """送信先からの応答 (HTTP ステータスとヘッダ)"""
+    __slots__ = ("status", "headers")
+
+    def __init__(self, status, headers=None):
+        self.status = status
+        self.headers = headers or {}
+
+    @property
+    def ok(self):
+        return 200 <= self.status < 300
+
+
+class NotificationSink:
+    """
+    通知の送信先のインターフェース。send(message) は SinkResponse を返し、
+    通信エラーは requests.RequestException (または OSError) を送出する。
+    """
+    max_message_chars = LINE_MESSAGE_MAX_CHARS
+
+    def send(self, message):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class LineNotifySink(NotificationSink):
+    """LINE Notify API。接続はプールされた requests.Session で使い回す"""
+
+    def __init__(self, token, api_url=LINE_NOTIFY_API, pool_size=1):
+        self.api_url = api_url
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = f"Bearer {token}"
+        # 再送は NotificationDispatcher が行うので、urllib3 側では再送しない
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def send(self, message):
+        response = self.session.post(self.api_url, data={"message": message}, timeout=REQUEST_TIMEOUT)
+        return SinkResponse(response.status_code, response.headers)
+
+    def close(self):
+        self.session.close()
+
+
+class NotificationDispatcher:
+    """
+    sink への送信を、文字数で分割・レート制限に従って待機・失敗時に再送しながら行う。
+    sleep / now は時間を進めずに確認するために差し替えられる。
+    """
+
+    def __init__(self, sink, max_retries=MAX_RETRIES, backoff=BACKOFF_BASE, max_backoff=MAX_BACKOFF,
+                 max_rate_limit_wait=MAX_RATE_LIMIT_WAIT, sleep=time.sleep, now=time.time):
+        self.sink = sink
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_rate_limit_wait = max_rate_limit_wait
+        self._sleep = sleep
+        self._now = now
+        self._blocked_until = 0.0
+        self.sent = 0
+        self.retries = 0
+
+    def dispatch(self, header, lines):
+        """
+        header と lines を上限内のメッセージに分けて順に送り、届いたメッセージに含まれる lines の行数を返す。
+        途中で送れなくなったら残りは送らないので、lines[:戻り値] が届いた分になる (すべて送れたら len(lines))。
+        """
+        chunks = self._chunk(header, lines)
+        delivered = 0
+        for i, message in enumerate(self._format(header, chunks)):
+            if not self.send(message):
+                logger.error(f"通知の送信を中断しました ({i}/{len(chunks)}通 送信済み)")
+                break
+            delivered += len(chunks[i])
+        return delivered
+
+    def batch(self, header, lines):
+        """
+        1通が sink.max_message_chars 以内になるように lines を分ける。
+        複数通になる場合は header に (1/3) のような通し番号を付ける。
+        """
+        return self._format(header, self._chunk(header, lines))
+
+    def _chunk(self, header, lines):
+        limit = self.sink.max_message_chars
+        budget = limit - len(header) - len(" (99/99)") - 2
+        chunks, current, size = [], [], 0
+        for line in lines:
+            if len(line) > budget:
+                line = line[:budget - 1] + "…"
+            if current and size + len(line) + 1 > budget:
+                chunks.append(current)
+                current, size = [], 0
+            current.append(line)
+            size += len(line) + 1
+        if current or not chunks:
+            chunks.append(current)
+        return chunks
+
+    def _format(self, header, chunks):
+        total = len(chunks)
+        messages = []
+        for i, chunk in enumerate(chunks, 1):
+            title = f"{header} ({i}/{total})" if total > 1 else header
+            messages.append("\n" + "\n".join([title] + chunk))
+        return messages
+
+    def send(self, message):
+        """1通を送る。レート制限中なら解除まで待ち、一時的な失敗は再送する"""
+        for attempt in range(self.max_retries + 1):
+            if not self._wait_for_rate_limit():
+                return False
+            try:
+                response = self.sink.send(message)
+            except (requests.RequestException, OSError) as e:
+                logger.warning(f"通知の送信に失敗しました ({attempt + 1}回目): {e}")
+                self._retry_wait(attempt)
+                continue
+
+            self._update_rate_limit(response)
+            if response.ok:
+                self.sent += 1
+                return True
+            if response.status == 429:
+                retry_after = _header_float(response.headers, "Retry-After")
+                if retry_after is not None:
+                    self._blocked_until = max(self._blocked_until, self._now() + retry_after)
+                elif self._blocked_until <= self._now():
+                    self._retry_wait(attempt)
+                logger.warning(f"通知のレート制限に達しました ({attempt + 1}回目)")
+                self.retries += 1
+                continue
+            if response.status >= 500:
+                logger.warning(f"通知サーバーのエラー: HTTP {response.status} ({attempt + 1}回目)")
+                self._retry_wait(attempt)
+                continue
+            logger.error(f"通知を送信できません: HTTP {response.status}")
+            return False
+        logger.error("通知の再送回数の上限に達しました。")
+        return False
+
+    def close(self):
+        self.sink.close()
+
+    def _retry_wait(self, attempt):
+        self.retries += 1
+        if attempt < self.max_retries:
+            self._sleep(min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+    def _wait_for_rate_limit(self):
+        wait = self._blocked_until - self._now()
+        if wait <= 0:
+            return True
+        if wait > self.max_rate_limit_wait:
+            logger.error(f"通知のレート制限の解除まで {int(wait)}秒 かかるため、今回の送信は見送ります。")
+            return False
+        logger.info(f"通知のレート制限の解除を待ちます ({wait:.0f}秒)")
+        self._sleep(wait)
+        return True
+
+    def _update_rate_limit(self, response):
+        # LINE Notify: X-RateLimit-Remaining が 0 になったら X-RateLimit-Reset (UTC epoch 秒) まで送れない
+        remaining = _header_float(response.headers, "X-RateLimit-Remaining")
+        reset = _header_float(response.headers, "X-RateLimit-Reset")
+        if remaining is not None and remaining <= 0 and reset is not None:
+            self._blocked_until = max(self._blocked_until, reset)
+
+
+def _header_float(headers, name):
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,127 @@
+"""
+LINE Notify の代わりに通知を受け取るローカルスタブサーバー。
+
+    python -m src.notify_stub --port 8766 --limit 5
+    LINE_NOTIFY_API=http://127.0.0.1:8766/api/notify LINE_NOTIFY_TOKEN=dummy python -m src.alert_bot
+
+受けたメッセージを記録し、LINE Notify と同じ X-RateLimit-* ヘッダを返す。
+limit 回を超えると 429 を返し、fail_first を指定すると最初の N 回は 500 を返す (再送の確認用)。
+"""
+import json
+import time
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+logger = logging.getLogger(__name__)
+
+
+class StubNotifyServer:
+    """POST /api/notify (form の message) を受け取るスタブ。受けたメッセージは messages に残る"""
+
+    def __init__(self, host="127.0.0.1", port=0, limit=None, window=3600, retry_after=None, fail_first=0):
+        self.limit = limit
+        self.window = window
+        self.retry_after = retry_after
+        self.fail_first = fail_first
+        self.messages = []
+        self.requests = []  # 受けたリクエストの (status, Authorization) 記録
+        self._reset_at = time.time() + window
+        self._accepted = 0  # 現在の window で受け付けた数
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/api/notify"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def respond(self, message, authorization):
+        """(status, headers) を決め、受け付けたメッセージを記録する"""
+        with self._lock:
+            now = time.time()
+            if now >= self._reset_at:
+                self._reset_at = now + self.window
+                self._accepted = 0
+            headers = {"X-RateLimit-Reset": str(int(self._reset_at))}
+            if self.limit is not None:
+                headers["X-RateLimit-Limit"] = str(self.limit)
+
+            if self.fail_first > 0:
+                self.fail_first -= 1
+                status = 500
+            elif self.limit is not None and self._accepted >= self.limit:
+                status = 429
+                if self.retry_after is not None:
+                    headers["Retry-After"] = str(self.retry_after)
+            else:
+                status = 200
+                self.messages.append(message)
+                self._accepted += 1
+            if self.limit is not None:
+                headers["X-RateLimit-Remaining"] = str(max(0, self.limit - self._accepted))
+            self.requests.append((status, authorization))
+        return status, headers
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                form = dict(parse_qsl(self.rfile.read(length).decode("utf-8"))) if length else {}
+                status, headers = server.respond(form.get("message", ""), self.headers.get("Authorization"))
+                payload = json.dumps({"status": status, "message": "ok" if status == 200 else "error"}).encode("utf-8")
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, fmt, *args):
+                logger.debug(fmt % args)
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="LINE Notify のスタブサーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--limit", type=int, default=None, help="window 秒あたりの受付上限")
+    parser.add_argument("--window", type=int, default=3600)
+    parser.add_argument("--retry-after", type=int, default=None)
+    parser.add_argument("--fail-first", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    srv = StubNotifyServer(args.host, args.port, args.limit, args.window, args.retry_after, args.fail_first)
+    print(f"Accepting notifications on {srv.url}")
+    try:
+        srv._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for message in srv.messages:
+            print(message)
@@ -0,0 +1,139 @@
+"""
+記録済みレスポンス (カセット) を再生するローカルスタブサーバー。
+
+    python -m src.http_backend --record cassette.json        # 本番から記録
+    python -m src.replay_server cassette.json --port 8765    # 再生
+    PORTAL_BASE_URL=http://127.0.0.1:8765 ...               # HTTP バックエンドの向き先を変更
+"""
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+
+logger = logging.getLogger(__name__)
+
+# リクエスト照合時に無視するクエリ (キャッシュ回避用の乱数など)
+IGNORED_QUERY_KEYS = {"_", "time", "portal_id"}
+
+
+class ReplayServer:
+    """
+    カセット (http_backend.PortalClient の記録形式) のレスポンスを返す HTTP サーバー。
+    method + path + クエリ (+ POST ボディ) が一致する記録を探し、
+    同じリクエストが複数記録されていれば記録順に返す。
+    """
+
+    def __init__(self, cassette, host="127.0.0.1", port=0):
+        if isinstance(cassette, str):
+            with open(cassette, encoding="utf-8") as f:
+                cassette = json.load(f)
+        self.exchanges = list(cassette)
+        self.requests = []  # 受けたリクエストの (method, path, X-UserToken) 記録
+        self._cursor = {}
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def match(self, method, path, query, body):
+        query = {k: v for k, v in query.items() if k not in IGNORED_QUERY_KEYS}
+        candidates = []
+        for i, ex in enumerate(self.exchanges):
+            if ex["method"] != method or ex["path"] != path:
+                continue
+            recorded = {k: v for k, v in ex.get("query", {}).items() if k not in IGNORED_QUERY_KEYS}
+            if recorded != query:
+                continue
+            if method == "POST" and ex.get("body") is not None and ex.get("body") != body:
+                continue
+            candidates.append(i)
+        if not candidates:
+            return None
+        key = (method, path, json.dumps(query, sort_keys=True), json.dumps(body, sort_keys=True))
+        with self._lock:
+            n = self._cursor.get(key, 0)
+            self._cursor[key] = n + 1
+        # 記録より多く呼ばれた場合は最後の記録を返し続ける
+        return self.exchanges[candidates[min(n, len(candidates) - 1)]]
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _serve(self, method):
+                parts = urlsplit(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                try:
+                    body = json.loads(raw) if raw else None
+                except ValueError:
+                    body = None
+                with server._lock:
+                    server.requests.append((method, parts.path, self.headers.get("X-UserToken")))
+
+                ex = server.match(method, parts.path, dict(parse_qsl(parts.query)), body)
+                if ex is None:
+                    logger.warning(f"未記録のリクエスト: {method} {self.path}")
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+
+                response = ex.get("response")
+                if isinstance(response, str):
+                    payload = response.encode("utf-8")
+                else:
+                    payload = json.dumps(response, ensure_ascii=False).encode("utf-8")
+                self.send_response(ex.get("status", 200))
+                self.send_header("Content-Type", ex.get("content_type") or "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self._serve("GET")
+
+            def do_POST(self):
+                self._serve("POST")
+
+            def log_message(self, fmt, *args):
+                logger.debug(fmt % args)
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="記録済みレスポンスを再生するスタブサーバー")
+    parser.add_argument("cassette")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    srv = ReplayServer(args.cassette, args.host, args.port)
+    print(f"Replaying {len(srv.exchanges)} responses on {srv.url}")
+    try:
+        srv._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
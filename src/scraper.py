@@ -1,6 +1,10 @@
-import time
+import os
+import queue
+import atexit
 import logging
-import pandas as pd
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
@@ -8,204 +12,426 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
 from webdriver_manager.chrome import ChromeDriverManager
-from bs4 import BeautifulSoup
+from src.driver_pool import DriverPool
+from src.waits import WAITS
+from src.table_parser import fetch_candidate_fragments, parse_tables
+from src.fingerprints import FingerprintStore, fingerprint, make_key
+from src.slots import SlotTable
+from src.spans import SPANS
+from src.catalog import Catalog
+from src import browser_profiles
 
 # ログ設定
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # --- 設定定数 ---
-TARGET_URL = "https://fujisawacity.service-now.com/facilities_reservation"
+PORTAL_BASE_URL = os.getenv("PORTAL_BASE_URL", "https://fujisawacity.service-now.com").rstrip("/")
+TARGET_URL = f"{PORTAL_BASE_URL}/facilities_reservation"
 WEEKS_TO_FETCH = 12  # 現在週 + 次へボタン11回クリック (約3ヶ月)
 MAX_RETRIES = 3
+MAX_WORKERS = int(os.getenv("SCRAPER_WORKERS", "1"))  # 室場巡回の並列数 (Chrome Driver数)
+FALLBACK_ROOM = "検索結果一覧"  # 室場リンクが見つからなかったときに検索結果ページ自体を巡回する際の名前
 
-def setup_driver():
-    """Chrome Driverの設定と起動"""
+@functools.lru_cache(maxsize=1)
+def _chromedriver_path():
+    """ChromeDriverManager のインストール/バージョン確認はプロセス内で1回だけ行う"""
+    return ChromeDriverManager().install()
+
+def setup_driver(profile=None):
+    """Chrome Driverの設定と起動 (profile はブラウザプロファイル名。省略時は BROWSER_PROFILE)"""
     options = Options()
-    
-    # --- Headless Mode Toggle ---
-    # デバッグ時は以下の行をコメントアウトしてブラウザを表示させる
-    options.add_argument("--headless") 
-    
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    options.add_argument("--window-size=1920,1080")
-    
-    # 検出/ブロック回避のためのユーザーエージェント設定
-    options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
+    # デバッグ時は BROWSER_PROFILE=full BROWSER_HEADLESS=0 でブラウザを表示させる
+    slot = browser_profiles.configure_options(options, profile)
 
     try:
-        service = Service(ChromeDriverManager().install())
+        service = Service(_chromedriver_path())
         driver = webdriver.Chrome(service=service, options=options)
-        return driver
+        return browser_profiles.start_profile(driver, profile, slot)
     except Exception as e:
+        if slot is not None:
+            slot.release()
         logger.error(f"Chrome Driverの起動に失敗しました: {e}")
         raise e
 
-def safe_click_js(driver, element):
-    """JavaScriptを使用してクリックを行う（オーバーレイ要素対策）"""
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+def get_default_pool():
+    """
+    プロセス内で共有する DriverPool を返す (初回呼び出し時に作成)。
+    起動済みの Driver を再利用し、リトライや並列巡回のたびに Chrome を起動し直さない。
+    """
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = DriverPool(setup_driver, size=MAX_WORKERS, warm_url=TARGET_URL)
+            atexit.register(_default_pool.close)
+        return _default_pool
+
+def safe_click_js(driver, element, wait_label=None):
+    """
+    JavaScriptを使用してクリックを行う（オーバーレイ要素対策）
+    wait_label を指定した場合はクリック結果 (遷移/DOM変更) が落ち着くまで待つ
+    """
     try:
         driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", element)
-        time.sleep(0.5)
+        token = WAITS.document_token(driver) if wait_label else None
         driver.execute_script("arguments[0].click();", element)
+        if wait_label:
+            WAITS.action_settled(driver, token, wait_label)
         return True
     except Exception as e:
         logger.warning(f"JSクリック失敗: {e}")
         return False
 
-def fetch_availability(keyword="バレーボール", progress_callback=None):
+def collect_room_urls(driver, wait, keyword, update_status, tracer=None):
     """
-    藤沢市施設予約システムから空き状況を取得するメイン関数
+    キーワード検索を行い、施設を展開して (室場名, URL) のリストを返す
     """
-    driver = setup_driver()
-    wait = WebDriverWait(driver, 15)
-    results = []
-
-    def update_status(msg):
-        if progress_callback:
-            progress_callback(msg)
-        logger.info(msg)
-
-    try:
+    tracer = tracer or SPANS.tracer()
+    with tracer.span("initial_search"):
         # 1. サイトアクセス
         update_status("サイトにアクセス中...")
         driver.get(TARGET_URL)
-        time.sleep(3) 
+        WAITS.page_ready(driver, "initial_load")
 
         # 2. キーワード検索
         try:
             search_input = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "input[type='search'], input[placeholder*='検索']")))
             search_input.clear()
             search_input.send_keys(keyword)
+            token = WAITS.document_token(driver)
             search_input.submit()
             update_status(f"キーワード「{keyword}」で検索中...")
-            time.sleep(5) 
+            WAITS.action_settled(driver, token, "search_results")
         except Exception as e:
-            logger.error(f"検索ボックスエラー: {e}")
-            return pd.DataFrame() # 空のDFを返す
+            raise RuntimeError(f"検索ボックスエラー: {e}") from e
 
-        # 3. 施設の展開
+    # 3. 施設の展開
+    with tracer.span("accordion"):
         expand_buttons = driver.find_elements(By.CSS_SELECTOR, "button.expand-icon, i.fa-caret-right, span.icon-caret-right")
         for btn in expand_buttons:
-            safe_click_js(driver, btn)
-            time.sleep(0.5)
-        
-        update_status("施設リストを展開しました。室場情報をスキャンします...")
-
-        # 4. 室場リンクの取得
-        room_links_elements = driver.find_elements(By.CSS_SELECTOR, "a.room-link, td.room-name a")
-        # フォールバック
-        if not room_links_elements:
-             room_links_elements = [
-                 elem for elem in driver.find_elements(By.TAG_NAME, "a") 
-                 if "空き" in elem.text or "予約" in elem.text or "calendar" in (elem.get_attribute("href") or "")
-             ]
-
-        room_urls = []
-        for elem in room_links_elements:
-            try:
-                url = elem.get_attribute("href")
-                if url and "javascript" not in url:
-                    room_urls.append((elem.text, url))
-            except:
-                pass
+            safe_click_js(driver, btn, wait_label="expand")
+    
+    update_status("施設リストを展開しました。室場情報をスキャンします...")
+
+    # 4. 室場リンクの取得
+    room_links_elements = driver.find_elements(By.CSS_SELECTOR, "a.room-link, td.room-name a")
+    # フォールバック
+    if not room_links_elements:
+         room_links_elements = [
+             elem for elem in driver.find_elements(By.TAG_NAME, "a") 
+             if "空き" in elem.text or "予約" in elem.text or "calendar" in (elem.get_attribute("href") or "")
+         ]
+
+    room_urls = []
+    for elem in room_links_elements:
+        try:
+            url = elem.get_attribute("href")
+            if url and "javascript" not in url:
+                room_urls.append((elem.text, url))
+        except:
+            pass
+    
+    if not room_urls:
+        room_urls = [(FALLBACK_ROOM, driver.current_url)]
+
+    return room_urls
+
+def parse_week_rows(tables, facility_name, room_name):
+    """週表示の空き状況テーブルから空き (○/△) の行を取り出す"""
+    results = []
+    target_table = None
+    for tbl in tables:
+        if "空" in tbl.text or "○" in tbl.text or "×" in tbl.text:
+            target_table = tbl
+            break
+    
+    if target_table:
+        rows = target_table.rows
+        headers = [cell.text for cell in rows[0]]
         
+        for cols in rows[1:]:
+            if not cols: continue
+            
+            date_col = cols[0].text
+            
+            for i, td in enumerate(cols[1:]):
+                status = td.text
+                normalized_status = "×"
+                if "○" in status or "空" in status:
+                    normalized_status = "○"
+                elif "△" in status:
+                    normalized_status = "△"
+                elif "休" in status or "-" in status:
+                    continue 
+                else:
+                    # 時間外や予約不可も×扱い
+                    continue 
+                
+                time_slot = headers[i+1] if (i+1) < len(headers) else "不明"
+                
+                if normalized_status in ["○", "△"]:
+                    results.append({
+                        "日付": date_col,
+                        "施設名": facility_name,
+                        "室場名": room_name,
+                        "時間": time_slot,
+                        "状況": normalized_status
+                    })
+    return results
+
+def scan_room(driver, wait, room_name, url, store=None, tracer=None):
+    """
+    1つの室場のカレンダーを WEEKS_TO_FETCH 週分巡回し、空き行を SlotTable で返す
+    store (FingerprintStore) を渡すと、前回と内容が同じ週は解析を省略する
+    tracer (src.spans) を渡すと、遷移・解析・週送りの時間を施設名のラベル付きで記録する
+    """
+    tracer = tracer or SPANS.tracer()
+    results = SlotTable()
+
+    with tracer.span("navigation", room=room_name) as nav_span:
+        if url != driver.current_url:
+            driver.get(url)
+            WAITS.page_ready(driver, "room_page")
+
+        try:
+            facility_name_elem = driver.find_elements(By.CSS_SELECTOR, "h1, h2, .facility-title")
+            facility_name = facility_name_elem[0].text if facility_name_elem else "不明な施設"
+        except:
+            facility_name = "不明な施設"
+        nav_span.labels["facility"] = facility_name
+        if not driver.find_elements(By.TAG_NAME, "table"):
+            raise RuntimeError(f"{room_name}: 空き状況の表がありません ({url})")
+    tracer = tracer.bind(facility=facility_name, room=room_name)
+
+    # 6. 週次データの取得
+    for week in range(WEEKS_TO_FETCH):
+        try:
+            with tracer.span("parse", week=week):
+                wait.until(EC.presence_of_element_located((By.TAG_NAME, "table")))
+                fragments = fetch_candidate_fragments(driver)
+
+                # 前回と同じ内容の週は解析せず、保存済みの行を使う
+                key = make_key(facility_name, room_name, week)
+                digest = fingerprint(fragments)
+                cached = store.lookup(key, digest) if store else None
+                if cached is not None:
+                    results.extend(cached)
+                else:
+                    week_rows = parse_week_rows(parse_tables(fragments), facility_name, room_name)
+                    results.extend(week_rows)
+                    if store:
+                        store.update(key, digest, week_rows)
+
+            # 次へボタン
+            if week < WEEKS_TO_FETCH - 1:
+                with tracer.span("calendar_click", week=week + 1):
+                    next_btns = driver.find_elements(By.CSS_SELECTOR, "button.next, a.next-week, i.fa-chevron-right")
+                    clicked = False
+                    for btn in next_btns:
+                         try:
+                            before = WAITS.table_signature(driver)
+                            safe_click_js(driver, btn)
+                            WAITS.table_changed(driver, before, "next_week")
+                            clicked = True
+                            break
+                         except:
+                             continue
+                if not clicked:
+                    break 
+                    
+        except Exception as e:
+            # 途中の週で止めると室場の結果が欠けたまま成功扱いになるので、室場の失敗として呼び出し元に数えさせる
+            raise RuntimeError(f"{room_name}: {week + 1}週目の取得に失敗しました ({e})") from e
+
+    return results
+
+class IncompleteScanError(RuntimeError):
+    """一部の室場を取得できなかったスキャン。取得できた分の結果を frame に持つ"""
+
+    def __init__(self, message, frame, failures):
+        super().__init__(message)
+        self.frame = frame
+        self.failures = failures
+
+def _scan_rooms_parallel(pool, room_urls, workers, update_status, store=None, tracer=None):
+    """
+    室場リストをワーカーごとの Chrome Driver に振り分けて並列に巡回する。
+    各ワーカーは共有キューから室場を取り出し、自分専用の Driver で処理する。
+    戻り値は room_urls と同じ順序に並んだ室場ごとの結果リスト
+    (取得に失敗した室場と、Driver を起動できず巡回されなかった室場は None)。
+    """
+    total_rooms = len(room_urls)
+    jobs = queue.Queue()
+    for idx, room in enumerate(room_urls):
+        jobs.put((idx, room))
+
+    # 巡回されなかった室場を空の成功と区別できるよう、None で初期化する
+    per_room = [None] * total_rooms
+    done_lock = threading.Lock()
+    done = [0]
+
+    tracer = tracer or SPANS.tracer()
+
+    def worker(worker_id):
+        worker_tracer = tracer.bind(worker=worker_id)
+        driver = None
+        try:
+            with worker_tracer.span("driver_startup"):
+                driver = pool.acquire()
+        except Exception as e:
+            update_status(f"[W{worker_id}] Driver起動失敗: {e}")
+            return
+        wait = WebDriverWait(driver, 15)
+        failed = False
+        try:
+            while True:
+                try:
+                    idx, (room_name, url) = jobs.get_nowait()
+                except queue.Empty:
+                    break
+
+                update_status(f"[W{worker_id}] [{idx+1}/{total_rooms}] {room_name} の空き状況を確認中...")
+                try:
+                    per_room[idx] = scan_room(driver, wait, room_name, url, store, worker_tracer)
+                except Exception as e:
+                    logger.error(f"[W{worker_id}] {room_name} の取得に失敗しました: {e}")
+                    per_room[idx] = None
+                    failed = True
+
+                with done_lock:
+                    done[0] += 1
+                    finished = done[0]
+                update_status(f"[W{worker_id}] {room_name}: {len(per_room[idx] or [])}件 (完了 {finished}/{total_rooms})")
+                if failed:
+                    # 状態の分からない Driver は破棄し、新しいものに取り替えて続行する
+                    pool.release(driver, discard=True)
+                    driver = None
+                    try:
+                        with worker_tracer.span("driver_startup"):
+                            driver = pool.acquire()
+                    except Exception as e:
+                        # 残りの室場は他のワーカーに任せる (誰も巡回しなければ None のまま失敗として数える)
+                        update_status(f"[W{worker_id}] Driver起動失敗: {e}")
+                        return
+                    wait = WebDriverWait(driver, 15)
+                    failed = False
+        finally:
+            if driver is not None:
+                pool.release(driver)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scraper") as executor:
+        futures = [executor.submit(worker, w + 1) for w in range(workers)]
+        for future in futures:
+            future.result()
+
+    return per_room
+
+def fetch_availability(keyword="バレーボール", progress_callback=None, workers=None, pool=None, incremental=True):
+    """
+    藤沢市施設予約システムから空き状況を取得するメイン関数
+
+    workers に 2 以上を指定すると、室場ごとの巡回を複数の Chrome Driver で並列に行う。
+    未指定の場合は環境変数 SCRAPER_WORKERS (デフォルト 1 = 逐次実行) を使用する。
+    Driver は pool (未指定時は get_default_pool()) から借りて使い回す。
+    incremental=True の場合、前回と内容が変わっていない週のページは解析せずに前回の結果を使う。
+    検索で見つけた室場の URL は施設カタログ (src.catalog) に保存し、期限内なら検索・展開を省いて直接開く。
+    開けない室場があった場合はカタログを破棄し、次回は検索からやり直す。
+    検索に失敗した場合は例外を、一部の室場を取得できなかった場合は IncompleteScanError を送出する
+    (空の結果や一部だけの結果を「空きが無くなった」と区別できるように)。
+    """
+    if workers is None:
+        workers = MAX_WORKERS
+    workers = max(1, int(workers))
+    if pool is None:
+        pool = get_default_pool()
+    if workers > pool.size:
+        pool.resize(workers)
+
+    store = FingerprintStore() if incremental else None
+    catalog = Catalog()
+    catalog_source = make_key("scraper", TARGET_URL, keyword)
+    scan = SPANS.begin_scan("scraper")
+    tracer = SPANS.tracer(scan, attempt=1)
+
+    try:
+        with tracer.span("driver_startup"):
+            driver = pool.acquire()
+    except Exception:
+        SPANS.end_scan(scan, ok=False)
+        raise
+    failed = False
+    wait = WebDriverWait(driver, 15)
+    results = SlotTable()
+
+    def update_status(msg):
+        if progress_callback:
+            progress_callback(msg)
+        logger.info(msg)
+
+    from_catalog = False
+    room_failures = 0
+    try:
+        known = catalog.get(catalog_source)
+        if known:
+            room_urls = [(entry["room"], entry["url"]) for entry in known]
+            from_catalog = True
+            update_status(f"保存済みの施設カタログから {len(room_urls)}件の室場を直接開きます...")
+        else:
+            room_urls = collect_room_urls(driver, wait, keyword, update_status, tracer)
         if not room_urls:
-            room_urls = [("検索結果一覧", driver.current_url)]
+            raise RuntimeError("室場が見つかりませんでした")
 
         total_rooms = len(room_urls)
         update_status(f"{total_rooms}件の室場が見つかりました。詳細データを取得します...")
 
         # 5. 各室場のカレンダーを巡回
-        for idx, (room_name, url) in enumerate(room_urls):
-            update_status(f"[{idx+1}/{total_rooms}] {room_name} の空き状況を確認中...")
-            
-            if url != driver.current_url:
-                driver.get(url)
-                time.sleep(3)
-
-            try:
-                facility_name_elem = driver.find_elements(By.CSS_SELECTOR, "h1, h2, .facility-title")
-                facility_name = facility_name_elem[0].text if facility_name_elem else "不明な施設"
-            except:
-                facility_name = "不明な施設"
-
-            # 6. 週次データの取得
-            for week in range(WEEKS_TO_FETCH):
+        if workers > 1 and total_rooms > 1:
+            # 検索に使った Driver はプールに返し、ワーカーが再利用できるようにする
+            pool.release(driver)
+            driver = None
+            workers = min(workers, total_rooms)
+            update_status(f"{workers}並列で巡回します...")
+            for rows in _scan_rooms_parallel(pool, room_urls, workers, update_status, store, tracer):
+                if rows is None:
+                    room_failures += 1
+                else:
+                    results.extend(rows)
+        else:
+            for idx, (room_name, url) in enumerate(room_urls):
+                update_status(f"[{idx+1}/{total_rooms}] {room_name} の空き状況を確認中...")
                 try:
-                    wait.until(EC.presence_of_element_located((By.TAG_NAME, "table")))
-                    soup = BeautifulSoup(driver.page_source, "html.parser")
-                    
-                    tables = soup.find_all("table")
-                    target_table = None
-                    for tbl in tables:
-                        if "空" in tbl.text or "○" in tbl.text or "×" in tbl.text:
-                            target_table = tbl
-                            break
-                    
-                    if target_table:
-                        rows = target_table.find_all("tr")
-                        headers = [th.get_text(strip=True) for th in rows[0].find_all(["th", "td"])]
-                        
-                        for tr in rows[1:]:
-                            cols = tr.find_all(["th", "td"])
-                            if not cols: continue
-                            
-                            date_col = cols[0].get_text(strip=True)
-                            
-                            for i, td in enumerate(cols[1:]):
-                                status = td.get_text(strip=True)
-                                normalized_status = "×"
-                                if "○" in status or "空" in status:
-                                    normalized_status = "○"
-                                elif "△" in status:
-                                    normalized_status = "△"
-                                elif "休" in status or "-" in status:
-                                    continue 
-                                else:
-                                    # 時間外や予約不可も×扱い
-                                    continue 
-                                
-                                time_slot = headers[i+1] if (i+1) < len(headers) else "不明"
-                                
-                                if normalized_status in ["○", "△"]:
-                                    results.append({
-                                        "日付": date_col,
-                                        "曜日": date_col[-2] if "(" in date_col else "",
-                                        "施設名": facility_name,
-                                        "室場名": room_name,
-                                        "時間": time_slot,
-                                        "状況": normalized_status
-                                    })
-
-                    # 次へボタン
-                    if week < WEEKS_TO_FETCH - 1:
-                        next_btns = driver.find_elements(By.CSS_SELECTOR, "button.next, a.next-week, i.fa-chevron-right")
-                        clicked = False
-                        for btn in next_btns:
-                             try:
-                                safe_click_js(driver, btn)
-                                time.sleep(2)
-                                clicked = True
-                                break
-                             except:
-                                 continue
-                        if not clicked:
-                            break 
-                            
+                    results.extend(scan_room(driver, wait, room_name, url, store, tracer))
                 except Exception as e:
-                    break
+                    logger.error(f"{room_name} の取得に失敗しました: {e}")
+                    room_failures += 1
+
+        if room_failures and from_catalog:
+            update_status(f"{room_failures}件の室場が開けませんでした。次回は施設を検索し直します。")
+            catalog.invalidate(catalog_source)
+        elif not from_catalog and not room_failures and [name for name, _ in room_urls] != [FALLBACK_ROOM]:
+            catalog.put(catalog_source, [{"facility": None, "room": name, "url": url, "recipe": None}
+                                         for name, url in room_urls])
 
     except Exception as e:
         logger.error(f"スクレイピング全体エラー: {e}")
+        failed = True
+        raise
     finally:
-        driver.quit()
+        if driver:
+            pool.release(driver, discard=failed)
+        if store:
+            store.save()
+        SPANS.end_scan(scan, ok=not failed and not room_failures)
         update_status("スクレイピング完了")
 
-    if not results:
-        return pd.DataFrame(columns=['日付', '曜日', '施設名', '室場名', '時間', '状況'])
-        
-    return pd.DataFrame(results)
+    # 行が無くても有っても同じ列 (曜日を含む) にする
+    frame = results.to_frame(weekday=True)
+    if room_failures:
+        raise IncompleteScanError(f"{room_failures}/{len(room_urls)}件の室場を取得できませんでした", frame, room_failures)
+    return frame
 
 if __name__ == "__main__":
     df = fetch_availability()
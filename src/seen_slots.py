@@ -0,0 +1,102 @@
+import os
+import json
+import time
+import logging
+import threading
+
+from src.fingerprints import CACHE_DIR, make_key
+
+logger = logging.getLogger(__name__)
+
+# --- 設定定数 ---
+SEEN_SLOTS_PATH = os.path.join(CACHE_DIR, "seen_slots.json")
+# この時間確認されなかった枠は忘れる (監視が止まっていた間に空いて埋まった枠などを持ち越さない)
+SEEN_SLOT_MAX_AGE = int(os.getenv("SEEN_SLOT_MAX_AGE", str(2 * 24 * 3600)))
+
+
+def slot_key(slot):
+    return make_key(slot.get("日付"), slot.get("時間"), slot.get("施設名"), slot.get("室場名"))
+
+
+class SeenSlotStore:
+    """
+    前回までに通知した空き枠を保存し、今回の結果との差分 (新しく空いた枠・埋まった枠) を求める。
+    監視ボットを cron / GitHub Actions で起動するたびに同じ枠を通知しないためのもの。
+    """
+
+    def __init__(self, path=SEEN_SLOTS_PATH, max_age=SEEN_SLOT_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self._entries = {}
+        self._staged = None
+        self._pending = (set(), {})
+        self._lock = threading.Lock()
+        self._load()
+
+    def diff(self, slots, now=None):
+        """
+        今回見つかった空き枠 slots と保存済みの枠を比べ、(新しく空いた枠, 埋まった枠) を返す。
+        今回の結果は commit() を呼んだときに保存内容と置き換わる (通知できなかった枠は commit に含めず、次回また差分になる)。
+        """
+        now = now or time.time()
+        current = {}
+        for slot in slots:
+            current.setdefault(slot_key(slot), slot)
+
+        with self._lock:
+            cutoff = now - self.max_age
+            previous = {k: v for k, v in self._entries.items() if v["last_seen"] >= cutoff}
+            opened = [slot for key, slot in current.items() if key not in previous]
+            closed = [entry["slot"] for key, entry in previous.items() if key not in current]
+            # 一部しか通知できなかった場合に、届かなかった枠を次回の差分に残すため
+            self._pending = ({slot_key(slot) for slot in opened},
+                             {key: entry for key, entry in previous.items() if key not in current})
+            self._staged = {
+                key: {
+                    "slot": dict(slot),
+                    "first_seen": previous[key]["first_seen"] if key in previous else now,
+                    "last_seen": now,
+                }
+                for key, slot in current.items()
+            }
+        return opened, closed
+
+    def __len__(self):
+        return len(self._entries)
+
+    def commit(self, delivered=None):
+        """
+        直前の diff() の結果を保存内容として確定し、ファイルに書き出す。
+        delivered (通知できた枠のリスト) を渡すと、それ以外の新しく空いた枠・埋まった枠は前回の状態のまま残し、次回また差分として返す。
+        """
+        with self._lock:
+            if self._staged is None:
+                return
+            entries, self._staged = self._staged, None
+            if delivered is not None:
+                done = {slot_key(slot) for slot in delivered}
+                opened, closed = self._pending
+                for key in opened - done:
+                    entries.pop(key, None)
+                for key, entry in closed.items():
+                    if key not in done:
+                        entries[key] = entry
+            self._entries = entries
+            data = json.dumps(self._entries, ensure_ascii=False)
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning(f"通知済みの枠の保存に失敗しました: {e}")
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self._entries = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"通知済みの枠の読み込みに失敗しました。すべて新しい枠として扱います: {e}")
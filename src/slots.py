@@ -0,0 +1,223 @@
+import enum
+from array import array
+
+import numpy as np
+import pandas as pd
+
+RESULT_COLUMNS = ['日付', '施設名', '室場名', '時間', '状況']
+# src.scraper の結果の列 (曜日は日付表記 "10/18(土)" の括弧内から取る)
+WEEKDAY_RESULT_COLUMNS = ['日付', '曜日', '施設名', '室場名', '時間', '状況']
+
+
+def weekday_label(date_label):
+    """"10/18(土)" → "土"。括弧が無ければ空文字"""
+    return date_label[-2] if "(" in date_label else ""
+
+
+class SlotStatus(enum.IntEnum):
+    """空き状況の記号。ここに無い表記は SlotTable 側で 100 番以降の番号を割り当てる"""
+    AVAILABLE = 0  # ○
+    FEW = 1        # △
+    FULL = 2       # ×
+
+    @property
+    def symbol(self):
+        return _STATUS_SYMBOLS[self]
+
+
+_STATUS_SYMBOLS = {SlotStatus.AVAILABLE: "○", SlotStatus.FEW: "△", SlotStatus.FULL: "×"}
+_STATUS_CODES = {symbol: status for status, symbol in _STATUS_SYMBOLS.items()}
+_EXTRA_STATUS_BASE = 100
+
+
+class Interner:
+    """文字列 ⇔ 連番 ID の対応表。施設名・室場名などを行ごとに持たず ID で参照する"""
+    __slots__ = ("values", "_ids")
+
+    def __init__(self, values=()):
+        self.values = []
+        self._ids = {}
+        for value in values:
+            self.intern(value)
+
+    def intern(self, value):
+        found = self._ids.get(value)
+        if found is None:
+            found = self._ids[value] = len(self.values)
+            self.values.append(value)
+        return found
+
+    def __len__(self):
+        return len(self.values)
+
+
+class SlotTable:
+    """
+    空き枠を列ごとの整数配列で持つ表。
+    施設・室場・日付表記・時間帯は Interner の ID、状況は SlotStatus の番号で保持するので、
+    施設数や期間が増えても1行あたりのメモリは一定 (約 17 byte) になる。
+
+    list と同じように append / extend / len / スライス / 反復ができ、反復すると従来と同じ
+    {"日付", "施設名", "室場名", "時間", "状況"} の dict を返す。DataFrame への変換 (to_frame) は
+    画面表示や保存の直前でだけ行う。
+    """
+    __slots__ = ("facilities", "rooms", "dates", "times", "extra_statuses",
+                 "facility_ids", "room_ids", "date_ids", "time_ids", "status_codes", "_keys")
+
+    def __init__(self):
+        self.facilities = Interner()
+        self.rooms = Interner()
+        self.dates = Interner()   # ポータルの日付表記そのもの ("10/18(土)" など)
+        self.times = Interner()   # 時間帯の表記 ("09:00-11:00" など)
+        self.extra_statuses = Interner()
+        self.facility_ids = array("I")
+        self.room_ids = array("I")
+        self.date_ids = array("I")
+        self.time_ids = array("I")
+        self.status_codes = array("H")
+        self._keys = None
+
+    @classmethod
+    def from_records(cls, records):
+        table = cls()
+        table.extend(records)
+        return table
+
+    def __len__(self):
+        return len(self.status_codes)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.record(i)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.take(range(len(self))[index])
+        return self.record(range(len(self))[index])
+
+    @property
+    def nbytes(self):
+        columns = (self.facility_ids, self.room_ids, self.date_ids, self.time_ids, self.status_codes)
+        return sum(col.itemsize * len(col) for col in columns)
+
+    def append(self, record):
+        """{"日付", "施設名", "室場名", "時間", "状況"} の dict を1行追加する (他のキーは捨てる)"""
+        self.add(record.get("施設名", ""), record.get("室場名", ""), record.get("日付", ""),
+                 record.get("時間", ""), record.get("状況", ""))
+
+    def extend(self, records):
+        if isinstance(records, SlotTable):
+            self._extend_table(records)
+            return
+        for record in records:
+            self.append(record)
+
+    def add(self, facility, room, date, time_slot, status):
+        self._push(self._encode(facility, room, date, time_slot, status))
+
+    def _encode(self, facility, room, date, time_slot, status):
+        return (self.facilities.intern(str(facility)), self.rooms.intern(str(room)), self.dates.intern(str(date)),
+                self.times.intern(str(time_slot)), self._status_code(str(status)))
+
+    def _push(self, key):
+        facility_id, room_id, date_id, time_id, status_code = key
+        self.facility_ids.append(facility_id)
+        self.room_ids.append(room_id)
+        self.date_ids.append(date_id)
+        self.time_ids.append(time_id)
+        self.status_codes.append(status_code)
+        if self._keys is not None:
+            self._keys.add(key)
+
+    def record(self, i):
+        facility, room, date, time_slot, status = self._values(i)
+        return {"日付": date, "施設名": facility, "室場名": room, "時間": time_slot, "状況": status}
+
+    def take(self, indices):
+        """指定した行だけの SlotTable (ID の対応表は共有せずに作り直す)"""
+        out = SlotTable()
+        for i in indices:
+            out.add(*self._values(i))
+        return out
+
+    def merge(self, other):
+        """
+        other のうちまだ含まれていない行を追加し、追加した行だけの SlotTable を返す。
+        重複の判定は ID の組 (整数のタプル) で行う。
+        """
+        if not isinstance(other, SlotTable):
+            other = SlotTable.from_records(other)
+        if self._keys is None:
+            self._keys = {self._key(i) for i in range(len(self))}
+        added = SlotTable()
+        for i in range(len(other)):
+            values = other._values(i)
+            key = self._encode(*values)
+            if key not in self._keys:
+                self._push(key)
+                added.add(*values)
+        return added
+
+    def date_ordinals(self, today=None):
+        """各行の日付の序数 (datetime.date.toordinal())。解析できない日付は 0"""
+        from src.jp_calendar import parse_dates
+
+        parsed = parse_dates(pd.Series(self.dates.values, dtype=object), today)
+        ordinals = np.zeros(len(self.dates), dtype=np.int32)
+        valid = parsed.notna().to_numpy()
+        ordinals[valid] = [d.toordinal() for d in parsed[valid].dt.date]
+        return ordinals[np.frombuffer(self.date_ids, dtype=np.uint32)] if len(self) else ordinals[:0]
+
+    def to_frame(self, weekday=False):
+        """
+        従来どおりの列 (RESULT_COLUMNS) の DataFrame にする。
+        weekday=True なら日付表記から取った曜日の列を加える (WEEKDAY_RESULT_COLUMNS、行が無くても同じ列)
+        """
+        if not len(self):
+            return pd.DataFrame(columns=WEEKDAY_RESULT_COLUMNS if weekday else RESULT_COLUMNS)
+        codes = np.frombuffer(self.status_codes, dtype=np.uint16)
+        present = np.unique(codes)
+        symbols = np.empty(int(present.max()) + 1, dtype=object)
+        for code in present:
+            symbols[code] = self._status_symbol(int(code))
+        columns = {"日付": self._column(self.dates, self.date_ids)}
+        if weekday:
+            labels = np.array([weekday_label(d) for d in self.dates.values], dtype=object)
+            columns["曜日"] = labels[np.frombuffer(self.date_ids, dtype=np.uint32)]
+        return pd.DataFrame({
+            **columns,
+            "施設名": self._column(self.facilities, self.facility_ids),
+            "室場名": self._column(self.rooms, self.room_ids),
+            "時間": self._column(self.times, self.time_ids),
+            "状況": symbols[codes],
+        })
+
+    @staticmethod
+    def _column(interner, ids):
+        return np.array(interner.values, dtype=object)[np.frombuffer(ids, dtype=np.uint32)]
+
+    def _extend_table(self, other):
+        for i in range(len(other)):
+            self.add(*other._values(i))
+
+    def _values(self, i):
+        return (self.facilities.values[self.facility_ids[i]], self.rooms.values[self.room_ids[i]],
+                self.dates.values[self.date_ids[i]], self.times.values[self.time_ids[i]],
+                self._status_symbol(self.status_codes[i]))
+
+    def _key(self, i):
+        return (self.facility_ids[i], self.room_ids[i], self.date_ids[i], self.time_ids[i], self.status_codes[i])
+
+    def _status_code(self, symbol):
+        found = _STATUS_CODES.get(symbol)
+        if found is None:
+            found = _EXTRA_STATUS_BASE + self.extra_statuses.intern(symbol)
+        return found
+
+    def _status_symbol(self, code):
+        if code >= _EXTRA_STATUS_BASE:
+            return self.extra_statuses.values[code - _EXTRA_STATUS_BASE]
+        return _STATUS_SYMBOLS[SlotStatus(code)]
@@ -0,0 +1,229 @@
+"""
+巡回の処理段階 (フェーズ) ごとの時間計測。
+
+    scan = SPANS.begin_scan("selenium")
+    tracer = SPANS.tracer(scan, attempt=1)
+    with tracer.span("navigation", facility="藤沢市民センター"):
+        driver.get(url)
+    SPANS.end_scan(scan)
+
+各スパンはフェーズ名・開始時刻・所要時間・成否と facility / attempt などのラベルを持つ。
+end_scan() でその回のスパンを JSON Lines (SCAN_SPANS_PATH) に追記し、
+node_exporter の textfile collector が読む Prometheus 形式 (SCAN_METRICS_PATH) を書き出す。
+"""
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+from src.fingerprints import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+# --- 設定定数 ---
+SCAN_SPANS_PATH = os.getenv("SCAN_SPANS_PATH", os.path.join(CACHE_DIR, "scan_spans.jsonl"))
+SCAN_METRICS_PATH = os.getenv("SCAN_METRICS_PATH", os.path.join(CACHE_DIR, "scan_metrics.prom"))
+RECENT_SCANS = 10  # ダッシュボード用にメモリに残す回数
+
+# フェーズ名と表示名 (ここにないフェーズもそのまま記録する)
+PHASES = {
+    "driver_startup": "Driver 起動・取得",
+    "initial_search": "初期検索",
+    "frame_switch": "フレーム切替",
+    "accordion": "室場一覧の展開",
+    "navigation": "ページ遷移",
+    "parse": "テーブル解析",
+    "calendar_click": "カレンダー操作",
+    "http_fetch": "HTTP 取得",
+}
+
+
+class Span:
+    """1回分の計測結果。labels は with の中で書き足してもよい (施設名が遷移後に分かる場合など)"""
+    __slots__ = ("phase", "started_at", "seconds", "ok", "labels")
+
+    def __init__(self, phase, started_at, labels):
+        self.phase = phase
+        self.started_at = started_at
+        self.seconds = 0.0
+        self.ok = True
+        self.labels = labels
+
+    def to_dict(self):
+        return {"phase": self.phase, "started_at": round(self.started_at, 3),
+                "seconds": round(self.seconds, 4), "ok": self.ok, **self.labels}
+
+
+class ScanTrace:
+    """1回の取得 (scan) 分のスパン"""
+
+    def __init__(self, backend):
+        self.id = uuid.uuid4().hex[:12]
+        self.backend = backend
+        self.started_at = time.time()
+        self.finished_at = None
+        self.ok = None
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    @property
+    def seconds(self):
+        return (self.finished_at or time.time()) - self.started_at
+
+    def summary(self):
+        """フェーズごとの {phase, count, failed, total, mean, max, share} (合計時間の長い順)"""
+        with self._lock:
+            spans = list(self.spans)
+        by_phase = {}
+        for span in spans:
+            by_phase.setdefault(span.phase, []).append(span)
+        total = sum(span.seconds for span in spans) or 1.0
+        rows = []
+        for phase, items in by_phase.items():
+            seconds = [span.seconds for span in items]
+            rows.append({
+                "phase": phase,
+                "count": len(items),
+                "failed": sum(1 for span in items if not span.ok),
+                "total": sum(seconds),
+                "mean": sum(seconds) / len(seconds),
+                "max": max(seconds),
+                "share": sum(seconds) / total,
+            })
+        return sorted(rows, key=lambda row: row["total"], reverse=True)
+
+    def by_facility(self):
+        """施設ごとの合計時間 [秒] (長い順)"""
+        with self._lock:
+            spans = list(self.spans)
+        totals = {}
+        for span in spans:
+            facility = span.labels.get("facility")
+            if facility:
+                totals[facility] = totals.get(facility, 0.0) + span.seconds
+        return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+class Tracer:
+    """scan に、固定のラベル (attempt など) を付けてスパンを記録する"""
+
+    def __init__(self, scan, labels):
+        self.scan = scan
+        self.labels = labels
+
+    def bind(self, **labels):
+        return Tracer(self.scan, {**self.labels, **labels})
+
+    @contextmanager
+    def span(self, phase, **labels):
+        span = Span(phase, time.time(), {**self.labels, **labels})
+        started = time.perf_counter()
+        try:
+            yield span
+        except BaseException:
+            span.ok = False
+            raise
+        finally:
+            span.seconds = time.perf_counter() - started
+            if self.scan is not None:
+                self.scan.add(span)
+
+
+class SpanRecorder:
+    """scan の開始・終了と書き出しを管理する。直近 RECENT_SCANS 回分はメモリに残す"""
+
+    def __init__(self, spans_path=SCAN_SPANS_PATH, metrics_path=SCAN_METRICS_PATH):
+        self.spans_path = spans_path
+        self.metrics_path = metrics_path
+        self._recent = deque(maxlen=RECENT_SCANS)
+        self._lock = threading.Lock()
+
+    def begin_scan(self, backend):
+        return ScanTrace(backend)
+
+    def tracer(self, scan=None, **labels):
+        return Tracer(scan, labels)
+
+    def end_scan(self, scan, ok=True):
+        """scan を終了し、JSON Lines への追記と Prometheus 形式のファイルの書き出しを行う"""
+        scan.finished_at = time.time()
+        scan.ok = ok
+        with self._lock:
+            self._recent.append(scan)
+            recent = list(self._recent)
+        try:
+            self._append_jsonl(scan)
+            self._write_metrics(recent)
+        except OSError as e:
+            logger.warning(f"処理時間の記録の書き出しに失敗しました: {e}")
+
+    def last_scan(self):
+        with self._lock:
+            return self._recent[-1] if self._recent else None
+
+    # --- 書き出し ---
+    def _append_jsonl(self, scan):
+        if not self.spans_path:
+            return
+        os.makedirs(os.path.dirname(self.spans_path) or ".", exist_ok=True)
+        base = {"scan": scan.id, "backend": scan.backend}
+        with scan._lock:
+            lines = [json.dumps({**base, **span.to_dict()}, ensure_ascii=False) for span in scan.spans]
+        with open(self.spans_path, "a", encoding="utf-8") as f:
+            for line in lines:
+                f.write(line + "\n")
+
+    def _write_metrics(self, recent):
+        """バックエンドごとに最後の scan の値を gauge として書き出す (textfile collector 向けに一時ファイル経由で置き換える)"""
+        if not self.metrics_path:
+            return
+        latest = {}
+        for scan in recent:
+            latest[scan.backend] = scan
+
+        out = []
+
+        def metric(name, help_text, samples):
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} gauge")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                out.append(f"{name}{{{label_text}}} {float(value)!r}")
+
+        scans = list(latest.values())
+        metric("scan_duration_seconds", "Wall time of the last scan.",
+               [({"backend": s.backend}, s.seconds) for s in scans])
+        metric("scan_success", "Whether the last scan finished without error.",
+               [({"backend": s.backend}, 1 if s.ok else 0) for s in scans])
+        metric("scan_last_finished_timestamp_seconds", "Unix time the last scan finished.",
+               [({"backend": s.backend}, s.finished_at) for s in scans])
+        metric("scan_phase_seconds", "Total time spent in each phase during the last scan.",
+               [({"backend": s.backend, "phase": r["phase"]}, r["total"]) for s in scans for r in s.summary()])
+        metric("scan_phase_count", "Number of spans of each phase during the last scan.",
+               [({"backend": s.backend, "phase": r["phase"]}, r["count"]) for s in scans for r in s.summary()])
+        metric("scan_phase_max_seconds", "Longest single span of each phase during the last scan.",
+               [({"backend": s.backend, "phase": r["phase"]}, r["max"]) for s in scans for r in s.summary()])
+        metric("scan_facility_seconds", "Time spent on each facility during the last scan.",
+               [({"backend": s.backend, "facility": f}, sec) for s in scans for f, sec in s.by_facility()])
+
+        os.makedirs(os.path.dirname(self.metrics_path) or ".", exist_ok=True)
+        tmp = f"{self.metrics_path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("\n".join(out) + "\n")
+        os.replace(tmp, self.metrics_path)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# プロセス内で共有する記録先 (app.py / src/scraper.py から使用)
+SPANS = SpanRecorder()
@@ -0,0 +1,163 @@
+import os
+import re
+import time
+import sqlite3
+import logging
+import datetime
+import threading
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# --- 設定定数 ---
+STORE_PATH = os.getenv("AVAILABILITY_DB", os.path.join(os.getenv("SCAN_CACHE_DIR", ".cache"), "availability.db"))
+
+DISPLAY_COLUMNS = ['日付', '曜日', '施設名', '室場名', '時間', '状況', 'dt']
+
+_SLOT_START_RE = re.compile(r"(\d{1,2})\s*[:：時]\s*(\d{2})?")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS slots (
+    id         INTEGER PRIMARY KEY,
+    date       TEXT,            -- ISO 形式 (YYYY-MM-DD)。解析できない日付は NULL
+    weekday    TEXT NOT NULL,   -- 月〜日 / 祝 / 不明
+    facility   TEXT NOT NULL,
+    room       TEXT NOT NULL,
+    time_slot  TEXT NOT NULL,   -- 画面表示用の元の時間帯表記
+    slot_start TEXT,            -- 開始時刻を HH:MM に正規化したもの
+    status     TEXT NOT NULL,
+    raw_date   TEXT NOT NULL,
+    scan_id    INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_slots_date       ON slots(date);
+CREATE INDEX IF NOT EXISTS idx_slots_weekday    ON slots(weekday);
+CREATE INDEX IF NOT EXISTS idx_slots_facility   ON slots(facility);
+CREATE INDEX IF NOT EXISTS idx_slots_slot_start ON slots(slot_start);
+CREATE INDEX IF NOT EXISTS idx_slots_status     ON slots(status);
+
+CREATE TABLE IF NOT EXISTS scans (
+    id          INTEGER PRIMARY KEY,
+    finished_at REAL NOT NULL,
+    start_date  TEXT,
+    end_date    TEXT,
+    row_count   INTEGER NOT NULL
+);
+"""
+
+
+def slot_start_key(time_slot):
+    """'9:00-11:00' / '09:00～' / '13時' などから開始時刻 'HH:MM' を取り出す"""
+    m = _SLOT_START_RE.search(str(time_slot or ""))
+    if not m:
+        return None
+    return f"{int(m.group(1)):02d}:{m.group(2) or '00'}"
+
+
+class AvailabilityStore:
+    """
+    スキャン結果を保存するローカル SQLite (WAL モード)。
+    どのセッションからも最新のスキャン結果を参照でき、サイドバーの絞り込みは索引付きのクエリになる。
+    """
+
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+
+    def write_scan(self, df, start_date=None, end_date=None):
+        """
+        enrich_data 済みの DataFrame を保存する。
+        スキャンした期間 (start_date〜end_date) の既存行と、日付不明の行は置き換える。
+        """
+        rows = []
+        for rec in df.to_dict("records") if not df.empty else []:
+            dt = rec.get("dt")
+            if isinstance(dt, datetime.datetime):
+                dt = dt.date()
+            rows.append((
+                dt.isoformat() if isinstance(dt, datetime.date) else None,
+                rec.get("曜日") or "不明",
+                str(rec.get("施設名", "")),
+                str(rec.get("室場名", "")),
+                str(rec.get("時間", "")),
+                slot_start_key(rec.get("時間")),
+                str(rec.get("状況", "")),
+                str(rec.get("日付", "")),
+            ))
+
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "INSERT INTO scans (finished_at, start_date, end_date, row_count) VALUES (?, ?, ?, ?)",
+                (time.time(), _iso(start_date), _iso(end_date), len(rows)),
+            )
+            scan_id = cur.lastrowid
+            if start_date and end_date:
+                self._conn.execute("DELETE FROM slots WHERE date IS NULL OR date BETWEEN ? AND ?",
+                                   (_iso(start_date), _iso(end_date)))
+            else:
+                self._conn.execute("DELETE FROM slots")
+            self._conn.executemany(
+                "INSERT INTO slots (date, weekday, facility, room, time_slot, slot_start, status, raw_date, scan_id) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [r + (scan_id,) for r in rows],
+            )
+        return scan_id
+
+    def query(self, start_date=None, end_date=None, days=None, times=None, statuses=None):
+        """
+        条件に合う行を表示用の列名 (DISPLAY_COLUMNS) の DataFrame で返す。
+        times は開始時刻 ('13:00' など) のリスト。
+        """
+        where, params = [], []
+        if start_date:
+            where.append("date >= ?")
+            params.append(_iso(start_date))
+        if end_date:
+            where.append("date <= ?")
+            params.append(_iso(end_date))
+        for column, values in (("weekday", days), ("slot_start", times), ("status", statuses)):
+            if values:
+                where.append(f"{column} IN ({','.join('?' * len(values))})")
+                params.extend(values)
+
+        sql = "SELECT raw_date, weekday, facility, room, time_slot, status, date FROM slots"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY date, time_slot, facility"
+
+        with self._lock:
+            records = self._conn.execute(sql, params).fetchall()
+        df = pd.DataFrame(records, columns=DISPLAY_COLUMNS)
+        df['dt'] = [datetime.date.fromisoformat(d) if isinstance(d, str) else None for d in df['dt']]
+        return df
+
+    def last_scan(self):
+        """最新スキャンの {id, finished_at, start_date, end_date, row_count}。未スキャンなら None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, finished_at, start_date, end_date, row_count FROM scans ORDER BY id DESC LIMIT 1"
+            ).fetchone()
+        if not row:
+            return None
+        return dict(zip(("id", "finished_at", "start_date", "end_date", "row_count"), row))
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM slots").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _iso(d):
+    if d is None:
+        return None
+    return d.isoformat() if isinstance(d, datetime.date) else str(d)
@@ -0,0 +1,128 @@
+import sys
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def sizeof(value):
+    """キャッシュの容量計算用のおおよそのサイズ [byte]"""
+    memory_usage = getattr(value, "memory_usage", None)
+    if memory_usage is not None:
+        try:
+            return int(memory_usage(index=True, deep=True).sum())
+        except Exception:
+            pass
+    return sys.getsizeof(value)
+
+
+class CacheResult:
+    """get() の戻り値。value と、取得時刻・古いかどうか・裏で更新中かどうか"""
+    __slots__ = ("value", "fetched_at", "stale", "refreshing")
+
+    def __init__(self, value, fetched_at, stale, refreshing):
+        self.value = value
+        self.fetched_at = fetched_at
+        self.stale = stale
+        self.refreshing = refreshing
+
+    @property
+    def age(self):
+        return time.time() - self.fetched_at
+
+
+class _Entry:
+    __slots__ = ("value", "fetched_at", "size", "refreshing")
+
+    def __init__(self, value, fetched_at, size):
+        self.value = value
+        self.fetched_at = fetched_at
+        self.size = size
+        self.refreshing = False
+
+
+class SWRCache:
+    """
+    stale-while-revalidate 方式のキャッシュ。
+
+    - ttl 秒以内のエントリはそのまま返す
+    - ttl を過ぎたエントリも古いまま即座に返し、裏のスレッドで background_loader を実行して差し替える
+    - エントリが無い場合・force=True の場合は loader を同期実行する
+    - 合計サイズが max_bytes を超えたら、最近使われていないものから捨てる
+    """
+
+    def __init__(self, ttl, max_bytes, sizeof=sizeof):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._entries = OrderedDict()
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, loader, background_loader=None, force=False):
+        """
+        loader は画面に進捗を出しながらの同期取得、background_loader は UI に触れない裏での再取得。
+        background_loader を省略した場合は loader を使う。
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not force:
+                self._entries.move_to_end(key)
+                stale = time.time() - entry.fetched_at >= self.ttl
+                if stale and not entry.refreshing:
+                    entry.refreshing = True
+                    threading.Thread(target=self._refresh, args=(key, background_loader or loader),
+                                     daemon=True, name="swr-refresh").start()
+                return CacheResult(entry.value, entry.fetched_at, stale, entry.refreshing)
+
+        value = loader()
+        self.put(key, value)
+        return CacheResult(value, time.time(), False, False)
+
+    def peek(self, key):
+        """取得処理を起こさずに現在のエントリを返す (無ければ None)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stale = time.time() - entry.fetched_at >= self.ttl
+            return CacheResult(entry.value, entry.fetched_at, stale, entry.refreshing)
+
+    def put(self, key, value):
+        size = self._sizeof(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total -= old.size
+            if size > self.max_bytes:
+                logger.info(f"キャッシュ上限を超えるため保存しません: {key} ({size} bytes)")
+                return
+            self._entries[key] = _Entry(value, time.time(), size)
+            self._total += size
+            while self._total > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._total -= evicted.size
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                self._total = 0
+            else:
+                entry = self._entries.pop(key, None)
+                if entry is not None:
+                    self._total -= entry.size
+
+    def _refresh(self, key, loader):
+        try:
+            value = loader()
+        except Exception as e:
+            logger.error(f"バックグラウンド更新に失敗しました ({key}): {e}")
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry.refreshing = False
+            return
+        self.put(key, value)
@@ -0,0 +1,194 @@
+import os
+import logging
+
+from bs4 import BeautifulSoup
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as HTMLParser
+except ImportError:
+    try:  # selectolax < 0.3.13 (Modest バックエンドのみ)
+        from selectolax.parser import HTMLParser
+    except ImportError:
+        HTMLParser = None
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+logger = logging.getLogger(__name__)
+
+# ブラウザ側で空き状況テーブルの候補だけを選び、outerHTML を返すスクリプト。
+# page_source でページ全体を転送・解析する代わりに、1回の往復で必要なテーブルだけを受け取る。
+CANDIDATE_TABLES_SCRIPT = """
+var out = [];
+var tables = document.querySelectorAll('table');
+var symbols = /[○×△空満]/;
+for (var i = 0; i < tables.length; i++) {
+    var t = tables[i];
+    var hit = symbols.test(t.textContent);
+    if (!hit) {
+        var imgs = t.querySelectorAll('img');
+        for (var j = 0; j < imgs.length && !hit; j++) {
+            var alt = imgs[j].getAttribute('alt') || '';
+            var src = imgs[j].getAttribute('src') || '';
+            hit = /[○×△]/.test(alt) || /(circle|cross|triangle)/.test(src);
+        }
+    }
+    if (hit) out.push(t.outerHTML);
+}
+return out;
+"""
+
+
+class Cell:
+    """テーブルのセル1つ分 (テキストと最初の img の alt/src)"""
+    __slots__ = ("text", "img_alt", "img_src")
+
+    def __init__(self, text, img_alt=None, img_src=None):
+        self.text = text
+        self.img_alt = img_alt
+        self.img_src = img_src
+
+    @property
+    def has_img(self):
+        return self.img_alt is not None or self.img_src is not None
+
+
+class Table:
+    """解析済みテーブル。text は textContent 相当、rows は tr ごとの Cell のリスト"""
+    __slots__ = ("text", "rows")
+
+    def __init__(self, text, rows):
+        self.text = text
+        self.rows = rows
+
+    def has_status_img(self):
+        for row in self.rows:
+            for cell in row:
+                if not cell.has_img:
+                    continue
+                if any(s in (cell.img_alt or "") for s in "○×△"):
+                    return True
+                if any(s in (cell.img_src or "") for s in ("circle", "cross", "triangle")):
+                    return True
+        return False
+
+
+# --- エンジン別の実装 ---
+# root_only=True のときは断片の先頭 (最外側) のテーブルだけを返す。
+# ブラウザからはネストしたテーブルも個別の outerHTML として届くため、重複させないため。
+def _parse_bs4(html, root_only):
+    soup = BeautifulSoup(html, "html.parser")
+    tables = []
+    found = soup.find_all("table", limit=1 if root_only else None)
+    for tbl in found:
+        rows = []
+        for tr in tbl.find_all("tr"):
+            cells = []
+            for td in tr.find_all(["th", "td"]):
+                img = td.find("img")
+                cells.append(Cell(td.get_text(strip=True),
+                                  img.get("alt", "") if img else None,
+                                  img.get("src", "") if img else None))
+            rows.append(cells)
+        tables.append(Table(tbl.get_text(), rows))
+    return tables
+
+
+def _parse_lxml(html, root_only):
+    root = lxml.html.fragment_fromstring(html, create_parent="div")
+    tables = []
+    found = list(root.iter("table"))
+    if root_only:
+        found = found[:1]
+    for tbl in found:
+        rows = []
+        for tr in tbl.iter("tr"):
+            cells = []
+            for td in tr.iter("th", "td"):
+                img = next(td.iter("img"), None)
+                cells.append(Cell("".join(s.strip() for s in td.itertext()),
+                                  img.get("alt", "") if img is not None else None,
+                                  img.get("src", "") if img is not None else None))
+            rows.append(cells)
+        tables.append(Table(tbl.text_content(), rows))
+    return tables
+
+
+def _parse_selectolax(html, root_only):
+    tree = HTMLParser(html)
+    tables = []
+    found = tree.css("table")
+    if root_only:
+        found = found[:1]
+    for tbl in found:
+        rows = []
+        for tr in tbl.css("tr"):
+            cells = []
+            for td in tr.css("th, td"):
+                img = td.css_first("img")
+                attrs = img.attributes if img is not None else None
+                cells.append(Cell(td.text(deep=True, separator="", strip=True),
+                                  (attrs.get("alt") or "") if attrs is not None else None,
+                                  (attrs.get("src") or "") if attrs is not None else None))
+            rows.append(cells)
+        tables.append(Table(tbl.text(deep=True), rows))
+    return tables
+
+
+ENGINES = {"bs4": _parse_bs4}
+if lxml is not None:
+    ENGINES["lxml"] = _parse_lxml
+if HTMLParser is not None:
+    ENGINES["selectolax"] = _parse_selectolax
+
+
+def default_engine():
+    """環境変数 HTML_PARSER、なければ selectolax > lxml > bs4 の順で使えるもの"""
+    name = os.getenv("HTML_PARSER")
+    if name:
+        if name in ENGINES:
+            return name
+        logger.warning(f"HTML_PARSER={name} は利用できません。既定のエンジンを使います。")
+    for name in ("selectolax", "lxml", "bs4"):
+        if name in ENGINES:
+            return name
+
+
+ENGINE = default_engine()
+
+
+def parse_tables(html_fragments, engine=None, root_only=True):
+    """
+    テーブルの outerHTML のリストを解析して Table のリストを返す。
+    ページ全体の HTML を渡す場合は root_only=False (全テーブルを返す)。
+    """
+    parse = ENGINES[engine or ENGINE]
+    tables = []
+    for html in html_fragments:
+        if html:
+            tables.extend(parse(html, root_only))
+    return tables
+
+
+def fetch_candidate_fragments(driver):
+    """現在のフレームから空き状況テーブルの候補の outerHTML を1回の execute_script で取り出す"""
+    return driver.execute_script(CANDIDATE_TABLES_SCRIPT) or []
+
+
+def fetch_candidate_tables(driver, engine=None):
+    """現在のフレームから空き状況テーブルの候補を取り出して解析する"""
+    try:
+        fragments = fetch_candidate_fragments(driver)
+    except Exception as e:
+        logger.warning(f"テーブル候補の取得に失敗しました。page_source で代替します: {e}")
+        return parse_tables([driver.page_source], engine, root_only=False)
+    return parse_tables(fragments, engine)
+
+
+def fetch_all_table_fragments(driver):
+    """現在のフレームの全テーブル (月カレンダーを含む) の outerHTML。ページ内容の指紋用"""
+    return driver.execute_script(
+        "return Array.prototype.map.call(document.querySelectorAll('table'), function(t) { return t.outerHTML; });"
+    ) or []
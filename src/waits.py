@@ -0,0 +1,259 @@
+import time
+import logging
+import threading
+from collections import defaultdict, deque
+
+logger = logging.getLogger(__name__)
+
+# --- 設定定数 ---
+DEFAULT_TIMEOUT = 10.0  # 観測値がまだ無いときのタイムアウト [秒]
+MIN_TIMEOUT = 2.0       # 適応後のタイムアウトの下限 [秒]
+QUIET_PERIOD = 0.3      # DOM変更・通信が止まってから「落ち着いた」とみなすまでの時間 [秒]
+POLL_INTERVAL = 0.1     # 状態確認の間隔 [秒]
+HISTORY_SIZE = 50       # ラベルごとに保持する待機時間の件数
+ADAPT_MIN_SAMPLES = 5   # タイムアウトを適応させるのに必要な観測数
+
+# ページ (またはフレーム) に MutationObserver と XHR/fetch の計測フックを仕込み、
+# 現在の状態を1回の往復で返すスクリプト。フックは document ごとに1回だけ入る。
+_PROBE_SCRIPT = """
+var w = window;
+if (!w.__rsWait) {
+    var st = w.__rsWait = {id: Math.random().toString(36).slice(2), inflight: 0, mutations: 0, lastMutation: performance.now()};
+    try {
+        new MutationObserver(function() { st.mutations++; st.lastMutation = performance.now(); })
+            .observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+    } catch (e) {}
+    var origSend = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function() {
+        st.inflight++;
+        this.addEventListener('loadend', function() { st.inflight = Math.max(0, st.inflight - 1); });
+        return origSend.apply(this, arguments);
+    };
+    if (w.fetch) {
+        var origFetch = w.fetch;
+        w.fetch = function() {
+            st.inflight++;
+            return origFetch.apply(this, arguments).finally(function() { st.inflight = Math.max(0, st.inflight - 1); });
+        };
+    }
+}
+var s = w.__rsWait;
+return {
+    id: s.id,
+    ready: document.readyState,
+    inflight: s.inflight,
+    mutations: s.mutations,
+    quietMs: performance.now() - s.lastMutation,
+    resources: performance.getEntriesByType('resource').length
+};
+"""
+
+# 空き状況テーブル群の内容から簡易ハッシュを計算するスクリプト (テーブル変化の検知用)
+_TABLE_SIGNATURE_SCRIPT = """
+var tables = document.querySelectorAll('table');
+var h = 5381;
+for (var i = 0; i < tables.length; i++) {
+    var t = tables[i];
+    var s = t.textContent;
+    var imgs = t.querySelectorAll('img');
+    for (var j = 0; j < imgs.length; j++) s += imgs[j].alt + imgs[j].src;
+    for (var k = 0; k < s.length; k++) h = ((h << 5) + h + s.charCodeAt(k)) | 0;
+    h = ((h << 5) + h + 124) | 0;
+}
+return tables.length + ':' + h;
+"""
+
+
+class WaitEngine:
+    """
+    固定の time.sleep の代わりに、ページの実際の準備完了シグナルを待つ。
+
+    - page_ready: readyState が complete で、通信が止まり、DOM変更が落ち着くまで待つ
+    - action_settled: クリック等の操作の結果 (ページ遷移 or ページ内のDOM変更) が落ち着くまで待つ
+      (操作の直前に document_token で状態を記録して渡す)
+    - dom_settled: DOM変更が QUIET_PERIOD 秒止まるまで待つ (入力欄の変更など)
+    - table_changed: 空き状況テーブルの内容が変わるまで待つ (カレンダークリックなど)
+    - pause: ブラウザと無関係な待機 (リトライ間隔など)
+
+    各待機はラベルごとに実際にかかった時間を記録し、十分な観測が集まると
+    タイムアウトを観測値の p95 の 2 倍 (MIN_TIMEOUT 〜 default_timeout) に縮める。
+    待機がタイムアウトしても例外にはせず False を返す (従来の sleep と同じく処理は続行)。
+    """
+
+    def __init__(self, default_timeout=DEFAULT_TIMEOUT, quiet_period=QUIET_PERIOD,
+                 poll_interval=POLL_INTERVAL):
+        self.default_timeout = default_timeout
+        self.quiet_period = quiet_period
+        self.poll_interval = poll_interval
+        self._history = defaultdict(lambda: deque(maxlen=HISTORY_SIZE))
+        self._timeouts = defaultdict(int)
+        self._lock = threading.Lock()
+
+    # --- 待機API ---
+    def document_token(self, driver):
+        """
+        現在の document の識別子と DOM変更回数。
+        遷移やDOM変更を起こす操作の直前に取得して page_ready / action_settled に渡す
+        """
+        state = self._probe(driver)
+        if state is None:
+            return None
+        return {"id": state.get("id"), "mutations": state.get("mutations", 0)}
+
+    def page_ready(self, driver, label="page", timeout=None, since=None):
+        """
+        ナビゲーション後: 読み込み完了・通信なし・DOM変更なしが揃うまで待つ。
+        since (document_token の戻り値) を渡すと、document が入れ替わるまでは完了とみなさない。
+        """
+        since_id = since.get("id") if since else None
+        last_resources = [None]
+
+        def check():
+            state = self._probe(driver)
+            if state is None:
+                # 遷移で元のフレームが消えた場合はトップに戻って待ち続ける
+                try:
+                    driver.switch_to.default_content()
+                except Exception:
+                    pass
+                return False
+            if since_id is not None and state.get("id") == since_id:
+                return False
+            resources = state.get("resources")
+            stable = resources == last_resources[0]
+            last_resources[0] = resources
+            return (state.get("ready") == "complete"
+                    and state.get("inflight", 0) == 0
+                    and state.get("quietMs", 0) >= self.quiet_period * 1000
+                    and stable)
+
+        return self._wait(label, check, timeout)
+
+    def action_settled(self, driver, since, label="action", timeout=None):
+        """
+        操作後: document が入れ替わって読み込みが終わるか、同じ document 内で
+        DOM変更が起きてから落ち着くまで待つ (SPA 内の画面遷移・アコーディオン展開など)
+        """
+        if since is None:
+            return self.dom_settled(driver, label, timeout)
+
+        def check():
+            state = self._probe(driver)
+            if state is None:
+                try:
+                    driver.switch_to.default_content()
+                except Exception:
+                    pass
+                return False
+            quiet = state.get("inflight", 0) == 0 and state.get("quietMs", 0) >= self.quiet_period * 1000
+            if state.get("id") != since.get("id"):
+                return state.get("ready") == "complete" and quiet
+            return state.get("mutations", 0) > since.get("mutations", 0) and quiet
+
+        return self._wait(label, check, timeout)
+
+    def dom_settled(self, driver, label="dom", timeout=None):
+        """クリック・スクロール後: DOM変更と通信が落ち着くまで待つ"""
+        def check():
+            state = self._probe(driver)
+            if state is None:
+                return False
+            return state.get("inflight", 0) == 0 and state.get("quietMs", 0) >= self.quiet_period * 1000
+
+        return self._wait(label, check, timeout)
+
+    def table_signature(self, driver):
+        """現在のフレーム内のテーブル内容の簡易ハッシュ (table_changed の比較元)"""
+        try:
+            return driver.execute_script(_TABLE_SIGNATURE_SCRIPT)
+        except Exception:
+            return None
+
+    def table_changed(self, driver, before, label="table", timeout=None):
+        """
+        テーブルの内容が before (table_signature の戻り値) から変わり、
+        その後 DOM が落ち着くまで待つ
+        """
+        def check():
+            after = self.table_signature(driver)
+            if after is None or after == before:
+                return False
+            state = self._probe(driver)
+            return state is not None and state.get("quietMs", 0) >= self.quiet_period * 1000
+
+        return self._wait(label, check, timeout)
+
+    def pause(self, seconds, label="pause"):
+        """ブラウザの状態に依存しない待機 (リトライの間隔など)"""
+        started = time.monotonic()
+        time.sleep(seconds)
+        self._record(label, time.monotonic() - started, timed_out=False)
+
+    # --- 観測値 ---
+    def timeout_for(self, label):
+        """ラベルごとの観測値から適応させたタイムアウト [秒]"""
+        with self._lock:
+            samples = sorted(self._history[label])
+        if len(samples) < ADAPT_MIN_SAMPLES:
+            return self.default_timeout
+        p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        return min(self.default_timeout, max(MIN_TIMEOUT, p95 * 2))
+
+    def stats(self):
+        """ラベルごとの {count, timeouts, mean, p95, timeout} を返す"""
+        with self._lock:
+            labels = list(self._history.keys())
+        summary = {}
+        for label in labels:
+            with self._lock:
+                samples = sorted(self._history[label])
+                timeouts = self._timeouts[label]
+            if not samples:
+                continue
+            summary[label] = {
+                "count": len(samples),
+                "timeouts": timeouts,
+                "mean": sum(samples) / len(samples),
+                "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+                "timeout": self.timeout_for(label),
+            }
+        return summary
+
+    # --- 内部処理 ---
+    def _probe(self, driver):
+        try:
+            return driver.execute_script(_PROBE_SCRIPT)
+        except Exception:
+            return None
+
+    def _wait(self, label, check, timeout):
+        if timeout is None:
+            timeout = self.timeout_for(label)
+        started = time.monotonic()
+        deadline = started + timeout
+        ok = False
+        while True:
+            try:
+                ok = bool(check())
+            except Exception:
+                ok = False
+            if ok or time.monotonic() >= deadline:
+                break
+            time.sleep(self.poll_interval)
+        elapsed = time.monotonic() - started
+        self._record(label, elapsed, timed_out=not ok)
+        if not ok:
+            logger.debug(f"待機タイムアウト ({label}): {elapsed:.1f}秒")
+        return ok
+
+    def _record(self, label, elapsed, timed_out):
+        with self._lock:
+            # タイムアウトした待機も打ち切り時間として履歴に入れる。
+            # 縮めすぎたタイムアウトは次の計算で自然に伸びる。
+            self._history[label].append(elapsed)
+            if timed_out:
+                self._timeouts[label] += 1
+
+
+# プロセス内で共有する待機エンジン (app.py / src/scraper.py から使用)
+WAITS = WaitEngine()
@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+
+from src.fingerprints import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+# --- 設定定数 ---
+WORK_QUEUE_PATH = os.getenv("WORK_QUEUE_PATH", os.path.join(CACHE_DIR, "work_queue.db"))
+LEASE_SECONDS = int(os.getenv("WORK_LEASE_SECONDS", "300"))  # これだけ延長のない作業単位は他のワーカーに渡す
+MAX_ATTEMPTS = 3            # この回数失敗 (またはリース切れ) した作業単位は failed にする
+QUEUE_RETENTION = 7 * 24 * 3600  # これより古いスキャンはキューから消す
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    id          TEXT PRIMARY KEY,
+    created_at  REAL NOT NULL,
+    start_date  TEXT,
+    end_date    TEXT,
+    incremental INTEGER NOT NULL DEFAULT 1
+);
+
+CREATE TABLE IF NOT EXISTS units (
+    id          INTEGER PRIMARY KEY,
+    scan_id     TEXT NOT NULL,
+    kind        TEXT NOT NULL,               -- discover (施設の探索) / visit (1施設・1期間の取得)
+    facility    TEXT,
+    target      TEXT,                        -- 詳細ページへの行き方 (Catalog のエントリの JSON)
+    start_date  TEXT,
+    end_date    TEXT,
+    state       TEXT NOT NULL DEFAULT 'pending',  -- pending / leased / done / failed
+    worker      TEXT,
+    lease_until REAL,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    error       TEXT,
+    rows        TEXT,                        -- 取得した行 ({"日付", "施設名", ...} のリストの JSON)
+    updated_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_units_state ON units(state, lease_until);
+CREATE INDEX IF NOT EXISTS idx_units_scan  ON units(scan_id, state);
+"""
+
+_UNIT_COLUMNS = ("id", "scan_id", "kind", "facility", "target", "start_date", "end_date", "attempts")
+
+
+class WorkQueue:
+    """
+    分散スキャンの作業単位を置くローカル SQLite (WAL モード)。
+    同じマシンで同じファイルを開いた複数のプロセスが claim() で作業単位を借り、
+    complete() / fail() で結果を返す。借りている間は renew() でリースを延長し、
+    延長が途絶えた (ワーカーが落ちた) 作業単位は lease_seconds 後に他のワーカーが借り直せる。
+    """
+
+    def __init__(self, path=WORK_QUEUE_PATH, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+
+    # --- コーディネーター側 ---
+    def create_scan(self, start_date=None, end_date=None, incremental=True):
+        """新しいスキャンを登録して ID を返す (古いスキャンはここで消す)"""
+        scan_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        with self._transaction() as conn:
+            old = [row[0] for row in conn.execute("SELECT id FROM scans WHERE created_at < ?", (now - QUEUE_RETENTION,))]
+            conn.executemany("DELETE FROM units WHERE scan_id = ?", [(s,) for s in old])
+            conn.executemany("DELETE FROM scans WHERE id = ?", [(s,) for s in old])
+            conn.execute("INSERT INTO scans (id, created_at, start_date, end_date, incremental) VALUES (?, ?, ?, ?, ?)",
+                         (scan_id, now, _iso(start_date), _iso(end_date), int(bool(incremental))))
+        return scan_id
+
+    def add_units(self, scan_id, units):
+        """
+        作業単位 ({"kind", "facility", "target", "start_date", "end_date"}) を追加する。
+        target は JSON で保存する (visit は施設カタログの行き先、discover は {"window_days": 日数})
+        """
+        with self._transaction() as conn:
+            self._insert_units(conn, scan_id, units)
+
+    def progress(self, scan_id):
+        """状態ごとの作業単位の数 {"pending", "leased", "done", "failed"}"""
+        counts = {"pending": 0, "leased": 0, "done": 0, "failed": 0}
+        with self._lock:
+            for state, n in self._conn.execute(
+                    "SELECT state, COUNT(*) FROM units WHERE scan_id = ? GROUP BY state", (scan_id,)):
+                counts[state] = n
+        return counts
+
+    def finished(self, scan_id):
+        counts = self.progress(scan_id)
+        return counts["pending"] == 0 and counts["leased"] == 0
+
+    def done_units(self, scan_id, seen=()):
+        """完了済みの取得単位のうち seen (id の集合) に無いものを (id, facility, rows) で返す (完了順は id 順と限らない)"""
+        with self._lock:
+            ids = [row[0] for row in self._conn.execute(
+                "SELECT id FROM units WHERE scan_id = ? AND kind = 'visit' AND state = 'done' ORDER BY id", (scan_id,))]
+            out = []
+            for unit_id in ids:
+                if unit_id in seen:
+                    continue
+                facility, rows = self._conn.execute("SELECT facility, rows FROM units WHERE id = ?", (unit_id,)).fetchone()
+                out.append((unit_id, facility, json.loads(rows or "[]")))
+            return out
+
+    def failures(self, scan_id):
+        with self._lock:
+            cur = self._conn.execute(
+                "SELECT kind, facility, start_date, end_date, error FROM units WHERE scan_id = ? AND state = 'failed'",
+                (scan_id,))
+            return [dict(zip(("kind", "facility", "start_date", "end_date", "error"), row)) for row in cur.fetchall()]
+
+    # --- ワーカー側 ---
+    def claim(self, worker, scan_id=None):
+        """
+        借りられる作業単位を1つ借りて dict で返す (無ければ None)。
+        リースが切れたものも対象にし、試行回数が上限に達したものは failed にする。
+        """
+        now = time.time()
+        scope, args = ("AND u.scan_id = ?", (scan_id,)) if scan_id else ("", ())
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE units SET state = 'failed', error = COALESCE(error, 'リースが切れました'), updated_at = ? "
+                "WHERE state = 'leased' AND lease_until < ? AND attempts >= ?", (now, now, self.max_attempts))
+            row = conn.execute(
+                f"SELECT {', '.join('u.' + c for c in _UNIT_COLUMNS)}, s.incremental FROM units u JOIN scans s ON s.id = u.scan_id "
+                f"WHERE (u.state = 'pending' OR (u.state = 'leased' AND u.lease_until < ?)) {scope} "
+                "ORDER BY u.kind = 'discover' DESC, u.id LIMIT 1", (now, *args)).fetchone()
+            if row is None:
+                return None
+            unit = dict(zip(_UNIT_COLUMNS + ("incremental",), row))
+            conn.execute(
+                "UPDATE units SET state = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1, updated_at = ? "
+                "WHERE id = ?", (worker, now + self.lease_seconds, now, unit["id"]))
+        unit["attempts"] += 1
+        unit["target"] = json.loads(unit["target"]) if unit["target"] else None
+        unit["incremental"] = bool(unit["incremental"])
+        return unit
+
+    def renew(self, unit_id, worker):
+        """リースを延長する。既に他のワーカーに渡っていれば False"""
+        now = time.time()
+        with self._transaction() as conn:
+            cur = conn.execute(
+                "UPDATE units SET lease_until = ?, updated_at = ? WHERE id = ? AND worker = ? AND state = 'leased'",
+                (now + self.lease_seconds, now, unit_id, worker))
+            return cur.rowcount == 1
+
+    def complete(self, unit_id, worker, rows=(), new_units=()):
+        """
+        結果を書き込んで作業単位を done にする (探索で見つかった new_units も同じトランザクションで追加)。
+        リースが切れて他のワーカーに渡っていた場合は何もせず False を返す。
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            cur = conn.execute(
+                "UPDATE units SET state = 'done', rows = ?, error = NULL, lease_until = NULL, updated_at = ? "
+                "WHERE id = ? AND worker = ? AND state = 'leased'",
+                (json.dumps(list(rows), ensure_ascii=False), now, unit_id, worker))
+            if cur.rowcount != 1:
+                return False
+            if new_units:
+                scan_id = conn.execute("SELECT scan_id FROM units WHERE id = ?", (unit_id,)).fetchone()[0]
+                self._insert_units(conn, scan_id, new_units)
+        return True
+
+    def fail(self, unit_id, worker, error):
+        """失敗を記録する。試行回数が上限未満なら pending に戻して他のワーカー (または自分) がやり直す"""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE units SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "error = ?, worker = NULL, lease_until = NULL, updated_at = ? "
+                "WHERE id = ? AND worker = ? AND state = 'leased'",
+                (self.max_attempts, str(error)[:500], now, unit_id, worker))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # --- 内部処理 ---
+    def _transaction(self):
+        return _Transaction(self._conn, self._lock)
+
+    def _insert_units(self, conn, scan_id, units):
+        now = time.time()
+        conn.executemany(
+            "INSERT INTO units (scan_id, kind, facility, target, start_date, end_date, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(scan_id, u["kind"], u.get("facility"),
+              json.dumps(u["target"], ensure_ascii=False) if u.get("target") else None,
+              _iso(u.get("start_date")), _iso(u.get("end_date")), now) for u in units])
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE で書き込みロックを先に取る (複数プロセスが同時に同じ作業単位を借りないように)"""
+
+    def __init__(self, conn, lock):
+        self._conn = conn
+        self._lock = lock
+
+    def __enter__(self):
+        self._lock.acquire()
+        try:
+            self._conn.execute("BEGIN IMMEDIATE")
+        except Exception:
+            self._lock.release()
+            raise
+        return self._conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self._conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self._lock.release()
+
+
+def _iso(value):
+    if value is None or isinstance(value, str):
+        return value
+    return value.isoformat()